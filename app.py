@@ -1,18 +1,39 @@
 # -*- coding: utf-8 -*-
-from flask import Flask, request, jsonify, make_response, render_template, redirect
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+from flask import Flask, Response, request, jsonify, make_response, render_template, redirect, session, has_request_context, g
 from flask_cors import CORS
-import requests
 import os
 from dotenv import load_dotenv
 import json
-from datetime import datetime
+import re
+from datetime import datetime, timedelta, timezone
 import secrets
 import logging
 import sys
 import traceback
-from logging.handlers import RotatingFileHandler
-from supabase.client import create_client, Client
+from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler, QueueHandler, QueueListener
+from prometheus_client import Counter, Histogram, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST, REGISTRY
+from prometheus_client import multiprocess
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import queue
+import threading
+import atexit
+import hashlib
+import random
+import gzip
+import shutil
+import itertools
+import mimetypes
+import cProfile
+import tracemalloc
+import contextvars
+import ipaddress
+import math
+from collections import OrderedDict
+from tls import ReloadingTLSContext, tls_stats
 
 class EmojiFormatter(logging.Formatter):
     """Formateur personnalisé pour ajouter des emojis aux logs"""
@@ -22,8 +43,83 @@ class EmojiFormatter(logging.Formatter):
             record.emoji = '🔵'
         return super().format(record)
 
+class JsonLinesFormatter(logging.Formatter):
+    """Formateur JSON-lines: un objet JSON par ligne"""
+    def format(self, record):
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created).isoformat(),
+            'level': record.levelname,
+            'emoji': getattr(record, 'emoji', '🔵'),
+            'message': record.getMessage().strip(),
+            'thread': record.threadName
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler qui laisse le formatage au thread d'écoute"""
+    def prepare(self, record):
+        # Le QueueHandler standard formate le message ici, sur le thread de la requête
+        return record
+
+class LazyMessage:
+    """Message construit seulement au moment du formatage"""
+    __slots__ = ('builder',)
+
+    def __init__(self, builder):
+        self.builder = builder
+
+    def __str__(self):
+        return str(self.builder())
+
+def _gzip_rotator(source, dest):
+    """Compresser le fichier journal tourné (exécuté par le thread d'écoute)"""
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+def _build_file_handler(path):
+    """Créer le handler fichier avec rotation par taille ou par date"""
+    rotation = os.getenv('LOG_ROTATION', 'size').lower()
+    backup_count = int(os.getenv('LOG_BACKUP_COUNT', 10))
+    if rotation == 'time':
+        handler = TimedRotatingFileHandler(
+            path,
+            when=os.getenv('LOG_ROTATION_WHEN', 'midnight'),
+            backupCount=backup_count,
+            encoding='utf-8'
+        )
+    else:
+        handler = RotatingFileHandler(
+            path,
+            maxBytes=int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024)),
+            backupCount=backup_count,
+            encoding='utf-8'
+        )
+    if os.getenv('LOG_COMPRESS', 'True').lower() == 'true':
+        handler.namer = lambda name: name + '.gz'
+        handler.rotator = _gzip_rotator
+    return handler
+
+_log_listener = None
+_log_pid = None
+_log_setup_lock = threading.Lock()
+
+def stop_logging():
+    """Vider la file de logs et arrêter le thread d'écoute"""
+    global _log_listener
+    # Après un fork, le thread d'écoute hérité n'existe pas dans ce processus
+    if _log_listener is not None and _log_pid == os.getpid():
+        _log_listener.stop()
+    _log_listener = None
+
+atexit.register(stop_logging)
+
 def setup_logging(debug_mode):
     """Configure le système de logging"""
+    global _log_listener
+    
     # Créer le dossier logs s'il n'existe pas
     if not os.path.exists('logs'):
         os.makedirs('logs')
@@ -36,14 +132,6 @@ def setup_logging(debug_mode):
     # Niveau de log basé sur le mode debug
     log_level = logging.DEBUG if debug_mode else logging.INFO
     
-    # Configuration du logger principal
-    logging.basicConfig(
-        level=log_level,
-        format=log_format,
-        datefmt=date_format,
-        encoding='utf-8'
-    )
-    
     # Logger pour la console avec des emojis
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(log_level)
@@ -52,54 +140,323 @@ def setup_logging(debug_mode):
         datefmt=date_format
     ))
     
-    # Logger pour le fichier
-    file_handler = RotatingFileHandler(
-        'logs/tiktok_api.log',
-        maxBytes=1024 * 1024,  # 1 MB
-        backupCount=5,
-        encoding='utf-8'
-    )
+    # Logger pour le fichier (JSON-lines optionnel)
+    if os.getenv('LOG_JSON', 'False').lower() == 'true':
+        file_handler = _build_file_handler('logs/tiktok_api.jsonl')
+        file_handler.setFormatter(JsonLinesFormatter())
+    else:
+        file_handler = _build_file_handler('logs/tiktok_api.log')
+        file_handler.setFormatter(logging.Formatter(log_format, datefmt=date_format))
     file_handler.setLevel(log_level)
-    file_handler.setFormatter(logging.Formatter(log_format))
     
     # Obtenir le logger principal
     logger = logging.getLogger()
+    logger.setLevel(log_level)
     
     # Supprimer les handlers existants
+    stop_logging()
     logger.handlers.clear()
     
-    # Ajouter les nouveaux handlers
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    # Les requêtes ne font que déposer l'enregistrement dans la file;
+    # formatage, écriture et rotation se font sur le thread d'écoute
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    _log_listener = QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+    _log_listener.start()
     
     return logger
 
+def ensure_logging():
+    """Configurer les logs au premier usage, une fois par processus (après fork pour les workers)"""
+    global _log_pid
+    if _log_pid == os.getpid():
+        return
+    with _log_setup_lock:
+        if _log_pid != os.getpid():
+            setup_logging(debug_mode)
+            _log_pid = os.getpid()
+            log_rate_limiter.start_flusher()
+
 # Charger les variables d'environnement
 load_dotenv()
 debug_mode = os.getenv('DEBUG', 'False').lower() == 'true'
-logger = setup_logging(debug_mode)
+logger = logging.getLogger()
+
+_LOG_LEVELS = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+    'critical': logging.CRITICAL
+}
+
+def parse_log_rate_limits(spec):
+    """Analyser 'clé=N/intervalle[:M],...' (clé = endpoint Flask ou emoji)"""
+    rules = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        try:
+            key, rule = item.split('=', 1)
+            limit, _, sample = rule.partition(':')
+            burst, interval = limit.split('/')
+            rules[key.strip()] = (int(burst), float(interval), int(sample or 0))
+        except ValueError:
+            logger.warning(f"Règle de limitation de logs invalide ignorée: {item}")
+    return rules
+
+class LogRateLimiter:
+    """Limitation par site d'appel: les N premiers messages par intervalle, puis 1 sur M
+
+    Les suppressions d'une fenêtre close sont signalées au message suivant du même site,
+    ou par le thread de vidage (start_flusher) si le site s'est tu entre-temps.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.suppressed_total = 0
+        self._sites = {}
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+
+    def rule_for(self, emoji):
+        """Règle applicable: celle de la route courante, sinon celle de l'emoji"""
+        if has_request_context() and request.endpoint in self.rules:
+            return self.rules[request.endpoint]
+        return self.rules.get(emoji)
+
+    def allow(self, site, rule):
+        """Retourne (autorisé, rapport) où rapport = (supprimés, durée) de la fenêtre close"""
+        burst, interval, sample_every = rule
+        now = time.monotonic()
+        report = None
+        with self._lock:
+            state = self._sites.get(site)
+            if state is None or now - state[0] >= interval:
+                if state is not None and state[2]:
+                    report = (state[2], now - state[0])
+                state = self._sites[site] = [now, 0, 0, interval]
+            state[1] += 1
+            over = state[1] - burst
+            allowed = over <= 0 or (sample_every > 0 and over % sample_every == 0)
+            if not allowed:
+                state[2] += 1
+                self.suppressed_total += 1
+        return allowed, report
+
+    def flush_expired(self):
+        """Signaler les suppressions des fenêtres closes (rafale suivie de silence)"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [(site, state[2], now - state[0]) for site, state in self._sites.items()
+                       if state[2] and now - state[0] >= state[3]]
+            for site, _, _ in expired:
+                del self._sites[site]
+        for site, count, elapsed in expired:
+            logger.warning(f"{count} message(s) supprimé(s) en {elapsed:.0f}s ({site})",
+                           extra={'emoji': '🔇'})
+
+    def start_flusher(self):
+        """Vider les compteurs toutes les plus courtes fenêtres configurées (un thread par processus)"""
+        if not self.rules or self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        period = max(1.0, min(interval for _, interval, _ in self.rules.values()))
+
+        def run():
+            while True:
+                time.sleep(period)
+                try:
+                    self.flush_expired()
+                except Exception:
+                    pass
+
+        threading.Thread(target=run, name='log-rate-flusher', daemon=True).start()
+
+    def flush(self):
+        """Signaler les messages supprimés encore non rapportés"""
+        with self._lock:
+            pending = [(site, state[2]) for site, state in self._sites.items() if state[2]]
+            for site, _ in pending:
+                self._sites[site][2] = 0
+        for site, count in pending:
+            logger.warning(f"{count} message(s) supprimé(s) par la limitation de logs ({site})",
+                           extra={'emoji': '🔇'})
+
+    def stats(self):
+        with self._lock:
+            return {
+                'suppressed_total': self.suppressed_total,
+                'suppressed_pending': {site: state[2] for site, state in self._sites.items() if state[2]}
+            }
+
+log_rate_limiter = LogRateLimiter(parse_log_rate_limits(
+    os.getenv('LOG_RATE_LIMITS', 'health_check=1/60,home=10/60,💥=20/10:100')
+))
+atexit.register(log_rate_limiter.flush)
 
 def log(message, level='info', emoji='ℹ️'):
-    """Fonction utilitaire pour les logs avec emojis"""
-    logger = logging.getLogger()
-    log_method = getattr(logger, level.lower(), logger.info)
-    log_method(message, extra={'emoji': emoji})
+    """Fonction utilitaire pour les logs avec emojis
+
+    message peut être un callable (ex: lambda) évalué seulement si le niveau est actif.
+    Les sites d'appel bruyants sont limités selon LOG_RATE_LIMITS.
+    """
+    if _log_pid != os.getpid():
+        ensure_logging()
+    levelno = _LOG_LEVELS.get(level.lower(), logging.INFO)
+    if not logger.isEnabledFor(levelno):
+        return
+    rule = log_rate_limiter.rule_for(emoji)
+    if rule is not None:
+        frame = sys._getframe(1)
+        site = f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno}"
+        allowed, report = log_rate_limiter.allow(site, rule)
+        if report:
+            logger.warning(f"{report[0]} message(s) supprimé(s) en {report[1]:.0f}s ({site})",
+                           extra={'emoji': '🔇'})
+        if not allowed:
+            return
+    if callable(message):
+        message = LazyMessage(message)
+    logger.log(levelno, message, extra={'emoji': emoji})
 
-log("🔧 Démarrage de l'application")
+def mask_secrets(data):
+    """Copie d'un dictionnaire avec secrets et tokens masqués (pour les logs)"""
+    masked = dict(data)
+    for key in ('access_token', 'refresh_token'):
+        if masked.get(key):
+            masked[key] = masked[key][:10] + '...'
+    if 'client_secret' in masked:
+        masked['client_secret'] = '***'
+    return masked
 
 app = Flask(__name__)
 CORS(app)
 
+# Session signée (cookie) liée à l'open_id de l'utilisateur connecté
+FLASK_SECRET_KEY = os.getenv('FLASK_SECRET_KEY')
+EPHEMERAL_SECRET_KEY = not FLASK_SECRET_KEY
+if EPHEMERAL_SECRET_KEY:
+    FLASK_SECRET_KEY = secrets.token_hex(32)
+app.config.update(
+    SECRET_KEY=FLASK_SECRET_KEY,
+    SESSION_COOKIE_SECURE=True,
+    SESSION_COOKIE_HTTPONLY=True,
+    SESSION_COOKIE_SAMESITE='Lax',
+    PERMANENT_SESSION_LIFETIME=timedelta(days=int(os.getenv('SESSION_LIFETIME_DAYS', 30)))
+)
+
 # Configuration Supabase
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 
 # Configuration TikTok API
 TIKTOK_AUTH_URL = "https://www.tiktok.com/v2/auth/authorize/"
-TIKTOK_API_URL = "https://open.tiktokapis.com/v2/oauth/token/"
+TIKTOK_API_BASE_URL = os.getenv('TIKTOK_API_BASE_URL', "https://open.tiktokapis.com")
+TIKTOK_API_URL = f"{TIKTOK_API_BASE_URL}/v2/oauth/token/"
 TIKTOK_CLIENT_KEY = os.getenv('TIKTOK_CLIENT_KEY', 'sbawsypybjjzimm3xs')
 TIKTOK_CLIENT_SECRET = os.getenv('TIKTOK_CLIENT_SECRET', 'oVlOlWrR1LvLkhN3tfKPxnosTOoTvc9m')
 TIKTOK_REDIRECT_URI = os.getenv('TIKTOK_REDIRECT_URI', 'https://141.253.120.227:3000/webhook')
+TIKTOK_CREATOR_INFO_URL = f"{TIKTOK_API_BASE_URL}/v2/post/publish/creator_info/query/"
+TIKTOK_USER_INFO_URL = f"{TIKTOK_API_BASE_URL}/v2/user/info/"
+
+# Configuration du client HTTP partagé (pool keep-alive vers open.tiktokapis.com)
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 10))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 10))
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 2))
+HTTP_RETRY_BACKOFF = float(os.getenv('HTTP_RETRY_BACKOFF', 0.3))
+HTTP_WARMUP = os.getenv('HTTP_WARMUP', 'False').lower() == 'true'
+HTTP_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+# Configuration du pipeline post-login asynchrone
+POST_LOGIN_ASYNC = os.getenv('POST_LOGIN_ASYNC', 'False').lower() == 'true'
+POST_LOGIN_WORKERS = int(os.getenv('POST_LOGIN_WORKERS', 2))
+POST_LOGIN_QUEUE_SIZE = int(os.getenv('POST_LOGIN_QUEUE_SIZE', 100))
+POST_LOGIN_ENQUEUE_TIMEOUT = float(os.getenv('POST_LOGIN_ENQUEUE_TIMEOUT', 1.0))
+POST_LOGIN_DRAIN_TIMEOUT = float(os.getenv('POST_LOGIN_DRAIN_TIMEOUT', 15))
+
+# Appels amont indépendants exécutés en parallèle avec une échéance commune
+UPSTREAM_WORKERS = int(os.getenv('UPSTREAM_WORKERS', 16))
+UPSTREAM_STEP_DEADLINE = float(os.getenv('UPSTREAM_STEP_DEADLINE', 5))
+
+# Fonction Postgres d'upsert atomique (voir migrations/001_save_tiktok_token.sql), vide pour désactiver
+TOKEN_UPSERT_RPC = os.getenv('TOKEN_UPSERT_RPC', 'save_tiktok_token')
+
+# Sonde de disponibilité: méthode de comptage PostgREST (exact, planned, estimated) et TTL du cache
+HEALTH_COUNT_METHOD = os.getenv('HEALTH_COUNT_METHOD', 'estimated')
+HEALTH_CACHE_TTL = float(os.getenv('HEALTH_CACHE_TTL', 5))
+
+# Cache en mémoire des profils (/user/profile)
+PROFILE_CACHE_TTL = float(os.getenv('PROFILE_CACHE_TTL', 30))
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', 1024))
+
+# Planificateur de rafraîchissement des access tokens (voir migrations/002_token_refresh.sql)
+TOKEN_REFRESH_ENABLED = os.getenv('TOKEN_REFRESH_ENABLED', 'False').lower() == 'true'
+TOKEN_REFRESH_INTERVAL = float(os.getenv('TOKEN_REFRESH_INTERVAL', 300))
+TOKEN_REFRESH_JITTER = float(os.getenv('TOKEN_REFRESH_JITTER', 0.2))
+TOKEN_REFRESH_MARGIN = int(os.getenv('TOKEN_REFRESH_MARGIN', 3600))
+TOKEN_REFRESH_BATCH_SIZE = int(os.getenv('TOKEN_REFRESH_BATCH_SIZE', 50))
+TOKEN_REFRESH_CONCURRENCY = int(os.getenv('TOKEN_REFRESH_CONCURRENCY', 4))
+TOKEN_REFRESH_RPC = os.getenv('TOKEN_REFRESH_RPC', 'refresh_tiktok_tokens')
+
+# Re-synchronisation des champs créateur des tokens actifs (sync_creators.py ou planifiée)
+CREATOR_SYNC_ENABLED = os.getenv('CREATOR_SYNC_ENABLED', 'False').lower() == 'true'
+CREATOR_SYNC_INTERVAL = float(os.getenv('CREATOR_SYNC_INTERVAL', 86400))
+CREATOR_SYNC_BATCH_SIZE = int(os.getenv('CREATOR_SYNC_BATCH_SIZE', 200))
+CREATOR_SYNC_CONCURRENCY = int(os.getenv('CREATOR_SYNC_CONCURRENCY', 4))
+CREATOR_SYNC_RATE = float(os.getenv('CREATOR_SYNC_RATE', 5))
+CREATOR_SYNC_RPC = os.getenv('CREATOR_SYNC_RPC', 'sync_creator_info')
+CREATOR_SYNC_CHECKPOINT = os.getenv('CREATOR_SYNC_CHECKPOINT', 'logs/creator_sync.json')
+
+# Détail du temps par requête (en-tête Server-Timing) et profilage échantillonné
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING', 'False').lower() == 'true'
+PROFILE_SAMPLE_RATE = int(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_HEADER_TOKEN = os.getenv('PROFILE_HEADER_TOKEN', '')
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'logs/profiles')
+
+# Disjoncteurs par dépendance et budget de temps par requête
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 5))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', 30))
+REQUEST_BUDGET = float(os.getenv('REQUEST_BUDGET', 8))
+CREATOR_INFO_MIN_BUDGET = float(os.getenv('CREATOR_INFO_MIN_BUDGET', 2))
+SUPABASE_TIMEOUT = float(os.getenv('SUPABASE_TIMEOUT', 5))
+
+# Stockage des tokens: API REST Supabase (défaut) ou connexion Postgres directe
+TOKEN_STORE = os.getenv('TOKEN_STORE', 'supabase').lower()
+DATABASE_URL = os.getenv('DATABASE_URL')
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 10))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 5))
+DB_STATEMENT_TIMEOUT = float(os.getenv('DB_STATEMENT_TIMEOUT', SUPABASE_TIMEOUT))
+
+# Notification de fin d'authentification (Server-Sent Events par state OAuth)
+AUTH_EVENTS_DIR = os.getenv('AUTH_EVENTS_DIR', 'logs/auth_events')
+AUTH_EVENTS_TTL = int(os.getenv('AUTH_EVENTS_TTL', 300))
+AUTH_STREAM_TIMEOUT = float(os.getenv('AUTH_STREAM_TIMEOUT', 120))
+AUTH_STREAM_HEARTBEAT = float(os.getenv('AUTH_STREAM_HEARTBEAT', 15))
+AUTH_STREAM_MAX = int(os.getenv('AUTH_STREAM_MAX', 64))
+# Côté WSGI, une connexion SSE tient un thread: elle est coupée après AUTH_STREAM_POLL secondes
+# et le navigateur se reconnecte (long-poll), sans dépasser AUTH_STREAM_TIMEOUT au total
+AUTH_STREAM_POLL = float(os.getenv('AUTH_STREAM_POLL', 5))
+AUTH_STREAM_RETRY_MS = int(os.getenv('AUTH_STREAM_RETRY_MS', 1000))
+AUTH_EVENTS_POLL = float(os.getenv('AUTH_EVENTS_POLL', 0.25))
+
+# Idempotence de /webhook: codes d'autorisation déjà reçus (doubles clics, rechargements)
+WEBHOOK_DEDUP_TTL = int(os.getenv('WEBHOOK_DEDUP_TTL', 600))
+WEBHOOK_DEDUP_SIZE = int(os.getenv('WEBHOOK_DEDUP_SIZE', 4096))
+WEBHOOK_DEDUP_SHARED = os.getenv('WEBHOOK_DEDUP_SHARED', 'False').lower() == 'true'
+WEBHOOK_DEDUP_POLL = float(os.getenv('WEBHOOK_DEDUP_POLL', 0.25))
+# States /oauth mémorisés dans la session signée: seul ce navigateur peut rejouer leur code
+OAUTH_STATES_MAX = int(os.getenv('OAUTH_STATES_MAX', 5))
+
+# Admission sur /oauth et /webhook: seaux à jetons par IP et global, plafond d'échanges en vol
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+RATE_LIMIT_IP_RATE = float(os.getenv('RATE_LIMIT_IP_RATE', 0.5))
+RATE_LIMIT_IP_BURST = float(os.getenv('RATE_LIMIT_IP_BURST', 10))
+RATE_LIMIT_GLOBAL_RATE = float(os.getenv('RATE_LIMIT_GLOBAL_RATE', 50))
+RATE_LIMIT_GLOBAL_BURST = float(os.getenv('RATE_LIMIT_GLOBAL_BURST', 100))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv('RATE_LIMIT_MAX_CLIENTS', 10000))
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv('RATE_LIMIT_TRUSTED_PROXIES', 0))
+UPSTREAM_MAX_INFLIGHT = int(os.getenv('UPSTREAM_MAX_INFLIGHT', 32))
 
 # Vérification des variables d'environnement obligatoires
 required_env_vars = {
@@ -110,37 +467,416 @@ required_env_vars = {
     'TIKTOK_REDIRECT_URI': TIKTOK_REDIRECT_URI
 }
 
-missing_vars = [var for var, value in required_env_vars.items() if not value]
-if missing_vars:
-    log(f"❌ Erreur: Variables d'environnement manquantes: {', '.join(missing_vars)}", "error", "💥")
-    log("ℹ️ Assurez-vous d'avoir créé un fichier .env à partir de env_example.txt", "info", "💡")
-    sys.exit(1)
+if TOKEN_STORE == 'postgres':
+    required_env_vars['DATABASE_URL'] = DATABASE_URL
+
+def missing_config():
+    """Variables d'environnement obligatoires non définies"""
+    return [var for var, value in required_env_vars.items() if not value]
+
+# Durées de démarrage du processus (import, create_app, première requête, clients)
+startup_timings = {'lazy_init_ms': {}}
+
+class LazyResource:
+    """Client créé au premier usage, une fois par processus (recréé après fork)
+
+    Les attributs sont délégués au client: `supabase.table(...)` fonctionne tel quel.
+    """
+
+    def __init__(self, name, factory):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_value', None)
+        object.__setattr__(self, '_pid', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def resolve(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    started = time.perf_counter()
+                    object.__setattr__(self, '_value', self._factory())
+                    object.__setattr__(self, '_pid', os.getpid())
+                    elapsed = round((time.perf_counter() - started) * 1000, 1)
+                    startup_timings['lazy_init_ms'][self._name] = elapsed
+                    log(f"🧩 {self._name} initialisé en {elapsed} ms", "debug", "🔍")
+        return self._value
+
+    def is_initialized(self):
+        return self._pid == os.getpid()
+
+    def __getattr__(self, attribute):
+        return getattr(self.resolve(), attribute)
+
+def bound_postgrest_timeout(request):
+    """Hook httpx: borner le timeout d'un appel PostgREST par le budget restant de la requête"""
+    remaining = remaining_budget()
+    if remaining is None:
+        return
+    if remaining <= 0:
+        raise DeadlineExceeded("Budget de la requête épuisé")
+    timeout = min(SUPABASE_TIMEOUT, remaining)
+    request.extensions['timeout'] = {'connect': timeout, 'read': timeout, 'write': timeout, 'pool': timeout}
+
+def create_supabase_client():
+    """Créer le client Supabase (import différé: supabase est long à importer)"""
+    from supabase.client import create_client, ClientOptions
+    client = create_client(SUPABASE_URL, SUPABASE_KEY,
+                           options=ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT))
+    # Exécuté dans le thread appelant, juste avant l'envoi: l'échéance de la requête y est visible
+    client.postgrest.session.event_hooks['request'].append(bound_postgrest_timeout)
+    return client
+
+supabase = LazyResource('supabase', create_supabase_client)
+
+# POST idempotents (lecture seule côté TikTok), retentés comme des GET
+IDEMPOTENT_POST_URLS = (TIKTOK_CREATOR_INFO_URL,)
+
+def http_retry(attempts=None, methods=('GET', 'HEAD')):
+    """Politique de retry des appels TikTok
+
+    Les erreurs de connexion (requête jamais envoyée) sont retentées pour toutes les
+    méthodes; les timeouts de lecture et les 429/5xx seulement pour `methods`. Les POST
+    oauth/token consomment un code ou un refresh_token à usage unique: les rejouer
+    après une réponse perdue vaut invalid_grant. Retry-After n'est pas suivi (attente
+    non bornée côté serveur), seul le backoff exponentiel s'applique.
+    
+    Sous échéance de requête (request_deadline), un nouvel essai n'a lieu que si le
+    budget restant dépasse le backoff à venir.
+    """
+    from urllib3.util.retry import Retry
+    
+    class BudgetRetry(Retry):
+        def is_exhausted(self):
+            remaining = remaining_budget()
+            if remaining is not None and remaining <= self.get_backoff_time():
+                return True
+            return super().is_exhausted()
+    
+    attempts = HTTP_MAX_RETRIES if attempts is None else attempts
+    return BudgetRetry(
+        total=attempts,
+        connect=attempts,
+        read=attempts,
+        status=attempts,
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(methods),
+        respect_retry_after_header=False,
+        raise_on_status=False
+    )
+
+def create_http_session():
+    """Créer la session HTTP partagée avec pool de connexions et retries bornés"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    
+    retry = http_retry()
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=retry,
+        pool_block=False
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # Préfixe le plus long prioritaire: ces URL retentent aussi leurs POST sur 429/5xx
+    idempotent_adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=http_retry(methods=('GET', 'HEAD', 'POST')),
+        pool_block=False
+    )
+    for url in IDEMPOTENT_POST_URLS:
+        session.mount(url, idempotent_adapter)
+    return session
+
+http_session = LazyResource('http_session', create_http_session)
+upstream_executor = LazyResource('upstream_executor', lambda: ThreadPoolExecutor(
+    max_workers=UPSTREAM_WORKERS, thread_name_prefix='upstream'))
+
+class CircuitOpenError(Exception):
+    """Appel refusé: le disjoncteur de la dépendance est ouvert"""
+
+class DeadlineExceeded(Exception):
+    """Le budget de temps de la requête est épuisé"""
+
+class CircuitBreaker:
+    """Disjoncteur: s'ouvre après N échecs consécutifs, laisse passer une sonde après reset_timeout"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Lever CircuitOpenError si l'appel doit échouer immédiatement; True si l'appel est la sonde"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return False
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                # Une seule sonde à la fois pour tester le rétablissement
+                self._probe_in_flight = True
+                return True
+        raise CircuitOpenError(f"Disjoncteur {self.name} ouvert")
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                log(f"🟢 Disjoncteur {self.name} refermé", "info", "🟢")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """Sonde terminée sans verdict (budget épuisé): laisser passer la suivante, sans changer d'état"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    log(f"🔴 Disjoncteur {self.name} ouvert après {self.failures} échec(s)", "warning", "🔴")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'open_for_s': round(time.monotonic() - self.opened_at, 1) if self.state == self.OPEN else None
+            }
+
+circuit_breakers = {
+    'tiktok': CircuitBreaker('tiktok', BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT),
+    'supabase': CircuitBreaker('supabase', BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+}
+
+# Échéance (time.monotonic) de la requête courante, propagée aux tâches du pool amont
+request_deadline = contextvars.ContextVar('request_deadline', default=None)
 
-log(f"📊 Configuration Supabase: URL={SUPABASE_URL}")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+def remaining_budget():
+    """Secondes restantes dans le budget de la requête (None hors requête)"""
+    deadline = request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
 
-log(f"📊 Configuration Supabase: URL={SUPABASE_URL}")
+def budget_timeout():
+    """Timeout HTTP (connexion, lecture) borné par le budget restant"""
+    remaining = remaining_budget()
+    if remaining is None:
+        return HTTP_TIMEOUT
+    if remaining <= 0:
+        raise DeadlineExceeded("Budget de la requête épuisé")
+    return (min(HTTP_CONNECT_TIMEOUT, remaining), min(HTTP_READ_TIMEOUT, remaining))
+
+# Métriques Prometheus (agrégées entre workers si PROMETHEUS_MULTIPROC_DIR est défini)
+HTTP_REQUESTS = Counter(
+    'tiktok_api_http_requests_total', 'Requêtes HTTP reçues',
+    ['route', 'method', 'status']
+)
+HTTP_LATENCY = Histogram(
+    'tiktok_api_http_request_duration_seconds', 'Latence des requêtes HTTP reçues',
+    ['route', 'method', 'status']
+)
+UPSTREAM_LATENCY = Histogram(
+    'tiktok_api_upstream_duration_seconds', 'Latence des appels amont (TikTok, Supabase)',
+    ['dependency', 'operation']
+)
+UPSTREAM_ERRORS = Counter(
+    'tiktok_api_upstream_errors_total', 'Erreurs des appels amont par type',
+    ['dependency', 'operation', 'error_type']
+)
+REQUESTS_REJECTED = Counter(
+    'tiktok_api_requests_rejected_total', "Requêtes refusées par le contrôle d'admission",
+    ['route', 'reason']
+)
 
 @contextmanager
-def get_db_connection():
-    """Gestionnaire de contexte pour la connexion à la base de données"""
-    conn = None
+def track_upstream(dependency, operation):
+    """Mesurer la latence d'un appel amont et compter ses erreurs par type"""
+    start = time.perf_counter()
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            cursor_factory=RealDictCursor
-        )
-        yield conn
+        yield
     except Exception as e:
-        log(f"❌ Erreur de connexion à la base de données: {e}", "error", "💥")
+        UPSTREAM_ERRORS.labels(dependency, operation, type(e).__name__).inc()
+        raise
+    finally:
+        UPSTREAM_LATENCY.labels(dependency, operation).observe(time.perf_counter() - start)
+
+def request_timings():
+    """Spans de la requête courante, ou None si Server-Timing est désactivé"""
+    if not SERVER_TIMING_ENABLED or not has_request_context():
+        return None
+    return g.setdefault('timings', [])
+
+@contextmanager
+def timing_span(name, timings=None):
+    """Mesurer un span nommé; timings permet d'enregistrer depuis un autre thread"""
+    if timings is None:
+        timings = request_timings()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.append((name, (time.perf_counter() - start) * 1000))
+
+def run_timed(name, timings, func, *args):
+    """Exécuter func dans un span (utilisé pour les tâches du pool amont)"""
+    with timing_span(name, timings):
+        return func(*args)
+
+@contextmanager
+def upstream_guard(dependency, operation):
+    """Disjoncteur, budget et métriques autour d'un appel amont (bloc synchrone ou avec await)
+
+    Le bloc renseigne call['status'] avec le code HTTP obtenu, s'il y en a un.
+    """
+    breaker = circuit_breakers[dependency]
+    try:
+        remaining = remaining_budget()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded("Budget de la requête épuisé")
+        probe = breaker.before_call()
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        UPSTREAM_ERRORS.labels(dependency, operation, type(e).__name__).inc()
         raise
+    call = {'status': None}
+    recorded = False
+    try:
+        try:
+            with track_upstream(dependency, operation):
+                yield call
+        except DeadlineExceeded:
+            raise
+        except Exception:
+            recorded = True
+            breaker.record_failure()
+            raise
+        status = call['status']
+        if status is not None and status >= 400:
+            UPSTREAM_ERRORS.labels(dependency, operation, f'http_{status}').inc()
+        # Seuls 429 et 5xx indiquent une dépendance en difficulté
+        recorded = True
+        if status is not None and (status == 429 or status >= 500):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
     finally:
-        if conn is not None:
-            conn.close()
+        # Une sonde interrompue (budget épuisé, BaseException) ne doit pas bloquer le disjoncteur en half_open
+        if probe and not recorded:
+            breaker.release_probe()
+
+def guarded_call(dependency, operation, func):
+    """Appel amont protégé par le disjoncteur et le budget, instrumenté"""
+    with upstream_guard(dependency, operation) as call:
+        result = func()
+        call['status'] = getattr(result, 'status_code', None)
+    return result
+
+def tiktok_request(operation, method, url, **kwargs):
+    """Appel à l'API TikTok via la session partagée"""
+    return guarded_call('tiktok', operation,
+                        lambda: http_session.request(method, url, timeout=budget_timeout(), **kwargs))
+
+def db_execute(operation, query):
+    """Exécuter une requête PostgREST"""
+    return guarded_call('supabase', operation, query.execute)
+
+def submit_upstream(name, timings, func, *args):
+    """Soumettre une tâche au pool amont en propageant l'échéance de la requête"""
+    context = contextvars.copy_context()
+    return upstream_executor.submit(context.run, run_timed, name, timings, func, *args)
+
+def warmup_http_pool(connections=None):
+    """Ouvrir les connexions du pool avant l'arrivée de la première requête"""
+    connections = connections or HTTP_POOL_SIZE
+    log(f"🔥 Préchauffage du pool HTTP ({connections} connexions vers {TIKTOK_API_BASE_URL})...")
+
+    def _open_connection(_):
+        try:
+            http_session.head(TIKTOK_API_BASE_URL, timeout=HTTP_TIMEOUT)
+            return True
+        except Exception as e:
+            log(f"⚠️ Échec du préchauffage: {str(e)}", "warning", "⚠️")
+            return False
+
+    # Des requêtes concurrentes sont nécessaires pour ouvrir plusieurs sockets
+    with ThreadPoolExecutor(max_workers=connections) as executor:
+        opened = sum(executor.map(_open_connection, range(connections)))
+
+    log(f"✅ Pool HTTP préchauffé: {opened}/{connections} connexions")
+    return opened
+
+class TTLCache:
+    """Cache LRU thread-safe avec expiration par entrée et compteurs de hits/miss"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Supprimer une entrée, ou tout le cache si aucune clé n'est donnée"""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+profile_cache = TTLCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
 
 def get_creator_info(access_token):
     """Récupérer les informations du créateur TikTok"""
@@ -152,15 +888,12 @@ def get_creator_info(access_token):
             'Content-Type': 'application/json; charset=UTF-8'
         }
         
-        url = 'https://open.tiktokapis.com/v2/post/publish/creator_info/query/'
-        
-        response = requests.post(url, headers=headers)
+        response = tiktok_request('creator_info', 'POST', TIKTOK_CREATOR_INFO_URL, headers=headers)
         response.raise_for_status()
         
         creator_data = response.json()
         
-        if debug_mode:
-            log(f"   Données créateur: {json.dumps(creator_data, indent=2)}", "debug", "🔍")
+        log(lambda: f"   Données créateur: {json.dumps(creator_data, indent=2)}", "debug", "🔍")
         
         # Vérifier si la réponse est OK
         if creator_data.get('error', {}).get('code') == 'ok':
@@ -175,69 +908,411 @@ def get_creator_info(access_token):
             log(traceback.format_exc(), "error", "🔍")
         return None
 
-def save_to_database(token_data):
-    """Sauvegarder les données du token et les informations du créateur dans Supabase"""
+def deactivate_tokens(open_id):
+    """Désactiver les anciens tokens d'un utilisateur"""
+    db_execute('tiktok_tokens.deactivate', supabase.table('tiktok_tokens').update({
+        'is_active': False
+    }).eq('open_id', open_id).eq('is_active', True))
+
+# Colonnes de tiktok_tokens alimentées par creator_info/query
+CREATOR_FIELDS = (
+    'creator_avatar_url', 'creator_username', 'creator_nickname', 'privacy_level_options',
+    'comment_disabled', 'duet_disabled', 'stitch_disabled', 'max_video_post_duration_sec'
+)
+
+def creator_fields(creator_info):
+    """Champs créateur de tiktok_tokens à partir de la réponse creator_info/query"""
+    creator_data = creator_info['data']
+    return {field: creator_data.get(field) for field in CREATOR_FIELDS}
+
+def build_token_row(token_data, creator_info=None):
+    """Construire la ligne tiktok_tokens à partir du token et des informations créateur"""
+    insert_data = {
+        'access_token': token_data.get('access_token'),
+        'refresh_token': token_data.get('refresh_token'),
+        'expires_in': token_data.get('expires_in'),
+        'open_id': token_data.get('open_id'),
+        'union_id': token_data.get('union_id'),
+        'scope': token_data.get('scope'),
+        'created_at': datetime.now().isoformat(),
+        'updated_at': datetime.now().isoformat(),
+        'is_active': True
+    }
+    
+    # Ajouter les informations du créateur si disponibles
+    if creator_info and creator_info.get('data'):
+        creator_data = creator_info['data']
+        insert_data.update(creator_fields(creator_info))
+        
+        log(f"👤 Informations créateur récupérées:")
+        log(f"   Username: {creator_data.get('creator_username')}")
+        log(f"   Nickname: {creator_data.get('creator_nickname')}")
+    
+    return insert_data
+
+_token_upsert_rpc_state = {'available': bool(TOKEN_UPSERT_RPC)}
+
+def token_upsert_rpc_available():
+    """Indiquer si la fonction d'upsert atomique est utilisable"""
+    return _token_upsert_rpc_state['available']
+
+def is_missing_function_error(error):
+    """Détecter l'erreur PostgREST/Postgres d'une fonction RPC inexistante"""
+    code = str(getattr(error, 'code', '') or '')
+    return code in ('PGRST202', '42883') or 'Could not find the function' in str(error)
+
+def upsert_token(insert_data, deactivated=False):
+    """Désactiver les anciens tokens et insérer le nouveau en un seul aller-retour si possible"""
+    if token_upsert_rpc_available():
+        try:
+            return db_execute(f'rpc.{TOKEN_UPSERT_RPC}', supabase.rpc(TOKEN_UPSERT_RPC, {'token': insert_data}))
+        except Exception as e:
+            if not is_missing_function_error(e):
+                raise
+            _token_upsert_rpc_state['available'] = False
+            log(f"⚠️ Fonction {TOKEN_UPSERT_RPC} absente, retour au mode désactivation + insertion", "warning", "⚠️")
+    
+    # Mode en deux étapes pour les bases sans la fonction
+    if not deactivated:
+        deactivate_tokens(insert_data.get('open_id'))
+    return db_execute('tiktok_tokens.insert', supabase.table('tiktok_tokens').insert(insert_data))
+
+class SupabaseTokenStore:
+    """Tokens via l'API REST Supabase (PostgREST)"""
+
+    name = 'supabase'
+
+    @property
+    def atomic_save(self):
+        """True si save() désactive les anciens tokens dans la même transaction"""
+        return token_upsert_rpc_available()
+
+    def save(self, row, deactivated=False):
+        """Enregistrer le token actif d'un utilisateur; retourne l'id inséré"""
+        result = upsert_token(row, deactivated=deactivated)
+        return result.data[0].get('id') if result.data else None
+
+    def deactivate(self, open_id):
+        deactivate_tokens(open_id)
+
+    def fetch_active(self, open_id):
+        """Dernier token actif d'un utilisateur (profil créateur), ou None"""
+        # Lookup ponctuel sur (open_id, is_active), voir migrations/003_session_lookup_index.sql
+        result = db_execute('tiktok_tokens.select_profile', supabase.table('tiktok_tokens') \
+            .select('id, open_id, creator_nickname, creator_avatar_url, creator_username') \
+            .eq('open_id', open_id) \
+            .eq('is_active', True) \
+            .order('created_at', desc=True) \
+            .limit(1))
+        return result.data[0] if result.data else None
+
+    def count(self):
+        """Nombre de tokens (comptage côté serveur, HEALTH_COUNT_METHOD)"""
+        result = db_execute('tiktok_tokens.count', supabase.table('tiktok_tokens') \
+            .select('id', count=HEALTH_COUNT_METHOD) \
+            .limit(1))
+        return result.count if result.count is not None else -1
+
+    def claim_webhook_code(self, code_hash, state_hash, ttl):
+        """Réserver un code d'autorisation pour tous les workers (migrations/004_webhook_codes.sql)
+
+        Retourne (réservé, empreinte du state du premier appel, résultat ou None si en cours).
+        """
+        result = db_execute('rpc.claim_webhook_code', supabase.rpc('claim_webhook_code', {
+            'p_code_hash': code_hash,
+            'p_state_hash': state_hash,
+            'p_ttl': ttl
+        }))
+        row = result.data[0]
+        return row['claimed'], row['state_hash'], row['outcome']
+
+    def webhook_code_outcome(self, code_hash):
+        """Résultat d'un code réservé par un autre worker, ou None s'il est encore en cours"""
+        result = db_execute('webhook_codes.select', supabase.table('webhook_codes') \
+            .select('outcome') \
+            .eq('code_hash', code_hash) \
+            .limit(1))
+        return result.data[0]['outcome'] if result.data else None
+
+    def finish_webhook_code(self, code_hash, outcome):
+        db_execute('rpc.finish_webhook_code', supabase.rpc('finish_webhook_code', {
+            'p_code_hash': code_hash,
+            'p_outcome': outcome
+        }))
+
+    def stats(self):
+        return {'backend': self.name}
+
+class PostgresTokenStore:
+    """Tokens via une connexion Postgres directe: pool borné et requêtes préparées"""
+
+    name = 'postgres'
+    atomic_save = True
+
+    # Préparées une fois par connexion, exécutées ensuite avec EXECUTE
+    STATEMENTS = {
+        'tt_lock': ('text', "select pg_advisory_xact_lock(hashtext($1))"),
+        'tt_deactivate': ('text', """
+            update public.tiktok_tokens set is_active = false
+             where open_id = $1 and is_active"""),
+        'tt_insert': ('jsonb', """
+            insert into public.tiktok_tokens (
+                access_token, refresh_token, expires_in, open_id, union_id, scope,
+                created_at, updated_at, is_active,
+                creator_avatar_url, creator_username, creator_nickname,
+                privacy_level_options, comment_disabled, duet_disabled,
+                stitch_disabled, max_video_post_duration_sec
+            )
+            select
+                r.access_token, r.refresh_token, r.expires_in, r.open_id, r.union_id, r.scope,
+                coalesce(r.created_at, now()), coalesce(r.updated_at, now()), true,
+                r.creator_avatar_url, r.creator_username, r.creator_nickname,
+                r.privacy_level_options, r.comment_disabled, r.duet_disabled,
+                r.stitch_disabled, r.max_video_post_duration_sec
+            from jsonb_populate_record(null::public.tiktok_tokens, $1) as r
+            returning id"""),
+        'tt_fetch_active': ('text', """
+            select id, open_id, creator_nickname, creator_avatar_url, creator_username
+              from public.tiktok_tokens
+             where open_id = $1 and is_active
+             order by created_at desc
+             limit 1"""),
+        'tt_count_exact': ('', "select count(*) from public.tiktok_tokens"),
+        'tt_count_estimated': ('', """
+            select greatest(reltuples, 0)::bigint from pg_class
+             where oid = 'public.tiktok_tokens'::regclass""")
+    }
+
+    # Seulement avec WEBHOOK_DEDUP_SHARED: les fonctions viennent de migrations/004_webhook_codes.sql
+    WEBHOOK_STATEMENTS = {
+        'tt_claim_webhook': ('text, text, integer', """
+            select claimed, state_hash, outcome from public.claim_webhook_code($1, $2, $3)"""),
+        'tt_webhook_outcome': ('text', """
+            select outcome from public.webhook_codes where code_hash = $1"""),
+        'tt_finish_webhook': ('text, jsonb', "select public.finish_webhook_code($1, $2)")
+    }
+
+    def __init__(self, dsn, minconn, maxconn, acquire_timeout, statement_timeout):
+        # Dépendance optionnelle: seulement nécessaire avec TOKEN_STORE=postgres
+        import psycopg2
+        import psycopg2.extras
+        import psycopg2.pool
+        self._errors = psycopg2
+        self._json = psycopg2.extras.Json
+
+        class PreparedConnection(psycopg2.extensions.connection):
+            # Requêtes préparées: état porté par la connexion elle-même (un id() peut être réutilisé)
+            prepared = False
+
+        self._pool = psycopg2.pool.ThreadedConnectionPool(
+            minconn, maxconn, dsn,
+            connection_factory=PreparedConnection,
+            connect_timeout=max(1, int(HTTP_CONNECT_TIMEOUT)),
+            options=f"-c statement_timeout={int(statement_timeout * 1000)}",
+            application_name='tiktok_api'
+        )
+        # minconn ne sert qu'à l'ouverture: psycopg2 ferme toute connexion rendue au-delà de
+        # minconn connexions libres, ce qui rouvrirait (et re-préparerait) sans cesse sous charge
+        self._pool.minconn = maxconn
+        # ThreadedConnectionPool échoue au-delà de maxconn: le sémaphore fait attendre à la place
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._maxconn = maxconn
+        self._acquire_timeout = acquire_timeout
+        self._statements = dict(self.STATEMENTS)
+        if WEBHOOK_DEDUP_SHARED:
+            self._statements.update(self.WEBHOOK_STATEMENTS)
+        self._stats = {'in_use': 0, 'waits': 0, 'timeouts': 0, 'discarded': 0, 'prepared_connections': 0}
+        self._stats_lock = threading.Lock()
+        circuit_breakers.setdefault(self.name, CircuitBreaker(self.name, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT))
+
+    def _prepare(self, conn):
+        with conn.cursor() as cursor:
+            for name, (types, sql) in self._statements.items():
+                signature = f"({types})" if types else ""
+                cursor.execute(f"prepare {name}{signature} as {sql}")
+        conn.prepared = True
+        with self._stats_lock:
+            self._stats['prepared_connections'] += 1
+
+    @contextmanager
+    def connection(self):
+        """Emprunter une connexion (autocommit, requêtes préparées) au pool"""
+        timeout = self._acquire_timeout
+        remaining = remaining_budget()
+        if remaining is not None:
+            timeout = max(0, min(timeout, remaining))
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self._stats['waits'] += 1
+            if not self._slots.acquire(timeout=timeout):
+                with self._stats_lock:
+                    self._stats['timeouts'] += 1
+                raise TimeoutError(f"Aucune connexion Postgres libre après {timeout:.1f}s")
+        with self._stats_lock:
+            self._stats['in_use'] += 1
+        conn = None
+        discard = False
+        try:
+            conn = self._pool.getconn()
+            if not conn.prepared:
+                # Une préparation partielle rendrait la connexion inutilisable: on la jette
+                discard = True
+                conn.autocommit = True
+                self._prepare(conn)
+                discard = False
+            yield conn
+        except (self._errors.OperationalError, self._errors.InterfaceError):
+            # Connexion cassée: ne pas la remettre dans le pool
+            discard = True
+            raise
+        finally:
+            if conn is not None:
+                if discard or conn.closed:
+                    with self._stats_lock:
+                        self._stats['discarded'] += 1
+                self._pool.putconn(conn, close=discard or bool(conn.closed))
+            with self._stats_lock:
+                self._stats['in_use'] -= 1
+            self._slots.release()
+
+    def _execute(self, operation, sql, params=(), fetch=True):
+        def run():
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(sql, params)
+                return cursor.fetchone() if fetch else cursor.rowcount
+        return guarded_call(self.name, operation, run)
+
+    def save(self, row, deactivated=False):
+        """Désactiver les anciens tokens et insérer le nouveau en un seul aller-retour"""
+        # En autocommit, une requête multi-instructions s'exécute dans une transaction implicite:
+        # le verrou consultatif est tenu jusqu'à l'insertion
+        inserted = self._execute(
+            'tiktok_tokens.save',
+            "execute tt_lock(%(open_id)s); execute tt_deactivate(%(open_id)s); execute tt_insert(%(row)s)",
+            {'open_id': row.get('open_id'), 'row': self._json(row)}
+        )
+        return inserted[0] if inserted else None
+
+    def deactivate(self, open_id):
+        self._execute('tiktok_tokens.deactivate', "execute tt_deactivate(%s)", (open_id,), fetch=False)
+
+    def fetch_active(self, open_id):
+        row = self._execute('tiktok_tokens.select_profile', "execute tt_fetch_active(%s)", (open_id,))
+        if row is None:
+            return None
+        return dict(zip(('id', 'open_id', 'creator_nickname', 'creator_avatar_url', 'creator_username'), row))
+
+    def count(self):
+        statement = 'tt_count_exact' if HEALTH_COUNT_METHOD == 'exact' else 'tt_count_estimated'
+        row = self._execute('tiktok_tokens.count', f"execute {statement}")
+        return row[0] if row else -1
+
+    def claim_webhook_code(self, code_hash, state_hash, ttl):
+        return self._execute('rpc.claim_webhook_code', "execute tt_claim_webhook(%s, %s, %s)",
+                             (code_hash, state_hash, ttl))
+
+    def webhook_code_outcome(self, code_hash):
+        row = self._execute('webhook_codes.select', "execute tt_webhook_outcome(%s)", (code_hash,))
+        return row[0] if row else None
+
+    def finish_webhook_code(self, code_hash, outcome):
+        self._execute('rpc.finish_webhook_code', "execute tt_finish_webhook(%s, %s)",
+                      (code_hash, self._json(outcome)), fetch=False)
+
+    def stats(self):
+        with self._stats_lock:
+            return {'backend': self.name, 'pool_size': self._maxconn, **self._stats}
+
+    def close(self):
+        self._pool.closeall()
+
+def create_token_store():
+    """Instancier le stockage choisi par TOKEN_STORE"""
+    if TOKEN_STORE == 'postgres':
+        log(f"🐘 Stockage des tokens: Postgres direct (pool {DB_POOL_MIN}-{DB_POOL_MAX})")
+        return PostgresTokenStore(DATABASE_URL, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_STATEMENT_TIMEOUT)
+    if TOKEN_STORE != 'supabase':
+        log(f"⚠️ TOKEN_STORE={TOKEN_STORE} inconnu, utilisation de Supabase", "warning", "⚠️")
+    return SupabaseTokenStore()
+
+token_store = LazyResource('token_store', create_token_store)
+
+def save_to_database(token_data, state=None):
+    """Sauvegarder les données du token et les informations du créateur (TOKEN_STORE)
+
+    Si state est fourni, le résultat est publié aux pages qui attendent ce login (SSE).
+    """
     try:
-        log("\n🔄 Préparation de l'insertion dans Supabase...")
+        log(f"\n🔄 Préparation de l'insertion dans {token_store.name}...")
         
-        if debug_mode:
-            log(f"   Token data brute: {json.dumps(token_data, indent=2)}", "debug", "🔍")
+        log(lambda: f"   Token data brute: {json.dumps(mask_secrets(token_data), indent=2)}", "debug", "🔍")
         
-        # Récupérer les informations du créateur
-        creator_info = get_creator_info(token_data.get('access_token'))
+        # Récupérer les informations du créateur (et désactiver les anciens tokens en parallèle
+        # si la fonction d'upsert atomique n'est pas disponible)
+        step_deadline = UPSTREAM_STEP_DEADLINE
+        remaining = remaining_budget()
+        if remaining is not None:
+            step_deadline = min(step_deadline, remaining - CREATOR_INFO_MIN_BUDGET / 2)
+        deadline = time.monotonic() + step_deadline
+        timings = request_timings()
         
-        # Désactiver les anciens tokens
-        supabase.table('tiktok_tokens').update({
-            'is_active': False
-        }).eq('open_id', token_data.get('open_id')).execute()
+        # Enrichissement optionnel: ignoré si le budget est trop juste ou TikTok en panne
+        creator_future = None
+        if remaining is not None and remaining < CREATOR_INFO_MIN_BUDGET:
+            log(f"⏭️ Budget restant {remaining:.1f}s: enrichissement créateur ignoré", "warning", "⚠️")
+        elif circuit_breakers['tiktok'].state == CircuitBreaker.OPEN:
+            log("⏭️ Disjoncteur TikTok ouvert: enrichissement créateur ignoré", "warning", "⚠️")
+        else:
+            creator_future = submit_upstream('creator_info', timings,
+                                             get_creator_info, token_data.get('access_token'))
+        deactivated = False
+        if not token_store.atomic_save:
+            deactivate_future = submit_upstream('deactivate', timings,
+                                                token_store.deactivate, token_data.get('open_id'))
+            
+            # La désactivation doit être terminée avant l'insertion, dans le budget de la requête
+            remaining = remaining_budget()
+            try:
+                deactivate_future.result(timeout=None if remaining is None else max(0, remaining))
+            except FutureTimeoutError:
+                raise DeadlineExceeded("Désactivation des anciens tokens non terminée dans le budget")
+            deactivated = True
         
-        # Préparer les données à insérer
-        insert_data = {
-            'access_token': token_data.get('access_token'),
-            'refresh_token': token_data.get('refresh_token'),
-            'expires_in': token_data.get('expires_in'),
-            'open_id': token_data.get('open_id'),
-            'union_id': token_data.get('union_id'),
-            'scope': token_data.get('scope'),
-            'created_at': datetime.now().isoformat(),
-            'updated_at': datetime.now().isoformat(),
-            'is_active': True
-        }
+        # Les informations créateur sont optionnelles: on n'attend que jusqu'à l'échéance
+        creator_info = None
+        if creator_future is not None:
+            try:
+                creator_info = creator_future.result(timeout=max(0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                log(f"⏱️ Informations créateur non reçues après {step_deadline:.1f}s, insertion sans enrichissement", "warning", "⚠️")
         
-        # Ajouter les informations du créateur si disponibles
-        if creator_info and creator_info.get('data'):
-            creator_data = creator_info['data']
-            insert_data.update({
-                'creator_avatar_url': creator_data.get('creator_avatar_url'),
-                'creator_username': creator_data.get('creator_username'),
-                'creator_nickname': creator_data.get('creator_nickname'),
-                'privacy_level_options': creator_data.get('privacy_level_options'),
-                'comment_disabled': creator_data.get('comment_disabled'),
-                'duet_disabled': creator_data.get('duet_disabled'),
-                'stitch_disabled': creator_data.get('stitch_disabled'),
-                'max_video_post_duration_sec': creator_data.get('max_video_post_duration_sec')
-            })
-            
-            log(f"👤 Informations créateur récupérées:")
-            log(f"   Username: {creator_data.get('creator_username')}")
-            log(f"   Nickname: {creator_data.get('creator_nickname')}")
+        # Préparer les données à insérer
+        insert_data = build_token_row(token_data, creator_info)
         
         # Insérer les données
-        result = supabase.table('tiktok_tokens').insert(insert_data).execute()
+        with timing_span('insert', timings):
+            token_id = token_store.save(insert_data, deactivated=deactivated)
+        
+        profile_cache.invalidate(insert_data['open_id'])
         
-        log("✅ Données insérées dans Supabase avec succès")
-        if result.data:
-            log(f"   ID: {result.data[0].get('id', 'N/A')}")
+        log(f"✅ Données insérées dans {token_store.name} avec succès")
+        log(f"   ID: {token_id if token_id is not None else 'N/A'}")
         
+        if state:
+            auth_events.publish(state, auth_result(insert_data))
         return True
         
     except Exception as e:
-        log(f"❌ ERREUR Supabase: {str(e)}", "error", "💥")
+        # Le stockage peut avoir échoué à sa création: nommer alors celui qui était configuré
+        store = token_store.name if token_store.is_initialized() else TOKEN_STORE
+        log(f"❌ ERREUR base de données ({store}): {str(e)}", "error", "💥")
         log(f"   Type d'erreur: {type(e).__name__}", "error", "💥")
         if debug_mode:
             log(f"   Traceback complet:", "error", "🔍")
             import traceback
             log(traceback.format_exc(), "error", "🔍")
+        if state:
+            auth_events.publish(state, {'success': False, 'error': "Erreur lors de la sauvegarde"})
         return False
 
 def call_tiktok_api(code):
@@ -258,23 +1333,16 @@ def call_tiktok_api(code):
             'redirect_uri': TIKTOK_REDIRECT_URI
         }
         
-        if debug_mode:
-            log("   Headers de la requête:", "debug", "🔍")
-            log(f"   {json.dumps(headers, indent=2)}", "debug", "🔍")
-            log("   Données de la requête:", "debug", "🔍")
-            masked_data = data.copy()
-            masked_data['client_secret'] = '***'
-            log(f"   {json.dumps(masked_data, indent=2)}", "debug", "🔍")
+        log(lambda: f"   Headers de la requête:\n   {json.dumps(headers, indent=2)}", "debug", "🔍")
+        log(lambda: f"   Données de la requête:\n   {json.dumps(mask_secrets(data), indent=2)}", "debug", "🔍")
         
         log(f"📤 Envoi requête vers {TIKTOK_API_URL}")
         log(f"   Code: {code[:20]}...")
         
-        response = requests.post(TIKTOK_API_URL, headers=headers, data=data)
+        response = tiktok_request('oauth_token', 'POST', TIKTOK_API_URL, headers=headers, data=data)
         log(f"📥 Réponse reçue: Status {response.status_code}")
         
-        if debug_mode:
-            log("   Headers de la réponse:", "debug", "🔍")
-            log(f"   {json.dumps(dict(response.headers), indent=2)}", "debug", "🔍")
+        log(lambda: f"   Headers de la réponse:\n   {json.dumps(dict(response.headers), indent=2)}", "debug", "🔍")
         
         if response.status_code == 200:
             token_data = response.json()
@@ -282,12 +1350,7 @@ def call_tiktok_api(code):
             log(f"   Access token: {token_data.get('access_token', '')[:10]}...")
             log(f"   Expires in: {token_data.get('expires_in')}")
             
-            if debug_mode:
-                masked_token_data = token_data.copy()
-                masked_token_data['access_token'] = masked_token_data['access_token'][:10] + '...'
-                if 'refresh_token' in masked_token_data:
-                    masked_token_data['refresh_token'] = masked_token_data['refresh_token'][:10] + '...'
-                log(f"   Réponse complète: {json.dumps(masked_token_data, indent=2)}", "debug", "🔍")
+            log(lambda: f"   Réponse complète: {json.dumps(mask_secrets(token_data), indent=2)}", "debug", "🔍")
             
             return token_data
         else:
@@ -304,6 +1367,1042 @@ def call_tiktok_api(code):
             log(traceback.format_exc(), "error", "🔍")
         return None
 
+class AuthEventHub:
+    """Résultat d'authentification par state OAuth, attendu par la page via SSE
+
+    Le résultat est écrit dans AUTH_EVENTS_DIR pour être visible de tous les workers
+    de la machine; les connexions du même processus sont réveillées immédiatement,
+    les autres voient le fichier au plus tard après AUTH_EVENTS_POLL secondes.
+    """
+
+    STATE_PATTERN = re.compile(r'^[A-Za-z0-9_-]{16,128}$')
+
+    def __init__(self, directory, ttl, max_streams):
+        self.directory = directory
+        self.ttl = ttl
+        self._streams = threading.BoundedSemaphore(max_streams)
+        self._condition = threading.Condition()
+        self._last_purge = 0.0
+        self._stats = {'published': 0, 'delivered': 0, 'timeouts': 0, 'reconnects': 0, 'rejected': 0,
+                       'open_streams': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key, delta=1):
+        with self._stats_lock:
+            self._stats[key] += delta
+
+    def is_valid_state(self, state):
+        return bool(state) and bool(self.STATE_PATTERN.match(state))
+
+    def _path(self, state):
+        return os.path.join(self.directory, f"{state}.json")
+
+    def publish(self, state, payload):
+        """Enregistrer le résultat d'un login et réveiller les connexions en attente"""
+        if not self.is_valid_state(state):
+            return
+        path = self._path(state)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log(f"⚠️ Résultat d'authentification non publié: {str(e)}", "warning", "⚠️")
+            return
+        self._count('published')
+        with self._condition:
+            self._condition.notify_all()
+        self._purge()
+
+    def read(self, state):
+        """Résultat publié pour ce state (None s'il n'existe pas ou a expiré)"""
+        path = self._path(state)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def wait(self, state, timeout):
+        """Attendre le résultat jusqu'à timeout secondes"""
+        deadline = time.monotonic() + timeout
+        while True:
+            payload = self.read(state)
+            remaining = deadline - time.monotonic()
+            if payload is not None or remaining <= 0:
+                return payload
+            with self._condition:
+                self._condition.wait(min(AUTH_EVENTS_POLL, remaining))
+
+    def open_stream(self):
+        """Réserver une connexion SSE; False si AUTH_STREAM_MAX est atteint"""
+        if not self._streams.acquire(blocking=False):
+            self._count('rejected')
+            return False
+        self._count('open_streams')
+        return True
+
+    def close_stream(self, outcome):
+        """Libérer la place; outcome: 'delivered', 'timeouts' ou 'reconnects' (fin de fenêtre long-poll)"""
+        self._count('open_streams', -1)
+        self._count(outcome)
+        self._streams.release()
+
+    def _purge(self):
+        """Supprimer les résultats expirés (au plus une fois par minute)"""
+        now = time.time()
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        try:
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                try:
+                    if now - os.path.getmtime(path) > self.ttl:
+                        os.remove(path)
+                except OSError:
+                    pass
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+auth_events = AuthEventHub(AUTH_EVENTS_DIR, AUTH_EVENTS_TTL, AUTH_STREAM_MAX)
+
+def auth_result(insert_data):
+    """Charge utile SSE d'un login réussi (même contrat que /user/profile)"""
+    return {
+        'success': True,
+        'nickname': insert_data.get('creator_nickname') or '',
+        'avatar_url': insert_data.get('creator_avatar_url') or ''
+    }
+
+def exchange_outcome(token_data):
+    """Résultat d'un échange de code mémorisé pour les doublons de /webhook"""
+    if token_data:
+        return {'success': True, 'open_id': token_data.get('open_id'), 'error': None}
+    return {'success': False, 'open_id': None, 'error': "Erreur lors de l'échange du code"}
+
+class WebhookDeduplicator:
+    """Un seul échange TikTok par code d'autorisation reçu sur /webhook
+
+    Un doublon reçu pendant l'échange attend son résultat; reçu après, il obtient le
+    résultat mémorisé (TTLCache borné). Avec WEBHOOK_DEDUP_SHARED, la réservation passe
+    aussi par la base pour couvrir tous les workers. Codes et states ne sont conservés
+    que sous forme d'empreinte SHA-256.
+    """
+
+    REJECTED = {'success': False, 'open_id': None, 'error': "Code d'autorisation déjà utilisé"}
+    IN_PROGRESS = {'success': False, 'open_id': None, 'error': "Authentification déjà en cours"}
+
+    def __init__(self, maxsize, ttl, shared=False):
+        self.ttl = ttl
+        self.shared = shared
+        # clé -> (empreinte du state du premier appel, résultat)
+        self.completed = TTLCache(maxsize, ttl)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = {'exchanges': 0, 'replayed': 0, 'joined': 0, 'rejected': 0, 'timeouts': 0, 'shared_errors': 0}
+
+    @staticmethod
+    def digest(value):
+        return hashlib.sha256((value or '').encode('utf-8')).hexdigest()
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _wait_timeout(self):
+        remaining = remaining_budget()
+        return max(0, remaining) if remaining is not None else REQUEST_BUDGET
+
+    def _replay(self, state_key, first_state, outcome, counter):
+        if outcome is None:
+            self._count('timeouts')
+            return self.IN_PROGRESS
+        if first_state != state_key:
+            # Même code avec un autre state: ne pas lier une autre session à cet utilisateur
+            self._count('rejected')
+            return self.REJECTED
+        self._count(counter)
+        return outcome
+
+    def claim(self, code, state):
+        """Réserver un code; retourne (True, None) au premier appel, sinon (False, résultat)"""
+        key, state_key = self.digest(code), self.digest(state)
+        with self._lock:
+            cached = self.completed.get(key)
+            entry = self._inflight.get(key) if cached is None else None
+            owner = cached is None and entry is None
+            if owner:
+                entry = self._inflight[key] = {
+                    'state': state_key, 'outcome': None, 'shared': False, 'done': threading.Event()
+                }
+        if cached is not None:
+            return False, self._replay(state_key, *cached, 'replayed')
+        if not owner:
+            entry['done'].wait(self._wait_timeout())
+            return False, self._replay(state_key, entry['state'], entry['outcome'], 'joined')
+        if self.shared:
+            claimed, first_state, outcome = self._claim_shared(key, state_key)
+            if not claimed:
+                # Échangé (ou en cours) sur un autre worker: les doublons locaux suivent ce résultat
+                self._finish(key, first_state, outcome)
+                return False, self._replay(state_key, first_state, outcome, 'joined')
+            entry['shared'] = True
+        self._count('exchanges')
+        return True, None
+
+    def _claim_shared(self, key, state_key):
+        try:
+            claimed, first_state, outcome = token_store.claim_webhook_code(key, state_key, self.ttl)
+            deadline = time.monotonic() + self._wait_timeout()
+            while not claimed and outcome is None and time.monotonic() < deadline:
+                time.sleep(WEBHOOK_DEDUP_POLL)
+                outcome = token_store.webhook_code_outcome(key)
+            return claimed, first_state, outcome
+        except Exception as e:
+            # Base indisponible: la déduplication reste locale à ce worker
+            self._count('shared_errors')
+            log(f"⚠️ Réservation partagée du code impossible: {str(e)}", "warning", "⚠️")
+            return True, state_key, None
+
+    def _finish(self, key, first_state, outcome):
+        with self._lock:
+            entry = self._inflight.pop(key, None)
+            if outcome is not None:
+                self.completed.set(key, (first_state, outcome))
+        if entry is not None:
+            entry['state'] = first_state
+            entry['outcome'] = outcome
+            entry['done'].set()
+        return entry
+
+    def complete(self, code, outcome):
+        """Mémoriser le résultat de l'échange et réveiller les doublons en attente"""
+        key = self.digest(code)
+        with self._lock:
+            entry = self._inflight.get(key)
+        if entry is None:
+            return
+        self._finish(key, entry['state'], outcome)
+        if entry['shared']:
+            try:
+                token_store.finish_webhook_code(key, outcome)
+            except Exception as e:
+                self._count('shared_errors')
+                log(f"⚠️ Résultat partagé du code non enregistré: {str(e)}", "warning", "⚠️")
+
+    def stats(self):
+        """Statistiques exposées par /health"""
+        with self._lock:
+            return {
+                'shared': self.shared,
+                'in_flight': len(self._inflight),
+                'completed': self.completed.stats(),
+                **self._stats
+            }
+
+webhook_dedup = WebhookDeduplicator(WEBHOOK_DEDUP_SIZE, WEBHOOK_DEDUP_TTL, WEBHOOK_DEDUP_SHARED)
+
+class PostLoginPipeline:
+    """File de travail bornée pour l'enrichissement créateur et la sauvegarde Supabase"""
+
+    _STOP = object()
+
+    def __init__(self, workers, maxsize):
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=maxsize)
+        self._threads = []
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._accepting = True
+
+    def start(self):
+        """Démarrer les workers (une seule fois)"""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'post-login-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        log(f"🧵 Pipeline post-login démarré ({self.workers} workers, capacité {self.queue.maxsize})")
+
+    def submit(self, token_data, state=None):
+        """Mettre en file un login; retourne False si la file reste pleine (backpressure)"""
+        if not self._accepting:
+            return False
+        self.start()
+        open_id = token_data.get('open_id')
+        with self._lock:
+            self._pending[open_id] = time.time()
+        try:
+            self.queue.put((token_data, state), timeout=POST_LOGIN_ENQUEUE_TIMEOUT)
+            return True
+        except queue.Full:
+            with self._lock:
+                self._pending.pop(open_id, None)
+            log(f"⚠️ File post-login pleine ({self.queue.maxsize}), traitement synchrone", "warning", "⚠️")
+            return False
+
+    def depth(self):
+        """Jauge: nombre de logins en attente dans la file"""
+        return self.queue.qsize()
+
+    def is_pending(self, open_id=None):
+        """Indiquer si un login (ou un open_id donné) attend encore son traitement"""
+        with self._lock:
+            if open_id is None:
+                return bool(self._pending)
+            return open_id in self._pending
+
+    def stats(self):
+        """Statistiques exposées par /health"""
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'enabled': POST_LOGIN_ASYNC,
+            'depth': self.depth(),
+            'pending': pending,
+            'capacity': self.queue.maxsize,
+            'workers': len(self._threads)
+        }
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is self._STOP:
+                    return
+                token_data, state = item
+                save_to_database(token_data, state)
+            except Exception as e:
+                log(f"❌ Erreur dans le pipeline post-login: {str(e)}", "error", "💥")
+            finally:
+                if item is not self._STOP:
+                    with self._lock:
+                        self._pending.pop(item[0].get('open_id'), None)
+                self.queue.task_done()
+
+    def shutdown(self, timeout=POST_LOGIN_DRAIN_TIMEOUT):
+        """Vider la file avant l'arrêt du processus"""
+        if not self._accepting:
+            return
+        self._accepting = False
+        if not self._threads:
+            return
+        log(f"🛑 Vidage du pipeline post-login ({self.depth()} en attente)...")
+        deadline = time.time() + timeout
+        for _ in self._threads:
+            try:
+                self.queue.put(self._STOP, timeout=max(0, deadline - time.time()))
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.time()))
+        remaining = self.depth()
+        if remaining:
+            log(f"⚠️ Pipeline arrêté avec {remaining} login(s) non traités", "warning", "⚠️")
+        else:
+            log("✅ Pipeline post-login vidé")
+
+post_login_pipeline = PostLoginPipeline(POST_LOGIN_WORKERS, POST_LOGIN_QUEUE_SIZE)
+atexit.register(post_login_pipeline.shutdown)
+
+def refresh_access_token(refresh_token):
+    """Échanger un refresh token contre un nouvel access token"""
+    data = {
+        'client_key': TIKTOK_CLIENT_KEY,
+        'client_secret': TIKTOK_CLIENT_SECRET,
+        'grant_type': 'refresh_token',
+        'refresh_token': refresh_token
+    }
+    headers = {
+        'Content-Type': 'application/x-www-form-urlencoded',
+        'Cache-Control': 'no-cache'
+    }
+    response = tiktok_request('oauth_refresh', 'POST', TIKTOK_API_URL, headers=headers, data=data)
+    payload = response.json()
+    if response.status_code != 200 or not payload.get('access_token'):
+        return None, payload.get('error') or f'http_{response.status_code}'
+    return payload, None
+
+class TokenRefreshScheduler:
+    """Rafraîchit en arrière-plan, par lots, les tokens actifs proches de l'expiration"""
+
+    def __init__(self):
+        self._thread = None
+        self._stop = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=TOKEN_REFRESH_CONCURRENCY,
+                                            thread_name_prefix='token-refresh')
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'enabled': TOKEN_REFRESH_ENABLED,
+            'runs': 0,
+            'refreshed': 0,
+            'failed': 0,
+            'deactivated': 0,
+            'last_run_at': None,
+            'last_duration_ms': None,
+            'last_batch_sizes': [],
+            'last_error': None
+        }
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name='token-refresh-scheduler', daemon=True)
+        self._thread.start()
+        log(f"🔁 Planificateur de rafraîchissement démarré (toutes les {TOKEN_REFRESH_INTERVAL}s, "
+            f"lots de {TOKEN_REFRESH_BATCH_SIZE}, {TOKEN_REFRESH_CONCURRENCY} en parallèle)")
+
+    def stop(self):
+        self._stop.set()
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _loop(self):
+        # Décalage initial aléatoire pour que les instances ne démarrent pas ensemble
+        delay = random.uniform(0, TOKEN_REFRESH_INTERVAL * TOKEN_REFRESH_JITTER)
+        while not self._stop.wait(delay):
+            self.run_once()
+            jitter = TOKEN_REFRESH_INTERVAL * TOKEN_REFRESH_JITTER
+            delay = TOKEN_REFRESH_INTERVAL + random.uniform(-jitter, jitter)
+
+    def _fetch_batch(self, horizon, cursor):
+        """Page suivante en keyset sur (expires_at, id): aucune ligne partageant l'échéance
+        de la dernière ligne vue n'est sautée"""
+        def expiring():
+            return supabase.table('tiktok_tokens') \
+                .select('id, open_id, refresh_token, expires_at') \
+                .eq('is_active', True)
+        
+        if cursor is None:
+            return db_execute('tiktok_tokens.select_expiring', expiring() \
+                .lt('expires_at', horizon) \
+                .order('expires_at,id') \
+                .limit(TOKEN_REFRESH_BATCH_SIZE)).data or []
+        
+        # (expires_at, id) > curseur: même échéance et id suivant, puis échéances suivantes
+        expires_at, last_id = cursor
+        rows = db_execute('tiktok_tokens.select_expiring', expiring() \
+            .eq('expires_at', expires_at) \
+            .gt('id', last_id) \
+            .order('id') \
+            .limit(TOKEN_REFRESH_BATCH_SIZE)).data or []
+        if len(rows) < TOKEN_REFRESH_BATCH_SIZE:
+            rows += db_execute('tiktok_tokens.select_expiring', expiring() \
+                .gt('expires_at', expires_at) \
+                .lt('expires_at', horizon) \
+                .order('expires_at,id') \
+                .limit(TOKEN_REFRESH_BATCH_SIZE - len(rows))).data or []
+        return rows
+
+    def _refresh_one(self, row):
+        # Petit délai aléatoire pour étaler les appels vers TikTok
+        time.sleep(random.uniform(0, TOKEN_REFRESH_JITTER))
+        try:
+            payload, error = refresh_access_token(row['refresh_token'])
+        except Exception as e:
+            payload, error = None, type(e).__name__
+        return row, payload, error
+
+    def _write_back(self, refreshed):
+        """Écrire les tokens rafraîchis en un seul appel RPC (ou ligne par ligne en repli)"""
+        if not refreshed:
+            return
+        if TOKEN_REFRESH_RPC:
+            try:
+                db_execute(f'rpc.{TOKEN_REFRESH_RPC}', supabase.rpc(TOKEN_REFRESH_RPC, {'tokens': refreshed}))
+                return
+            except Exception as e:
+                if not is_missing_function_error(e):
+                    raise
+                log(f"⚠️ Fonction {TOKEN_REFRESH_RPC} absente, mise à jour ligne par ligne", "warning", "⚠️")
+        now = datetime.now().isoformat()
+        for row in refreshed:
+            db_execute('tiktok_tokens.refresh', supabase.table('tiktok_tokens').update({
+                'access_token': row['access_token'],
+                'refresh_token': row['refresh_token'],
+                'expires_in': row['expires_in'],
+                'updated_at': now
+            }).eq('id', row['id']))
+
+    def run_once(self):
+        """Exécuter un passage complet; retourne les statistiques du passage"""
+        started = time.monotonic()
+        horizon = (datetime.now(timezone.utc) + timedelta(seconds=TOKEN_REFRESH_MARGIN)).isoformat()
+        batch_sizes = []
+        refreshed_count = failed_count = deactivated_count = 0
+        last_error = None
+        cursor = None
+        try:
+            while not self._stop.is_set():
+                rows = self._fetch_batch(horizon, cursor)
+                if not rows:
+                    break
+                batch_sizes.append(len(rows))
+                cursor = (rows[-1]['expires_at'], rows[-1]['id'])
+                
+                refreshed, invalid_ids = [], []
+                for row, payload, error in self._executor.map(self._refresh_one, rows):
+                    if payload:
+                        refreshed.append({
+                            'id': row['id'],
+                            'access_token': payload['access_token'],
+                            'refresh_token': payload.get('refresh_token', row['refresh_token']),
+                            'expires_in': payload.get('expires_in')
+                        })
+                    else:
+                        failed_count += 1
+                        last_error = error
+                        # Refresh token révoqué ou expiré: le token ne sera plus jamais valide
+                        if error == 'invalid_grant':
+                            invalid_ids.append(row['id'])
+                
+                self._write_back(refreshed)
+                refreshed_count += len(refreshed)
+                if invalid_ids:
+                    db_execute('tiktok_tokens.deactivate',
+                               supabase.table('tiktok_tokens').update({'is_active': False}).in_('id', invalid_ids))
+                    deactivated_count += len(invalid_ids)
+                if refreshed or invalid_ids:
+                    profile_cache.invalidate()
+                
+                if len(rows) < TOKEN_REFRESH_BATCH_SIZE:
+                    break
+        except Exception as e:
+            last_error = f"{type(e).__name__}: {str(e)}"
+            log(f"❌ Erreur du planificateur de rafraîchissement: {str(e)}", "error", "💥")
+        
+        duration_ms = round((time.monotonic() - started) * 1000, 1)
+        with self._stats_lock:
+            self._stats['runs'] += 1
+            self._stats['refreshed'] += refreshed_count
+            self._stats['failed'] += failed_count
+            self._stats['deactivated'] += deactivated_count
+            self._stats['last_run_at'] = datetime.now().isoformat()
+            self._stats['last_duration_ms'] = duration_ms
+            self._stats['last_batch_sizes'] = batch_sizes
+            self._stats['last_error'] = last_error
+        
+        if batch_sizes or failed_count:
+            log(f"🔁 Rafraîchissement: {refreshed_count} ok, {failed_count} échecs, "
+                f"{deactivated_count} désactivés, lots {batch_sizes} en {duration_ms} ms")
+        return self.stats()
+
+token_refresh_scheduler = TokenRefreshScheduler()
+atexit.register(token_refresh_scheduler.stop)
+
+class TokenBucket:
+    """Seau à jetons thread-safe: rate jetons par seconde, au plus burst en réserve (rate <= 0: illimité)"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens=1):
+        """Prendre des jetons sans attendre; retourne 0 si accordé, sinon l'attente nécessaire (s)"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, stop=None):
+        """Attendre un jeton; retourne False si l'événement stop est levé pendant l'attente"""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return True
+            if stop is None:
+                time.sleep(wait)
+            elif stop.wait(wait):
+                return False
+
+class CreatorSyncJob:
+    """Re-synchronise les champs créateur de tous les tokens actifs (creator_info/query)
+
+    Les tokens sont lus par pages en keyset sur id, les appels TikTok passent par un pool
+    borné et un seau à jetons (appels par seconde), et seules les lignes modifiées sont
+    réécrites, par lot. Le curseur est enregistré après chaque page: un passage
+    interrompu reprend à la page suivante.
+    """
+
+    COLUMNS = 'id, open_id, access_token, ' + ', '.join(CREATOR_FIELDS)
+
+    def __init__(self, batch_size=CREATOR_SYNC_BATCH_SIZE, concurrency=CREATOR_SYNC_CONCURRENCY,
+                 rate=CREATOR_SYNC_RATE, checkpoint_path=CREATOR_SYNC_CHECKPOINT, dry_run=False):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.checkpoint_path = checkpoint_path
+        self.dry_run = dry_run
+        self._bucket = TokenBucket(rate)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='creator-sync')
+        self._thread = None
+        self._stop = threading.Event()
+        self._running = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'enabled': CREATOR_SYNC_ENABLED, 'runs': 0, 'last_run': None}
+
+    def start(self):
+        """Lancer les passages planifiés (toutes les CREATOR_SYNC_INTERVAL secondes)"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name='creator-sync-scheduler', daemon=True)
+        self._thread.start()
+        log(f"🎭 Synchronisation créateurs planifiée (toutes les {CREATOR_SYNC_INTERVAL}s, "
+            f"{self._bucket.rate} appels/s, {self.concurrency} en parallèle)")
+
+    def stop(self):
+        self._stop.set()
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        with self._stats_lock:
+            return {**self._stats, 'running': self._running.locked()}
+
+    def _loop(self):
+        # Un passage interrompu (redémarrage) reprend dès le démarrage
+        delay = 0 if os.path.exists(self.checkpoint_path) else random.uniform(0, CREATOR_SYNC_INTERVAL * 0.1)
+        while not self._stop.wait(delay):
+            self.run_once()
+            delay = CREATOR_SYNC_INTERVAL
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_checkpoint(self, cursor, totals, elapsed):
+        directory = os.path.dirname(self.checkpoint_path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.checkpoint_path}.{os.getpid()}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump({
+                'cursor': cursor,
+                'totals': totals,
+                'elapsed_s': elapsed,
+                'updated_at': datetime.now().isoformat()
+            }, f)
+        os.replace(temporary, self.checkpoint_path)
+
+    def _clear_checkpoint(self):
+        try:
+            os.remove(self.checkpoint_path)
+        except FileNotFoundError:
+            pass
+
+    def _fetch_page(self, cursor):
+        # Keyset: where is_active and id > curseur order by id (migrations/005_creator_sync.sql)
+        query = supabase.table('tiktok_tokens') \
+            .select(self.COLUMNS) \
+            .eq('is_active', True)
+        if cursor is not None:
+            query = query.gt('id', cursor)
+        return db_execute('tiktok_tokens.select_creators',
+                          query.order('id').limit(self.batch_size)).data or []
+
+    def _fetch_creator(self, row):
+        if not self._bucket.acquire(self._stop):
+            return row, None
+        return row, get_creator_info(row['access_token'])
+
+    def _write_back(self, changed):
+        """Écrire les lignes modifiées en un seul appel RPC (ou ligne par ligne en repli)"""
+        if CREATOR_SYNC_RPC:
+            try:
+                result = db_execute(f'rpc.{CREATOR_SYNC_RPC}', supabase.rpc(CREATOR_SYNC_RPC, {'creators': changed}))
+                return len(result.data or [])
+            except Exception as e:
+                if not is_missing_function_error(e):
+                    raise
+                log(f"⚠️ Fonction {CREATOR_SYNC_RPC} absente, mise à jour ligne par ligne", "warning", "⚠️")
+        # Sans toucher updated_at: expires_at en est dérivé (migrations/002_token_refresh.sql)
+        for row in changed:
+            fields = {field: row[field] for field in CREATOR_FIELDS}
+            db_execute('tiktok_tokens.sync_creator', supabase.table('tiktok_tokens') \
+                .update(fields) \
+                .eq('id', row['id']))
+        return len(changed)
+
+    def run_once(self, resume=True, limit=None):
+        """Exécuter un passage complet (ou jusqu'à limit tokens); retourne son rapport"""
+        if not self._running.acquire(blocking=False):
+            log("⏭️ Synchronisation créateurs déjà en cours", "warning", "⚠️")
+            return None
+        try:
+            report = self._run(resume, limit)
+        finally:
+            self._running.release()
+        with self._stats_lock:
+            self._stats['runs'] += 1
+            self._stats['last_run'] = report
+        return report
+
+    def _run(self, resume, limit):
+        # Un passage à blanc ne reprend ni ne déplace le point de reprise des vrais passages
+        checkpoint = self._load_checkpoint() if resume and not self.dry_run else None
+        cursor = checkpoint['cursor'] if checkpoint else None
+        totals = dict(checkpoint['totals']) if checkpoint else {
+            'scanned': 0, 'changed': 0, 'unchanged': 0, 'failed': 0, 'written': 0, 'batches': 0
+        }
+        previous_elapsed = checkpoint.get('elapsed_s', 0) if checkpoint else 0
+        if checkpoint:
+            log(f"↩️ Reprise de la synchronisation créateurs après l'id {cursor}")
+        started = time.monotonic()
+        scanned_now = 0
+        status = 'completed'
+        last_error = None
+        try:
+            while True:
+                if self._stop.is_set():
+                    status = 'interrupted'
+                    break
+                if circuit_breakers['tiktok'].state == CircuitBreaker.OPEN:
+                    # Inutile d'épuiser les tokens restants: le prochain passage reprendra ici
+                    log("⏸️ Disjoncteur TikTok ouvert: synchronisation créateurs suspendue", "warning", "⚠️")
+                    status = 'paused'
+                    break
+                rows = self._fetch_page(cursor)
+                if not rows:
+                    break
+                
+                changed, failed = [], 0
+                for row, creator_info in self._executor.map(self._fetch_creator, rows):
+                    if not creator_info or not creator_info.get('data'):
+                        failed += 1
+                        continue
+                    fields = creator_fields(creator_info)
+                    if any(row.get(field) != value for field, value in fields.items()):
+                        changed.append({'id': row['id'], **fields})
+                if self._stop.is_set():
+                    # Page incomplète: elle sera refaite à la reprise
+                    status = 'interrupted'
+                    break
+                
+                written = 0
+                if changed and not self.dry_run:
+                    written = self._write_back(changed)
+                    changed_ids = {row['id'] for row in changed}
+                    for row in rows:
+                        if row['id'] in changed_ids:
+                            profile_cache.invalidate(row['open_id'])
+                
+                totals['batches'] += 1
+                totals['scanned'] += len(rows)
+                totals['changed'] += len(changed)
+                totals['unchanged'] += len(rows) - len(changed) - failed
+                totals['failed'] += failed
+                totals['written'] += written
+                scanned_now += len(rows)
+                cursor = rows[-1]['id']
+                if not self.dry_run:
+                    self._save_checkpoint(cursor, totals, previous_elapsed + time.monotonic() - started)
+                
+                if len(rows) < self.batch_size:
+                    break
+                if limit is not None and scanned_now >= limit:
+                    status = 'partial'
+                    break
+        except Exception as e:
+            status = 'failed'
+            last_error = f"{type(e).__name__}: {str(e)}"
+            log(f"❌ Erreur de la synchronisation créateurs: {str(e)}", "error", "💥")
+        
+        if status == 'completed' and not self.dry_run:
+            self._clear_checkpoint()
+        elapsed = time.monotonic() - started
+        total_elapsed = previous_elapsed + elapsed
+        report = {
+            'status': status,
+            'dry_run': self.dry_run,
+            'resumed': checkpoint is not None,
+            'cursor': cursor,
+            **totals,
+            'duration_s': round(total_elapsed, 2),
+            'rows_per_s': round(totals['scanned'] / total_elapsed, 1) if total_elapsed else 0,
+            'last_error': last_error,
+            'finished_at': datetime.now().isoformat()
+        }
+        log(f"🎭 Synchronisation créateurs {status}: {totals['scanned']} tokens, {totals['changed']} modifiés, "
+            f"{totals['written']} écrits, {totals['failed']} échecs en {report['duration_s']}s "
+            f"({report['rows_per_s']} tokens/s)")
+        return report
+
+creator_sync_job = CreatorSyncJob()
+atexit.register(creator_sync_job.stop)
+
+_profile_counter = itertools.count(1)
+_profile_lock = threading.Lock()
+
+def should_profile():
+    """Profiler 1 requête sur PROFILE_SAMPLE_RATE, ou sur demande via l'en-tête X-Profile"""
+    if PROFILE_HEADER_TOKEN and request.headers.get('X-Profile') == PROFILE_HEADER_TOKEN:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and next(_profile_counter) % PROFILE_SAMPLE_RATE == 0
+
+def start_profiling():
+    # Un seul profil à la fois: cProfile et tracemalloc sont globaux au processus
+    if not _profile_lock.acquire(blocking=False):
+        return
+    tracemalloc.start()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    g.profiler = profiler
+
+def finish_profiling(profiler, status_code):
+    """Écrire le profil CPU (.prof) et les allocations (.txt) dans PROFILE_DIR"""
+    try:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        endpoint = request.endpoint or 'unmatched'
+        base = os.path.join(PROFILE_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{endpoint}_{status_code}")
+        profiler.dump_stats(base + '.prof')
+        with open(base + '.alloc.txt', 'w', encoding='utf-8') as f:
+            for stat in snapshot.statistics('lineno')[:50]:
+                f.write(f"{stat}\n")
+        log(f"🔬 Profil écrit: {base}.prof", "info", "🔬")
+    finally:
+        _profile_lock.release()
+
+def record_first_request(elapsed):
+    """Mesurer le délai entre l'import du module et la fin de la première requête"""
+    startup_timings['first_request_ms'] = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 1)
+    startup_timings['first_request_duration_ms'] = round(elapsed * 1000, 1)
+    log(f"⏱️ Première requête servie {startup_timings['first_request_ms']} ms après l'import "
+        f"(durée {startup_timings['first_request_duration_ms']} ms, "
+        f"initialisations {startup_timings['lazy_init_ms']})", "info", "⏱️")
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.deadline_token = request_deadline.set(time.monotonic() + REQUEST_BUDGET)
+    if (PROFILE_SAMPLE_RATE or PROFILE_HEADER_TOKEN) and should_profile():
+        start_profiling()
+
+def observe_request(url_rule, method, status, elapsed, timings):
+    """Compter une requête servie; retourne l'en-tête Server-Timing, ou None sans spans"""
+    labels = (url_rule.rule if url_rule else 'unmatched', method, str(status))
+    HTTP_REQUESTS.labels(*labels).inc()
+    HTTP_LATENCY.labels(*labels).observe(elapsed)
+    if timings is None:
+        return None
+    spans = [f"{name};dur={duration:.1f}" for name, duration in timings]
+    spans.append(f"total;dur={elapsed * 1000:.1f}")
+    return ', '.join(spans)
+
+@app.after_request
+def record_request_metrics(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        finish_profiling(profiler, response.status_code)
+    started = g.pop('request_started', None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        server_timing = observe_request(request.url_rule, request.method, response.status_code,
+                                        elapsed, g.get('timings'))
+        
+        if 'first_request_ms' not in startup_timings:
+            record_first_request(elapsed)
+        
+        if server_timing is not None:
+            response.headers['Server-Timing'] = server_timing
+    return response
+
+@app.teardown_request
+def reset_request_deadline(exc):
+    token = g.pop('deadline_token', None)
+    if token is not None:
+        request_deadline.reset(token)
+
+class RateLimiter:
+    """Seaux à jetons par client (LRU borné à max_clients) et global, débités ensemble
+
+    L'état d'un client tient en un tuple (jetons, horodatage); le client le moins
+    récemment vu est oublié au-delà de max_clients. Un débit <= 0 désactive le niveau.
+    """
+
+    def __init__(self, rate, burst, global_rate, global_burst, max_clients):
+        self.rate = rate
+        self.burst = burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.max_clients = max_clients
+        self._clients = OrderedDict()
+        self._global = (global_burst, time.monotonic())
+        self._lock = threading.Lock()
+        self._stats = {'allowed': 0, 'limited_client': 0, 'limited_global': 0, 'evicted': 0}
+
+    @staticmethod
+    def _refill(state, rate, burst, now):
+        tokens, updated = state
+        return min(burst, tokens + (now - updated) * rate)
+
+    def check(self, key):
+        """Admettre une requête du client key; retourne 0 si admise, sinon l'attente conseillée (s)"""
+        now = time.monotonic()
+        with self._lock:
+            client = math.inf
+            if self.rate > 0:
+                state = self._clients.get(key)
+                client = self.burst if state is None else self._refill(state, self.rate, self.burst, now)
+            shared = math.inf
+            if self.global_rate > 0:
+                shared = self._refill(self._global, self.global_rate, self.global_burst, now)
+            
+            wait = 0.0
+            if client < 1:
+                wait = (1 - client) / self.rate
+                self._stats['limited_client'] += 1
+            elif shared < 1:
+                wait = (1 - shared) / self.global_rate
+                self._stats['limited_global'] += 1
+            else:
+                client -= 1
+                shared -= 1
+                self._stats['allowed'] += 1
+            
+            if self.global_rate > 0:
+                self._global = (shared, now)
+            if self.rate > 0:
+                self._clients[key] = (client, now)
+                self._clients.move_to_end(key)
+                if len(self._clients) > self.max_clients:
+                    self._clients.popitem(last=False)
+                    self._stats['evicted'] += 1
+            return wait
+
+    def stats(self):
+        with self._lock:
+            return {
+                'clients': len(self._clients),
+                'max_clients': self.max_clients,
+                'ip_rate': self.rate,
+                'ip_burst': self.burst,
+                'global_rate': self.global_rate,
+                'global_burst': self.global_burst,
+                **self._stats
+            }
+
+class ConcurrencyLimiter:
+    """Plafond d'opérations amont simultanées: refuse au lieu de faire attendre un thread"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self._stats = {'in_flight': 0, 'peak': 0, 'rejected': 0}
+
+    @contextmanager
+    def slot(self):
+        """Occuper une place; produit False (sans rien occuper) si toutes sont prises"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['rejected'] += 1
+            yield False
+            return
+        with self._lock:
+            self._stats['in_flight'] += 1
+            self._stats['peak'] = max(self._stats['peak'], self._stats['in_flight'])
+        try:
+            yield True
+        finally:
+            with self._lock:
+                self._stats['in_flight'] -= 1
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {'limit': self.limit, **self._stats}
+
+rate_limiter = RateLimiter(RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST, RATE_LIMIT_GLOBAL_RATE,
+                           RATE_LIMIT_GLOBAL_BURST, RATE_LIMIT_MAX_CLIENTS)
+exchange_slots = ConcurrencyLimiter(UPSTREAM_MAX_INFLIGHT)
+RATE_LIMITED_ENDPOINTS = ('oauth', 'webhook')
+
+def client_key(remote_addr, forwarded_for=None):
+    """Clé de limitation du client: son IP (préfixe /64 en IPv6)
+
+    X-Forwarded-For n'est lu qu'avec RATE_LIMIT_TRUSTED_PROXIES proxys de confiance devant l'application.
+    """
+    address = remote_addr or ''
+    if RATE_LIMIT_TRUSTED_PROXIES and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(',') if hop.strip()]
+        if len(hops) >= RATE_LIMIT_TRUSTED_PROXIES:
+            address = hops[-RATE_LIMIT_TRUSTED_PROXIES]
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return address or 'unknown'
+    if ip.version == 6:
+        # Un client IPv6 dispose en général de tout un /64
+        return str(ipaddress.ip_network(f"{ip}/64", strict=False))
+    return str(ip)
+
+def too_many_requests(message, retry_after, status=429):
+    """Refus d'admission: JSON pour /oauth, page de fermeture pour /webhook (popup)"""
+    if request.endpoint == 'webhook':
+        auth_events.publish(request.args.get('state'), {'success': False, 'error': message})
+        response = close_page(False, message)
+        response.status_code = status
+    else:
+        response = jsonify({'error': message, 'retry_after': retry_after})
+        response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+@app.before_request
+def enforce_rate_limits():
+    """Refuser les rafales sur /oauth et /webhook avant tout appel amont"""
+    if not RATE_LIMIT_ENABLED or request.endpoint not in RATE_LIMITED_ENDPOINTS:
+        return None
+    wait = rate_limiter.check(client_key(request.remote_addr, request.headers.get('X-Forwarded-For')))
+    if not wait:
+        return None
+    REQUESTS_REJECTED.labels(request.endpoint, 'rate_limit').inc()
+    log(f"🚦 Limite de débit atteinte sur /{request.endpoint}", "warning", "🚦")
+    return too_many_requests("Trop de requêtes, réessayez plus tard", max(1, math.ceil(wait)))
+
+def metrics_payload():
+    """Exposition Prometheus (agrégation multi-workers si PROMETHEUS_MULTIPROC_DIR)"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Exposition Prometheus"""
+    response = make_response(metrics_payload())
+    response.headers['Content-Type'] = CONTENT_TYPE_LATEST
+    return response
+
 @app.route('/oauth', methods=['GET'])
 def oauth():
     """Démarrer le processus d'authentification TikTok"""
@@ -327,8 +2426,10 @@ def oauth():
         if debug_mode:
             log(f"   URL d'authentification: {auth_url}", "debug", "🔍")
         
-        # Retourner directement l'URL pour la popup
-        return jsonify({'redirect_url': auth_url})
+        remember_oauth_state(session, state)
+        
+        # Retourner l'URL pour la popup et le state pour suivre la fin du login (/auth/events)
+        return jsonify({'redirect_url': auth_url, 'state': state})
         
     except Exception as e:
         log(f"❌ Erreur lors de la création de l'URL d'authentification: {str(e)}", "error", "💥")
@@ -342,84 +2443,346 @@ def webhook():
     try:
         log("\n📨 Réception du webhook TikTok...")
         
-        # Récupérer le code d'autorisation
+        # Récupérer le code d'autorisation et le state de /oauth
         code = request.args.get('code')
+        state = request.args.get('state')
         if not code:
             log("❌ Code d'autorisation manquant", "error", "💥")
-            return render_template('close.html', success=False, message="Code d'autorisation manquant")
-        
-        # Appeler l'API TikTok pour échanger le code
-        token_data = call_tiktok_api(code)
-        if not token_data:
-            return render_template('close.html', success=False, message="Erreur lors de l'échange du code")
+            auth_events.publish(state, {'success': False, 'error': "Code d'autorisation manquant"})
+            return close_page(False, "Code d'autorisation manquant")
         
-        # Sauvegarder les données dans Supabase
-        save_to_database(token_data)
+        # Trop d'échanges en vol: refuser tout de suite plutôt que d'empiler les threads
+        with exchange_slots.slot() as admitted:
+            if not admitted:
+                REQUESTS_REJECTED.labels('webhook', 'upstream_saturated').inc()
+                log("🚦 Trop d'échanges en cours avec TikTok, webhook refusé", "warning", "🚦")
+                return too_many_requests("Service momentanément saturé, réessayez", 1, status=503)
+            
+            # Code déjà reçu (double clic, rechargement): pas de second échange avec TikTok
+            claimed, outcome = webhook_dedup.claim(code, state)
+            if not claimed:
+                log("♻️ Code d'autorisation déjà traité, réutilisation du résultat")
+                return webhook_response(outcome, state, replayed=True)
+            
+            # Appeler l'API TikTok pour échanger le code
+            token_data = None
+            try:
+                with timing_span('exchange'):
+                    token_data = call_tiktok_api(code)
+            finally:
+                # Les doublons en attente sont libérés dès la fin de l'échange
+                webhook_dedup.complete(code, exchange_outcome(token_data))
+            if not token_data:
+                auth_events.publish(state, {'success': False, 'error': "Erreur lors de l'échange du code"})
+                return close_page(False, "Erreur lors de l'échange du code")
+            
+            # Sauvegarder les données dans Supabase (en arrière-plan si activé)
+            # La page en attente sur /auth/events/<state> est notifiée dès la sauvegarde
+            if not (POST_LOGIN_ASYNC and post_login_pipeline.submit(token_data, state)):
+                save_to_database(token_data, state)
 
-        # Détecter si la requête vient d'un mobile (User-Agent)
-        user_agent = request.headers.get('User-Agent', '').lower()
-        is_mobile = any(device in user_agent for device in ['iphone', 'ipad', 'android', 'mobile'])
-        
-        if is_mobile:
-            # Sur mobile, rediriger vers la page principale
-            return redirect('/?code=success')
-        else:
-            # Sur desktop, afficher la page de confirmation qui se fermera
-            return render_template('close.html', success=True)
+        return webhook_response(exchange_outcome(token_data), state)
         
     except Exception as e:
         log(f"❌ Erreur lors du traitement du webhook: {str(e)}", "error", "💥")
         if debug_mode:
             log(traceback.format_exc(), "error", "🔍")
-        return render_template('close.html', success=False, message="Une erreur est survenue")
+        auth_events.publish(request.args.get('state'), {'success': False, 'error': "Une erreur est survenue"})
+        return close_page(False, "Une erreur est survenue")
+
+def remember_oauth_state(current_session, state):
+    """Mémoriser le state émis par /oauth dans la session signée (les OAUTH_STATES_MAX derniers)"""
+    states = [known for known in current_session.get('oauth_states', []) if known != state]
+    current_session['oauth_states'] = (states + [state])[-OAUTH_STATES_MAX:]
+
+def may_bind_session(current_session, state, replayed):
+    """Un code rejoué ne lie la session que si ce navigateur a lui-même obtenu le state via /oauth"""
+    return not replayed or (bool(state) and state in current_session.get('oauth_states', []))
+
+def webhook_response(outcome, state, replayed=False):
+    """Lier la session du navigateur à l'utilisateur et fermer la popup (page principale sur mobile)"""
+    if not outcome['success']:
+        return close_page(False, outcome['error'])
+    
+    # URL rejouée ailleurs (historique, lien partagé, logs): même page, mais aucune session
+    if may_bind_session(session, state, replayed):
+        session.permanent = True
+        session['open_id'] = outcome['open_id']
+    else:
+        log("⚠️ Code rejoué depuis un autre navigateur: session non liée", "warning", "⚠️")
+    
+    # Détecter si la requête vient d'un mobile (User-Agent)
+    user_agent = request.headers.get('User-Agent', '').lower()
+    is_mobile = any(device in user_agent for device in ['iphone', 'ipad', 'android', 'mobile'])
+    
+    if is_mobile:
+        # Sur mobile, rediriger vers la page principale qui écoute le résultat de ce state
+        if auth_events.is_valid_state(state):
+            return redirect(f'/?code=success&state={state}')
+        return redirect('/?code=success')
+    # Sur desktop, afficher la page de confirmation qui se fermera
+    return close_page(True)
+
+def sse_message(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+@app.route('/auth/events/<state>', methods=['GET'])
+def auth_event_stream(state):
+    """Server-Sent Events: un seul message quand le login de ce state est sauvegardé"""
+    if not auth_events.is_valid_state(state):
+        return jsonify({'error': 'state invalide'}), 404
+    if not auth_events.open_stream():
+        # Trop de connexions en attente: le client se rabat sur /user/profile
+        response = jsonify({'error': 'Trop de connexions en attente'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    
+    # Début de l'attente: renvoyé par EventSource à chaque reconnexion (Last-Event-ID)
+    now = time.time()
+    try:
+        started = float(request.headers.get('Last-Event-ID', now))
+    except ValueError:
+        started = now
+    started = min(max(started, now - AUTH_STREAM_TIMEOUT), now)
+    
+    def stream():
+        outcome = 'reconnects'
+        try:
+            # Reconnexion du navigateur après la fin de la fenêtre long-poll
+            yield f"retry: {AUTH_STREAM_RETRY_MS}\nid: {started:.3f}\n\n"
+            window_end = time.monotonic() + AUTH_STREAM_POLL
+            timeout_end = time.monotonic() + (started + AUTH_STREAM_TIMEOUT - time.time())
+            while True:
+                current = time.monotonic()
+                if current >= timeout_end:
+                    outcome = 'timeouts'
+                    yield sse_message('timeout', {})
+                    return
+                if current >= window_end:
+                    # Thread rendu au serveur; EventSource rouvre la connexion après retry ms
+                    return
+                payload = auth_events.wait(state, min(AUTH_STREAM_HEARTBEAT, window_end - current, timeout_end - current))
+                if payload is not None:
+                    outcome = 'delivered'
+                    yield sse_message('auth', payload)
+                    return
+                # Commentaire SSE: garde la connexion ouverte à travers les proxys
+                yield ": keep-alive\n\n"
+        finally:
+            auth_events.close_stream(outcome)
+    
+    # Démarrer le générateur tout de suite: son finally libère la place même si le client
+    # se déconnecte avant le premier envoi
+    events = stream()
+    first = next(events)
+    return Response(itertools.chain([first], events), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no'
+    })
+
+_readiness_cache = {'result': None, 'expires_at': 0.0}
+_readiness_lock = threading.Lock()
+
+def probe_database():
+    """Tester Supabase avec un comptage côté serveur, résultat partagé pendant HEALTH_CACHE_TTL"""
+    cached = _readiness_cache['result']
+    if cached is not None and time.monotonic() < _readiness_cache['expires_at']:
+        return cached
+    
+    # Une seule requête à la fois: les sondes concurrentes réutilisent son résultat
+    with _readiness_lock:
+        cached = _readiness_cache['result']
+        if cached is not None and time.monotonic() < _readiness_cache['expires_at']:
+            return cached
+        
+        try:
+            if debug_mode:
+                log("   Test de connexion Supabase...", "debug", "🔍")
+            
+            # Comptage côté serveur (en-tête Content-Range), une seule ligne transférée
+            probe = {
+                'status': 'connected',
+                'token_count': token_store.count(),
+                'checked_at': datetime.now().isoformat()
+            }
+            
+            if debug_mode:
+                log(f"   Nombre de tokens ({HEALTH_COUNT_METHOD}): {probe['token_count']}", "debug", "🔍")
+                
+        except Exception as e:
+            log(f"❌ Erreur connexion Supabase: {str(e)}", "error", "💥")
+            if debug_mode:
+                log("   Traceback complet:", "error", "🔍")
+                log(traceback.format_exc(), "error", "🔍")
+            probe = {
+                'status': 'error',
+                'token_count': -1,
+                'checked_at': datetime.now().isoformat()
+            }
+        
+        _readiness_cache['result'] = probe
+        _readiness_cache['expires_at'] = time.monotonic() + HEALTH_CACHE_TTL
+        return probe
+
+@app.route('/health/live', methods=['GET'])
+def liveness_check():
+    """Sonde de vivacité: ne touche jamais la base de données"""
+    return jsonify({
+        'status': 'alive',
+        'timestamp': datetime.now().isoformat()
+    }), 200
+
+@app.route('/health/ready', methods=['GET'])
+def readiness_check():
+    """Sonde de disponibilité: 503 si Supabase est injoignable"""
+    probe = probe_database()
+    ready = probe['status'] == 'connected'
+    return jsonify({
+        'status': 'ready' if ready else 'unavailable',
+        'database': probe
+    }), 200 if ready else 503
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Endpoint de santé pour vérifier que l'API fonctionne"""
     log("\n💓 Health check appelé")
-    try:
-        if debug_mode:
-            log("   Test de connexion Supabase...", "debug", "🔍")
-        
-        # Test rapide de connexion Supabase
-        result = supabase.table('tiktok_tokens').select('count').execute()
-        db_status = "connected"
-        token_count = len(result.data) if result.data else 0
-        
-        if debug_mode:
-            log(f"   Nombre de tokens: {token_count}", "debug", "🔍")
-            
-    except Exception as e:
-        log(f"❌ Erreur connexion Supabase: {str(e)}", "error", "💥")
-        if debug_mode:
-            log("   Traceback complet:", "error", "🔍")
-            import traceback
-            log(traceback.format_exc(), "error", "🔍")
-        db_status = "error"
-        token_count = -1
+    probe = probe_database()
     
     response = {
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
         'service': 'TikTok API Webhook',
         'database': {
-            'status': db_status,
-            'token_count': token_count
+            'status': probe['status'],
+            'token_count': probe['token_count']
         },
+        'post_login_queue': post_login_pipeline.stats(),
+        'profile_cache': profile_cache.stats(),
+        'token_refresh': token_refresh_scheduler.stats(),
+        'creator_sync': creator_sync_job.stats(),
+        'log_rate_limiter': log_rate_limiter.stats(),
+        'token_store': token_store.stats(),
+        'auth_events': auth_events.stats(),
+        'webhook_dedup': webhook_dedup.stats(),
+        'rate_limits': {**rate_limiter.stats(), 'enabled': RATE_LIMIT_ENABLED, 'upstream': exchange_slots.stats()},
+        'startup': startup_timings,
+        'circuit_breakers': {name: breaker.stats() for name, breaker in circuit_breakers.items()},
+        'tls': tls_stats(),
         'debug_mode': debug_mode
     }
     
-    if debug_mode:
-        log(f"   Réponse: {json.dumps(response, indent=2)}", "debug", "🔍")
+    log(lambda: f"   Réponse: {json.dumps(response, indent=2)}", "debug", "🔍")
     return jsonify(response), 200
 
+# Front statique: pages pré-rendues et assets nommés par leur contenu, précompressés
+STATIC_ASSETS = ('css/app.css', 'js/app.js')
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+CLOSE_PAGE_MESSAGES = (
+    "Code d'autorisation manquant",
+    "Erreur lors de l'échange du code",
+    "Une erreur est survenue",
+    "Trop de requêtes, réessayez plus tard",
+    "Service momentanément saturé, réessayez",
+    WebhookDeduplicator.REJECTED['error'],
+    WebhookDeduplicator.IN_PROGRESS['error']
+)
+# Variante servie pour un message d'échec sans page pré-rendue
+CLOSE_PAGE_FALLBACK = "Une erreur est survenue"
+
+class PrecompressedBody:
+    """Corps de réponse figé, avec ses variantes gzip/brotli et un ETag fort par variante"""
+
+    def __init__(self, body, content_type):
+        self.content_type = content_type
+        self.digest = hashlib.sha256(body).hexdigest()
+        self.variants = {'identity': body}
+        compressed = {'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+        try:
+            # Dépendance optionnelle: sans brotli, seules les variantes gzip sont servies
+            import brotli
+            compressed['br'] = brotli.compress(body, quality=11)
+        except ImportError:
+            pass
+        for encoding, data in compressed.items():
+            if len(data) < len(body):
+                self.variants[encoding] = data
+
+    def negotiate(self, accept_encodings, if_none_match, cache_control):
+        """(status, corps, en-têtes): variante la plus compacte acceptée, 304 si l'ETag correspond"""
+        encoding = 'identity'
+        for candidate in ('br', 'gzip'):
+            if candidate in self.variants and accept_encodings[candidate] > 0:
+                encoding = candidate
+                break
+        etag = self.digest[:32] if encoding == 'identity' else f"{self.digest[:32]}-{encoding}"
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+        if if_none_match.contains(etag):
+            return 304, b'', headers
+        headers['Content-Type'] = self.content_type
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return 200, self.variants[encoding], headers
+
+    def response(self, cache_control):
+        """Réponse Flask pour la requête courante"""
+        status, body, headers = self.negotiate(request.accept_encodings, request.if_none_match, cache_control)
+        response = make_response(body, status)
+        response.headers.update(headers)
+        return response
+
+class Frontend:
+    """Pages et assets construits une fois par processus pour la configuration courante"""
+
+    def __init__(self):
+        self.assets = {}
+        urls = {}
+        for path in STATIC_ASSETS:
+            with open(os.path.join(app.static_folder, path), 'rb') as f:
+                asset = PrecompressedBody(f.read(), f"{mimetypes.guess_type(path)[0]}; charset=utf-8")
+            stem, extension = os.path.splitext(os.path.basename(path))
+            name = f"{stem}.{asset.digest[:12]}{extension}"
+            self.assets[name] = asset
+            urls[path] = f"/assets/{name}"
+        
+        html = 'text/html; charset=utf-8'
+        with app.app_context():
+            self.index = PrecompressedBody(render_template(
+                'index.html',
+                asset_url=urls.__getitem__,
+                debug_mode=debug_mode,
+                redirect_uri=TIKTOK_REDIRECT_URI
+            ).encode('utf-8'), html)
+            self.close_pages = {(True, None): PrecompressedBody(
+                render_template('close.html', success=True).encode('utf-8'), html)}
+            for message in CLOSE_PAGE_MESSAGES:
+                self.close_pages[(False, message)] = PrecompressedBody(
+                    render_template('close.html', success=False, message=message).encode('utf-8'), html)
+
+    def close_page(self, success, message=None):
+        if success:
+            return self.close_pages[(True, None)]
+        return self.close_pages.get((False, message)) or self.close_pages[(False, CLOSE_PAGE_FALLBACK)]
+
+frontend = LazyResource('frontend', Frontend)
+
+def close_page(success, message=None):
+    """Page de fin d'authentification (non cachable: elle pose le cookie de session)"""
+    return frontend.close_page(success, message).response('no-store')
+
 @app.route('/', methods=['GET'])
 def home():
     """Page d'accueil avec bouton de connexion TikTok"""
     log("\n🏠 Page d'accueil appelée")
-    return render_template('index.html', 
-                         debug_mode=debug_mode,
-                         redirect_uri=TIKTOK_REDIRECT_URI)
+    # Pré-rendue: revalidation par ETag à chaque visite, 304 si le déploiement n'a pas changé
+    return frontend.index.response('no-cache')
+
+@app.route('/assets/<name>', methods=['GET'])
+def static_asset(name):
+    """Assets nommés par leur hash: immuables, précompressés"""
+    asset = frontend.assets.get(name)
+    if asset is None:
+        return jsonify({'error': 'Not Found'}), 404
+    return asset.response(ASSET_CACHE_CONTROL)
 
 def get_user_profile(access_token):
     """Récupérer les informations du profil utilisateur TikTok"""
@@ -431,14 +2794,12 @@ def get_user_profile(access_token):
             'Content-Type': 'application/json'
         }
         
-        url = 'https://open.tiktokapis.com/v2/user/info/'
-        response = requests.get(url, headers=headers)
+        response = tiktok_request('user_info', 'GET', TIKTOK_USER_INFO_URL, headers=headers)
         response.raise_for_status()
         
         user_data = response.json()
         
-        if debug_mode:
-            log(f"   Données utilisateur: {json.dumps(user_data, indent=2)}", "debug", "🔍")
+        log(lambda: f"   Données utilisateur: {json.dumps(user_data, indent=2)}", "debug", "🔍")
         
         return user_data.get('data', {})
     except Exception as e:
@@ -447,38 +2808,72 @@ def get_user_profile(access_token):
             log(traceback.format_exc(), "error", "🔍")
         return None
 
+UNAUTHENTICATED_RESPONSE = {
+    'success': False,
+    'error': 'Non authentifié'
+}
+
+def load_profile(open_id):
+    """Lire le profil actif d'un utilisateur; retourne (données, status, cacheable)"""
+    token_data = token_store.fetch_active(open_id)
+    
+    if token_data is None and post_login_pipeline.is_pending(open_id):
+        # Login reçu mais pas encore persisté: l'utilisateur est bien connecté
+        log("⏳ Profil en cours d'enrichissement", "info", "⏳")
+        return {
+            'success': True,
+            'pending': True,
+            'nickname': '',
+            'avatar_url': ''
+        }, 200, False
+    
+    if token_data is None:
+        log("❌ Aucun token actif trouvé", "warning", "⚠️")
+        # Jamais mis en cache: la sauvegarde d'un login peut encore être en cours dans un autre worker
+        return UNAUTHENTICATED_RESPONSE, 401, False
+    
+    # Construire la réponse avec les données déjà en base
+    return {
+        'success': True,
+        'nickname': token_data.get('creator_nickname', ''),
+        'avatar_url': token_data.get('creator_avatar_url', '')
+    }, 200, True
+
 @app.route('/user/profile', methods=['GET'])
 def get_profile():
     """Endpoint pour récupérer le profil de l'utilisateur connecté"""
     try:
         log("\n🎯 Requête de profil utilisateur reçue")
         
-        # Récupérer le dernier token actif avec les informations du créateur
-        result = supabase.table('tiktok_tokens') \
-            .select('*, creator_nickname, creator_avatar_url') \
-            .eq('is_active', True) \
-            .order('created_at', desc=True) \
-            .limit(1) \
-            .execute()
+        open_id = session.get('open_id')
+        if not open_id:
+            log("❌ Aucune session active", "warning", "⚠️")
+            return jsonify(UNAUTHENTICATED_RESPONSE), 401
         
-        if not result.data:
-            log("❌ Aucun token actif trouvé", "warning", "⚠️")
-            return jsonify({
-                'success': False,
-                'error': 'Non authentifié'
-            }), 401
+        cached = profile_cache.get(open_id)
+        if cached is None:
+            response_data, status, cacheable = load_profile(open_id)
+            body = json.dumps(response_data, sort_keys=True)
+            etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+            cached = (response_data, status, etag)
+            if cacheable:
+                profile_cache.set(open_id, cached)
+        elif debug_mode:
+            log("   Profil servi depuis le cache", "debug", "🔍")
         
-        token_data = result.data[0]
+        response_data, status, etag = cached
         
-        # Construire la réponse avec les données déjà en base
-        response_data = {
-            'success': True,
-            'nickname': token_data.get('creator_nickname', ''),
-            'avatar_url': token_data.get('creator_avatar_url', '')
-        }
+        # Revalidation navigateur: 304 sans toucher la base
+        if status == 200 and request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(jsonify(response_data), status)
+            if status == 200:
+                log("✅ Profil utilisateur récupéré avec succès", "info", "🎉")
         
-        log("✅ Profil utilisateur récupéré avec succès", "info", "🎉")
-        return jsonify(response_data)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
         
     except Exception as e:
         log(f"❌ Erreur lors de la récupération du profil: {str(e)}", "error", "💥")
@@ -493,11 +2888,11 @@ def logout():
     try:
         log("\n🚪 Requête de déconnexion reçue")
         
-        # Désactiver tous les tokens actifs
-        result = supabase.table('tiktok_tokens') \
-            .update({'is_active': False}) \
-            .eq('is_active', True) \
-            .execute()
+        open_id = session.pop('open_id', None)
+        if open_id:
+            # Désactiver uniquement le(s) token(s) actif(s) de cet utilisateur
+            token_store.deactivate(open_id)
+            profile_cache.invalidate(open_id)
         
         log("✅ Déconnexion réussie", "info", "🔓")
         return jsonify({
@@ -512,7 +2907,58 @@ def logout():
             'error': 'Erreur serveur'
         }), 500
 
+def create_app(workers=1):
+    """Préparer l'application pour le processus courant et la retourner
+
+    À appeler une fois par processus, après fork pour les workers Gunicorn
+    (`app:create_app(workers=N)`). Les clients Supabase, HTTP et base de données sont
+    créés au premier usage. Lève RuntimeError si la configuration est incomplète,
+    ou si FLASK_SECRET_KEY manque alors que plusieurs workers se partagent les cookies.
+    """
+    started = time.perf_counter()
+    ensure_logging()
+    log("🔧 Démarrage de l'application")
+    
+    missing_vars = missing_config()
+    if missing_vars:
+        log(f"❌ Erreur: Variables d'environnement manquantes: {', '.join(missing_vars)}", "error", "💥")
+        log("ℹ️ Assurez-vous d'avoir créé un fichier .env à partir de env_example.txt", "info", "💡")
+        raise RuntimeError(f"Variables d'environnement manquantes: {', '.join(missing_vars)}")
+    
+    if EPHEMERAL_SECRET_KEY and workers > 1:
+        # Chaque worker tirerait sa propre clé: un cookie signé par l'un est refusé par les autres
+        log(f"❌ Erreur: FLASK_SECRET_KEY est requis avec {workers} workers", "error", "💥")
+        raise RuntimeError("FLASK_SECRET_KEY manquant: clé de session différente dans chaque worker")
+    if EPHEMERAL_SECRET_KEY:
+        log("⚠️ FLASK_SECRET_KEY non défini: clé aléatoire propre à ce processus, sessions perdues au redémarrage", "warning", "⚠️")
+    log(f"📊 Configuration Supabase: URL={SUPABASE_URL}")
+    
+    # Pages et assets pré-rendus avant la première requête
+    frontend.resolve()
+    
+    startup_timings['create_app_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    log(f"⏱️ Import en {startup_timings['import_ms']} ms, create_app en {startup_timings['create_app_ms']} ms", "info", "⏱️")
+    return app
+
+def start_background_services(run_scheduler=True, run_creator_sync=True):
+    """Démarrer les services d'arrière-plan du processus (préchauffage, planificateurs)"""
+    if HTTP_WARMUP:
+        warmup_http_pool()
+    
+    if TOKEN_REFRESH_ENABLED and run_scheduler:
+        token_refresh_scheduler.start()
+    
+    if CREATOR_SYNC_ENABLED and run_creator_sync:
+        creator_sync_job.start()
+
+startup_timings['import_ms'] = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 1)
+
 if __name__ == '__main__':
+    try:
+        create_app()
+    except RuntimeError:
+        sys.exit(1)
+    
     log("\n🚀 Démarrage de l'API TikTok Webhook")
     port = int(os.getenv('PORT', 5000))
     
@@ -524,10 +2970,12 @@ if __name__ == '__main__':
     if debug_mode:
         log("\n🔍 Mode DEBUG activé - Logs détaillés activés", "debug", "🔍")
     
+    start_background_services()
+    
     log("\n⏳ Démarrage du serveur...")
     
-    # Configuration SSL
-    ssl_context = ('certs/cert.pem', 'certs/key.pem')
+    # Configuration SSL: contexte unique (reprise de session), certificat relu à chaud
+    ssl_context = ReloadingTLSContext().listener
     
     # Démarrage du serveur en mode HTTPS
     app.run(
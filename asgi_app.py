@@ -0,0 +1,750 @@
+# -*- coding: utf-8 -*-
+"""Variante ASGI (Quart) du service webhook TikTok
+
+Mêmes routes, mêmes templates et mêmes contrats JSON que app.py, mais les appels
+vers TikTok (httpx) et Supabase (PostgREST asynchrone) ne bloquent aucun thread:
+un seul processus peut garder des milliers d'échanges OAuth en vol.
+
+Lancement: hypercorn asgi_app:asgi_app --bind 0.0.0.0:5000 --certfile certs/cert.pem --keyfile certs/key.pem
+"""
+from quart import Quart, request, jsonify, make_response, redirect, session, g, has_request_context
+import asyncio
+import hashlib
+import json
+import math
+import os
+import secrets
+import time
+import traceback
+from datetime import datetime
+
+import httpx
+from postgrest import AsyncPostgrestClient
+
+from tls import ReloadingTLSContext, tls_stats
+
+from app import (
+    log, debug_mode, build_token_row, is_missing_function_error, TTLCache,
+    SUPABASE_URL, SUPABASE_KEY, FLASK_SECRET_KEY,
+    TIKTOK_AUTH_URL, TIKTOK_API_URL, TIKTOK_CLIENT_KEY, TIKTOK_CLIENT_SECRET, TIKTOK_REDIRECT_URI,
+    TIKTOK_CREATOR_INFO_URL, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT,
+    POST_LOGIN_ASYNC, UPSTREAM_STEP_DEADLINE, TOKEN_UPSERT_RPC,
+    HEALTH_COUNT_METHOD, HEALTH_CACHE_TTL, PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL,
+    UNAUTHENTICATED_RESPONSE, missing_config, frontend, ASSET_CACHE_CONTROL,
+    auth_events, auth_result, sse_message, AUTH_STREAM_TIMEOUT, AUTH_STREAM_HEARTBEAT,
+    REQUEST_BUDGET, WEBHOOK_DEDUP_SIZE, WEBHOOK_DEDUP_TTL, WebhookDeduplicator, exchange_outcome,
+    RateLimiter, ConcurrencyLimiter, client_key, RATE_LIMIT_ENABLED, RATE_LIMITED_ENDPOINTS,
+    RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST, RATE_LIMIT_GLOBAL_RATE, RATE_LIMIT_GLOBAL_BURST,
+    RATE_LIMIT_MAX_CLIENTS, remember_oauth_state, may_bind_session,
+    upstream_guard, circuit_breakers, CircuitBreaker, DeadlineExceeded, request_deadline, remaining_budget,
+    budget_timeout, bound_postgrest_timeout, timing_span, observe_request, metrics_payload, CONTENT_TYPE_LATEST,
+    REQUESTS_REJECTED, HTTP_MAX_RETRIES, HTTP_RETRY_BACKOFF, IDEMPOTENT_POST_URLS, CREATOR_INFO_MIN_BUDGET,
+    SERVER_TIMING_ENABLED, POST_LOGIN_WORKERS, POST_LOGIN_QUEUE_SIZE, POST_LOGIN_ENQUEUE_TIMEOUT,
+    POST_LOGIN_DRAIN_TIMEOUT
+)
+
+# Limites du client HTTP asynchrone (connexions simultanées vers TikTok)
+ASGI_HTTP_MAX_CONNECTIONS = int(os.getenv('ASGI_HTTP_MAX_CONNECTIONS', 1000))
+ASGI_HTTP_MAX_KEEPALIVE = int(os.getenv('ASGI_HTTP_MAX_KEEPALIVE', 100))
+# Échanges de code simultanés: des coroutines, bornées par le pool httpx plutôt que par des threads
+ASGI_UPSTREAM_MAX_INFLIGHT = int(os.getenv('ASGI_UPSTREAM_MAX_INFLIGHT', ASGI_HTTP_MAX_CONNECTIONS))
+# Connexions SSE en attente: une coroutine chacune, sans thread bloqué
+ASGI_AUTH_STREAM_MAX = int(os.getenv('ASGI_AUTH_STREAM_MAX', 10000))
+# Réponses TikTok retentées (mêmes règles que http_retry dans app.py)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+asgi_app = Quart(__name__)
+asgi_app.config.update(
+    SECRET_KEY=FLASK_SECRET_KEY,
+    SESSION_COOKIE_SECURE=True,
+    SESSION_COOKIE_HTTPONLY=True,
+    SESSION_COOKIE_SAMESITE='Lax'
+)
+
+# Clients créés au démarrage de la boucle d'événements
+clients = {'http': None, 'db': None}
+profile_cache = TTLCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
+pending_logins = set()
+auth_waiters = {}
+auth_stream_stats = {'open_streams': 0, 'rejected': 0}
+# Codes d'autorisation déjà reçus: clé -> (empreinte du state, résultat); échanges en vol -> Future
+webhook_outcomes = TTLCache(WEBHOOK_DEDUP_SIZE, WEBHOOK_DEDUP_TTL)
+webhook_inflight = {}
+# Admission sur /oauth et /webhook (mêmes réglages que app.py, état propre à ce processus)
+rate_limiter = RateLimiter(RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST, RATE_LIMIT_GLOBAL_RATE,
+                           RATE_LIMIT_GLOBAL_BURST, RATE_LIMIT_MAX_CLIENTS)
+exchange_slots = ConcurrencyLimiter(ASGI_UPSTREAM_MAX_INFLIGHT)
+_token_upsert_rpc_state = {'available': bool(TOKEN_UPSERT_RPC)}
+_readiness_cache = {'result': None, 'expires_at': 0.0}
+_readiness_lock = asyncio.Lock()
+
+class PostLoginQueue:
+    """File post-login bornée (POST_LOGIN_QUEUE_SIZE), vidée par POST_LOGIN_WORKERS tâches
+
+    Équivalent asynchrone de PostLoginPipeline: file pleine au-delà de
+    POST_LOGIN_ENQUEUE_TIMEOUT, la sauvegarde se fait dans la requête.
+    """
+
+    def __init__(self, workers, maxsize):
+        self.workers = workers
+        self.maxsize = maxsize
+        self.queue = None
+        self._tasks = []
+
+    def start(self):
+        """Démarrer les tâches dans la boucle d'événements du serveur"""
+        self.queue = asyncio.Queue(self.maxsize)
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+        log(f"🧵 File post-login démarrée ({self.workers} tâches, capacité {self.maxsize})")
+
+    async def submit(self, token_data, state=None):
+        """Mettre en file un login; retourne False si la file reste pleine (backpressure)"""
+        if self.queue is None:
+            return False
+        try:
+            await asyncio.wait_for(self.queue.put((token_data, state)), POST_LOGIN_ENQUEUE_TIMEOUT)
+            return True
+        except asyncio.TimeoutError:
+            log(f"⚠️ File post-login pleine ({self.maxsize}), traitement synchrone", "warning", "⚠️")
+            return False
+
+    async def _run(self):
+        while True:
+            token_data, state = await self.queue.get()
+            try:
+                await save_to_database(token_data, state)
+            except Exception as e:
+                log(f"❌ Erreur dans le pipeline post-login: {str(e)}", "error", "💥")
+            finally:
+                self.queue.task_done()
+
+    async def shutdown(self, timeout=POST_LOGIN_DRAIN_TIMEOUT):
+        """Vider la file avant l'arrêt du serveur"""
+        if self.queue is None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            log(f"⚠️ File post-login arrêtée avec {self.queue.qsize()} login(s) non traités", "warning", "⚠️")
+        for task in self._tasks:
+            task.cancel()
+
+    def stats(self):
+        return {
+            'enabled': POST_LOGIN_ASYNC,
+            'depth': self.queue.qsize() if self.queue is not None else 0,
+            'pending': len(pending_logins),
+            'capacity': self.maxsize,
+            'workers': len(self._tasks)
+        }
+
+post_login_queue = PostLoginQueue(POST_LOGIN_WORKERS, POST_LOGIN_QUEUE_SIZE)
+
+async def bound_db_timeout(request):
+    """Hook httpx asynchrone: timeout PostgREST borné par le budget restant (voir app.py)"""
+    bound_postgrest_timeout(request)
+
+@asgi_app.before_serving
+async def open_clients():
+    """Créer le client HTTP et le client PostgREST asynchrones"""
+    missing_vars = missing_config()
+    if missing_vars:
+        log(f"❌ Erreur: Variables d'environnement manquantes: {', '.join(missing_vars)}", "error", "💥")
+        raise RuntimeError(f"Variables d'environnement manquantes: {', '.join(missing_vars)}")
+    clients['http'] = httpx.AsyncClient(
+        timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=ASGI_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=ASGI_HTTP_MAX_KEEPALIVE
+        )
+    )
+    clients['db'] = AsyncPostgrestClient(
+        f"{SUPABASE_URL}/rest/v1",
+        headers={
+            'apikey': SUPABASE_KEY,
+            'Authorization': f'Bearer {SUPABASE_KEY}'
+        }
+    )
+    clients['db'].session.event_hooks['request'].append(bound_db_timeout)
+    if POST_LOGIN_ASYNC:
+        post_login_queue.start()
+    frontend.resolve()
+    log("⚡ Clients asynchrones HTTP et PostgREST prêts")
+
+@asgi_app.after_serving
+async def close_clients():
+    """Vider la file post-login puis fermer proprement les clients asynchrones"""
+    await post_login_queue.shutdown()
+    if clients['http'] is not None:
+        await clients['http'].aclose()
+    if clients['db'] is not None:
+        await clients['db'].aclose()
+
+def tokens_table():
+    return clients['db'].from_('tiktok_tokens')
+
+async def db_execute(operation, query):
+    """Exécuter une requête PostgREST derrière le disjoncteur Supabase"""
+    with upstream_guard('supabase', operation):
+        return await query.execute()
+
+def request_spans():
+    """Spans Server-Timing de la requête courante, ou None (désactivé, tâche de fond)"""
+    if not SERVER_TIMING_ENABLED or not has_request_context():
+        return None
+    return g.setdefault('timings', [])
+
+async def timed(name, timings, awaitable):
+    """Attendre awaitable dans un span Server-Timing"""
+    with timing_span(name, timings):
+        return await awaitable
+
+async def retry_pause(retry):
+    """Attendre avant le retry n° retry; False si HTTP_MAX_RETRIES ou le budget l'interdisent"""
+    if retry > HTTP_MAX_RETRIES:
+        return False
+    # Même progression qu'urllib3: premier retry immédiat, puis backoff exponentiel
+    backoff = HTTP_RETRY_BACKOFF * 2 ** (retry - 1) if retry > 1 else 0
+    remaining = remaining_budget()
+    if remaining is not None and remaining <= backoff:
+        return False
+    await asyncio.sleep(backoff)
+    return True
+
+async def tiktok_request(operation, method, url, **kwargs):
+    """Appel TikTok: disjoncteur, timeouts bornés par le budget et retries de http_retry
+
+    Les erreurs de connexion sont retentées pour toutes les méthodes; les 429/5xx et
+    timeouts de lecture seulement pour GET/HEAD et les POST idempotents.
+    """
+    replayable = method in ('GET', 'HEAD') or url in IDEMPOTENT_POST_URLS
+    retry = 0
+    with upstream_guard('tiktok', operation) as call:
+        while True:
+            retry += 1
+            connect, read = budget_timeout()
+            try:
+                response = await clients['http'].request(
+                    method, url, timeout=httpx.Timeout(read, connect=connect), **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if not await retry_pause(retry):
+                    raise
+                continue
+            except httpx.ReadTimeout:
+                if not (replayable and await retry_pause(retry)):
+                    raise
+                continue
+            if not (replayable and response.status_code in RETRY_STATUSES and await retry_pause(retry)):
+                break
+        call['status'] = response.status_code
+    return response
+
+async def get_creator_info(access_token):
+    """Récupérer les informations du créateur TikTok"""
+    try:
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json; charset=UTF-8'
+        }
+        response = await tiktok_request('creator_info', 'POST', TIKTOK_CREATOR_INFO_URL, headers=headers)
+        response.raise_for_status()
+        creator_data = response.json()
+
+        if creator_data.get('error', {}).get('code') == 'ok':
+            return creator_data
+        log(f"❌ Erreur API TikTok: {creator_data.get('error', {}).get('message')}", "error", "💥")
+        return None
+    except Exception as e:
+        log(f"❌ Erreur lors de la récupération des informations créateur: {str(e)}", "error", "💥")
+        return None
+
+async def deactivate_tokens(open_id):
+    """Désactiver les anciens tokens d'un utilisateur"""
+    await db_execute('tiktok_tokens.deactivate', tokens_table().update({'is_active': False})
+                     .eq('open_id', open_id)
+                     .eq('is_active', True))
+
+async def upsert_token(insert_data, deactivated=False):
+    """Désactiver les anciens tokens et insérer le nouveau en un seul aller-retour si possible"""
+    if _token_upsert_rpc_state['available']:
+        try:
+            # AsyncPostgrestClient.rpc est une coroutine qui retourne le builder (postgrest 0.10)
+            builder = await clients['db'].rpc(TOKEN_UPSERT_RPC, {'token': insert_data})
+            return await db_execute(f'rpc.{TOKEN_UPSERT_RPC}', builder)
+        except Exception as e:
+            if not is_missing_function_error(e):
+                raise
+            _token_upsert_rpc_state['available'] = False
+            log(f"⚠️ Fonction {TOKEN_UPSERT_RPC} absente, retour au mode désactivation + insertion", "warning", "⚠️")
+
+    if not deactivated:
+        await deactivate_tokens(insert_data.get('open_id'))
+    return await db_execute('tiktok_tokens.insert', tokens_table().insert(insert_data))
+
+def publish_auth(state, payload):
+    """Publier le résultat d'un login et réveiller les connexions SSE de ce processus"""
+    auth_events.publish(state, payload)
+    waiter = auth_waiters.get(state)
+    if waiter is not None:
+        waiter['event'].set()
+
+async def save_to_database(token_data, state=None):
+    """Sauvegarder les données du token et les informations du créateur dans Supabase"""
+    open_id = token_data.get('open_id')
+    try:
+        step_deadline = UPSTREAM_STEP_DEADLINE
+        remaining = remaining_budget()
+        if remaining is not None:
+            step_deadline = min(step_deadline, remaining - CREATOR_INFO_MIN_BUDGET / 2)
+        timings = request_spans()
+
+        # Enrichissement optionnel: ignoré si le budget est trop juste ou TikTok en panne
+        creator_task = None
+        if remaining is not None and remaining < CREATOR_INFO_MIN_BUDGET:
+            log(f"⏭️ Budget restant {remaining:.1f}s: enrichissement créateur ignoré", "warning", "⚠️")
+        elif circuit_breakers['tiktok'].state == CircuitBreaker.OPEN:
+            log("⏭️ Disjoncteur TikTok ouvert: enrichissement créateur ignoré", "warning", "⚠️")
+        else:
+            creator_task = asyncio.ensure_future(
+                timed('creator_info', timings, get_creator_info(token_data.get('access_token'))))
+        deactivated = False
+        if not _token_upsert_rpc_state['available']:
+            await timed('deactivate', timings, deactivate_tokens(open_id))
+            deactivated = True
+
+        # Les informations créateur sont optionnelles: on n'attend que jusqu'à l'échéance
+        creator_info = None
+        if creator_task is not None:
+            try:
+                creator_info = await asyncio.wait_for(creator_task, timeout=max(0, step_deadline))
+            except asyncio.TimeoutError:
+                log(f"⏱️ Informations créateur non reçues après {step_deadline:.1f}s, insertion sans enrichissement", "warning", "⚠️")
+
+        insert_data = build_token_row(token_data, creator_info)
+        await timed('insert', timings, upsert_token(insert_data, deactivated=deactivated))
+        profile_cache.invalidate(open_id)
+        log("✅ Données insérées dans Supabase avec succès")
+        if state:
+            publish_auth(state, auth_result(insert_data))
+        return True
+    except Exception as e:
+        log(f"❌ ERREUR Supabase: {str(e)}", "error", "💥")
+        if debug_mode:
+            log(traceback.format_exc(), "error", "🔍")
+        if state:
+            publish_auth(state, {'success': False, 'error': "Erreur lors de la sauvegarde"})
+        return False
+    finally:
+        pending_logins.discard(open_id)
+
+async def call_tiktok_api(code):
+    """Appeler l'API TikTok pour obtenir le token d'accès"""
+    try:
+        headers = {
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Cache-Control': 'no-cache'
+        }
+        data = {
+            'client_key': TIKTOK_CLIENT_KEY,
+            'client_secret': TIKTOK_CLIENT_SECRET,
+            'code': code,
+            'grant_type': 'authorization_code',
+            'redirect_uri': TIKTOK_REDIRECT_URI
+        }
+        response = await tiktok_request('oauth_token', 'POST', TIKTOK_API_URL, headers=headers, data=data)
+        log(f"📥 Réponse reçue: Status {response.status_code}")
+
+        if response.status_code == 200:
+            token_data = response.json()
+            log("✅ Token obtenu avec succès")
+            return token_data
+
+        log(f"❌ Erreur API: {response.status_code}", "error", "💥")
+        log(f"   Réponse: {response.text}", "error", "💥")
+        return None
+    except Exception as e:
+        log(f"❌ ERREUR API: {str(e)}", "error", "💥")
+        return None
+
+async def too_many_requests(message, retry_after, status=429):
+    """Refus d'admission: JSON pour /oauth, page de fermeture pour /webhook (popup)"""
+    if request.endpoint == 'webhook':
+        publish_auth(request.args.get('state'), {'success': False, 'error': message})
+        response = await close_page(False, message)
+        response.status_code = status
+    else:
+        response = jsonify({'error': message, 'retry_after': retry_after})
+        response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+@asgi_app.before_request
+async def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.deadline_token = request_deadline.set(time.monotonic() + REQUEST_BUDGET)
+
+@asgi_app.after_request
+async def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        server_timing = observe_request(request.url_rule, request.method, response.status_code,
+                                        time.perf_counter() - started, g.get('timings'))
+        if server_timing is not None:
+            response.headers['Server-Timing'] = server_timing
+    return response
+
+@asgi_app.teardown_request
+async def reset_request_deadline(exc):
+    token = g.pop('deadline_token', None)
+    if token is not None:
+        request_deadline.reset(token)
+
+@asgi_app.before_request
+async def enforce_rate_limits():
+    """Refuser les rafales sur /oauth et /webhook avant tout appel amont"""
+    if not RATE_LIMIT_ENABLED or request.endpoint not in RATE_LIMITED_ENDPOINTS:
+        return None
+    wait = rate_limiter.check(client_key(request.remote_addr, request.headers.get('X-Forwarded-For')))
+    if not wait:
+        return None
+    REQUESTS_REJECTED.labels(request.endpoint, 'rate_limit').inc()
+    log(f"🚦 Limite de débit atteinte sur /{request.endpoint}", "warning", "🚦")
+    return await too_many_requests("Trop de requêtes, réessayez plus tard", max(1, math.ceil(wait)))
+
+@asgi_app.route('/metrics', methods=['GET'])
+async def metrics():
+    """Exposition Prometheus (mêmes métriques qu'app.py)"""
+    return await make_response(metrics_payload(), 200, {'Content-Type': CONTENT_TYPE_LATEST})
+
+@asgi_app.route('/oauth', methods=['GET'])
+async def oauth():
+    """Démarrer le processus d'authentification TikTok"""
+    state = secrets.token_urlsafe(32)
+    auth_params = {
+        'client_key': TIKTOK_CLIENT_KEY,
+        'response_type': 'code',
+        'scope': 'user.info.basic',
+        'redirect_uri': TIKTOK_REDIRECT_URI,
+        'state': state
+    }
+    auth_url = f"{TIKTOK_AUTH_URL}?{'&'.join(f'{k}={v}' for k, v in auth_params.items())}"
+    remember_oauth_state(session, state)
+    return jsonify({'redirect_url': auth_url, 'state': state})
+
+@asgi_app.route('/webhook', methods=['GET', 'POST'])
+async def webhook():
+    """Gérer le retour d'authentification TikTok"""
+    try:
+        log("\n📨 Réception du webhook TikTok...")
+
+        code = request.args.get('code')
+        state = request.args.get('state')
+        if not code:
+            log("❌ Code d'autorisation manquant", "error", "💥")
+            publish_auth(state, {'success': False, 'error': "Code d'autorisation manquant"})
+            return await close_page(False, "Code d'autorisation manquant")
+
+        # Code déjà reçu (double clic, rechargement): pas de second échange avec TikTok
+        key, state_key = WebhookDeduplicator.digest(code), WebhookDeduplicator.digest(state)
+        known = webhook_outcomes.get(key)
+        if known is None and key in webhook_inflight:
+            try:
+                known = await asyncio.wait_for(asyncio.shield(webhook_inflight[key]), REQUEST_BUDGET)
+            except asyncio.TimeoutError:
+                return await webhook_response(WebhookDeduplicator.IN_PROGRESS, state, replayed=True)
+        if known is not None:
+            log("♻️ Code d'autorisation déjà traité, réutilisation du résultat")
+            first_state, outcome = known
+            return await webhook_response(outcome if first_state == state_key else WebhookDeduplicator.REJECTED, state,
+                                          replayed=True)
+
+        # Pas d'await entre la vérification et la réservation: aucun doublon ne peut s'intercaler
+        with exchange_slots.slot() as admitted:
+            if not admitted:
+                REQUESTS_REJECTED.labels('webhook', 'upstream_saturated').inc()
+                log("🚦 Trop d'échanges en cours avec TikTok, webhook refusé", "warning", "🚦")
+                return await too_many_requests("Service momentanément saturé, réessayez", 1, status=503)
+            webhook_inflight[key] = asyncio.get_running_loop().create_future()
+            token_data = None
+            try:
+                token_data = await timed('exchange', request_spans(), call_tiktok_api(code))
+            finally:
+                known = (state_key, exchange_outcome(token_data))
+                webhook_outcomes.set(key, known)
+                webhook_inflight.pop(key).set_result(known)
+        if not token_data:
+            publish_auth(state, {'success': False, 'error': "Erreur lors de l'échange du code"})
+            return await close_page(False, "Erreur lors de l'échange du code")
+
+        # En mode asynchrone, la sauvegarde continue après la réponse (file bornée)
+        pending_logins.add(token_data.get('open_id'))
+        if not (POST_LOGIN_ASYNC and await post_login_queue.submit(token_data, state)):
+            await save_to_database(token_data, state)
+
+        return await webhook_response(known[1], state)
+
+    except Exception as e:
+        log(f"❌ Erreur lors du traitement du webhook: {str(e)}", "error", "💥")
+        if debug_mode:
+            log(traceback.format_exc(), "error", "🔍")
+        publish_auth(request.args.get('state'), {'success': False, 'error': "Une erreur est survenue"})
+        return await close_page(False, "Une erreur est survenue")
+
+async def webhook_response(outcome, state, replayed=False):
+    """Lier la session à l'utilisateur et fermer la popup (page principale sur mobile)"""
+    if not outcome['success']:
+        return await close_page(False, outcome['error'])
+
+    if may_bind_session(session, state, replayed):
+        session.permanent = True
+        session['open_id'] = outcome['open_id']
+    else:
+        log("⚠️ Code rejoué depuis un autre navigateur: session non liée", "warning", "⚠️")
+
+    user_agent = request.headers.get('User-Agent', '').lower()
+    is_mobile = any(device in user_agent for device in ['iphone', 'ipad', 'android', 'mobile'])
+
+    if is_mobile:
+        if auth_events.is_valid_state(state):
+            return redirect(f'/?code=success&state={state}')
+        return redirect('/?code=success')
+    return await close_page(True)
+
+@asgi_app.route('/auth/events/<state>', methods=['GET'])
+async def auth_event_stream(state):
+    """Server-Sent Events: un seul message quand le login de ce state est sauvegardé"""
+    if not auth_events.is_valid_state(state):
+        return jsonify({'error': 'state invalide'}), 404
+    if auth_stream_stats['open_streams'] >= ASGI_AUTH_STREAM_MAX:
+        auth_stream_stats['rejected'] += 1
+        return jsonify({'error': 'Trop de connexions en attente'}), 503, {'Retry-After': '5'}
+
+    async def stream():
+        auth_stream_stats['open_streams'] += 1
+        waiter = auth_waiters.setdefault(state, {'event': asyncio.Event(), 'streams': 0})
+        waiter['streams'] += 1
+        try:
+            yield "retry: 5000\n\n"
+            deadline = time.monotonic() + AUTH_STREAM_TIMEOUT
+            while True:
+                # Le fichier partagé couvre un login traité par un autre processus
+                payload = auth_events.read(state)
+                if payload is not None:
+                    yield sse_message('auth', payload)
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    yield sse_message('timeout', {})
+                    return
+                try:
+                    await asyncio.wait_for(waiter['event'].wait(), timeout=min(AUTH_STREAM_HEARTBEAT, remaining))
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            auth_stream_stats['open_streams'] -= 1
+            waiter['streams'] -= 1
+            if not waiter['streams']:
+                auth_waiters.pop(state, None)
+
+    response = await make_response(stream(), {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no'
+    })
+    # Pas de limite de durée Quart: la connexion se termine via AUTH_STREAM_TIMEOUT
+    response.timeout = None
+    return response
+
+async def probe_database():
+    """Tester Supabase avec un comptage côté serveur, résultat partagé pendant HEALTH_CACHE_TTL"""
+    cached = _readiness_cache['result']
+    if cached is not None and time.monotonic() < _readiness_cache['expires_at']:
+        return cached
+
+    async with _readiness_lock:
+        cached = _readiness_cache['result']
+        if cached is not None and time.monotonic() < _readiness_cache['expires_at']:
+            return cached
+        try:
+            result = await db_execute('tiktok_tokens.count',
+                                      tokens_table().select('id', count=HEALTH_COUNT_METHOD).limit(1))
+            probe = {
+                'status': 'connected',
+                'token_count': result.count if result.count is not None else -1,
+                'checked_at': datetime.now().isoformat()
+            }
+        except Exception as e:
+            log(f"❌ Erreur connexion Supabase: {str(e)}", "error", "💥")
+            probe = {
+                'status': 'error',
+                'token_count': -1,
+                'checked_at': datetime.now().isoformat()
+            }
+        _readiness_cache['result'] = probe
+        _readiness_cache['expires_at'] = time.monotonic() + HEALTH_CACHE_TTL
+        return probe
+
+@asgi_app.route('/health/live', methods=['GET'])
+async def liveness_check():
+    """Sonde de vivacité: ne touche jamais la base de données"""
+    return jsonify({
+        'status': 'alive',
+        'timestamp': datetime.now().isoformat()
+    }), 200
+
+@asgi_app.route('/health/ready', methods=['GET'])
+async def readiness_check():
+    """Sonde de disponibilité: 503 si Supabase est injoignable"""
+    probe = await probe_database()
+    ready = probe['status'] == 'connected'
+    return jsonify({
+        'status': 'ready' if ready else 'unavailable',
+        'database': probe
+    }), 200 if ready else 503
+
+@asgi_app.route('/health', methods=['GET'])
+async def health_check():
+    """Endpoint de santé pour vérifier que l'API fonctionne"""
+    probe = await probe_database()
+    return jsonify({
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'service': 'TikTok API Webhook (ASGI)',
+        'database': {
+            'status': probe['status'],
+            'token_count': probe['token_count']
+        },
+        'pending_logins': len(pending_logins),
+        'post_login_queue': post_login_queue.stats(),
+        'circuit_breakers': {name: breaker.stats() for name, breaker in circuit_breakers.items()},
+        'auth_streams': dict(auth_stream_stats),
+        'webhook_dedup': {'in_flight': len(webhook_inflight), 'completed': webhook_outcomes.stats()},
+        'rate_limits': {**rate_limiter.stats(), 'enabled': RATE_LIMIT_ENABLED, 'upstream': exchange_slots.stats()},
+        'profile_cache': profile_cache.stats(),
+        'tls': tls_stats(),
+        'debug_mode': debug_mode
+    }), 200
+
+async def precompressed_response(page, cache_control):
+    """Servir une page ou un asset pré-rendu de app.py (variante négociée, ETag)"""
+    status, body, headers = page.negotiate(request.accept_encodings, request.if_none_match, cache_control)
+    response = await make_response(body, status)
+    response.headers.update(headers)
+    return response
+
+async def close_page(success, message=None):
+    return await precompressed_response(frontend.close_page(success, message), 'no-store')
+
+@asgi_app.route('/', methods=['GET'])
+async def home():
+    """Page d'accueil avec bouton de connexion TikTok"""
+    return await precompressed_response(frontend.index, 'no-cache')
+
+@asgi_app.route('/assets/<name>', methods=['GET'])
+async def static_asset(name):
+    """Assets nommés par leur hash: immuables, précompressés"""
+    asset = frontend.assets.get(name)
+    if asset is None:
+        return jsonify({'error': 'Not Found'}), 404
+    return await precompressed_response(asset, ASSET_CACHE_CONTROL)
+
+async def load_profile(open_id):
+    """Lire le profil actif d'un utilisateur; retourne (données, status, cacheable)"""
+    result = await db_execute('tiktok_tokens.select_profile', tokens_table()
+                              .select('creator_nickname, creator_avatar_url')
+                              .eq('open_id', open_id)
+                              .eq('is_active', True)
+                              .order('created_at', desc=True)
+                              .limit(1))
+
+    if not result.data and open_id in pending_logins:
+        return {
+            'success': True,
+            'pending': True,
+            'nickname': '',
+            'avatar_url': ''
+        }, 200, False
+
+    if not result.data:
+        # Jamais mis en cache: la sauvegarde d'un login peut être encore en cours
+        return UNAUTHENTICATED_RESPONSE, 401, False
+
+    token_data = result.data[0]
+    return {
+        'success': True,
+        'nickname': token_data.get('creator_nickname', ''),
+        'avatar_url': token_data.get('creator_avatar_url', '')
+    }, 200, True
+
+@asgi_app.route('/user/profile', methods=['GET'])
+async def get_profile():
+    """Endpoint pour récupérer le profil de l'utilisateur connecté"""
+    try:
+        open_id = session.get('open_id')
+        if not open_id:
+            return jsonify(UNAUTHENTICATED_RESPONSE), 401
+
+        cached = profile_cache.get(open_id)
+        if cached is None:
+            response_data, status, cacheable = await load_profile(open_id)
+            body = json.dumps(response_data, sort_keys=True)
+            etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+            cached = (response_data, status, etag)
+            if cacheable:
+                profile_cache.set(open_id, cached)
+
+        response_data, status, etag = cached
+
+        if status == 200 and request.if_none_match.contains(etag):
+            response = await make_response('', 304)
+        else:
+            response = await make_response(jsonify(response_data), status)
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    except Exception as e:
+        log(f"❌ Erreur lors de la récupération du profil: {str(e)}", "error", "💥")
+        return jsonify({
+            'success': False,
+            'error': 'Erreur serveur'
+        }), 500
+
+@asgi_app.route('/logout', methods=['POST'])
+async def logout():
+    """Endpoint pour déconnecter l'utilisateur"""
+    try:
+        open_id = session.pop('open_id', None)
+        if open_id:
+            await deactivate_tokens(open_id)
+            profile_cache.invalidate(open_id)
+
+        log("✅ Déconnexion réussie", "info", "🔓")
+        return jsonify({
+            'success': True,
+            'message': 'Déconnecté avec succès'
+        })
+
+    except Exception as e:
+        log(f"❌ Erreur lors de la déconnexion: {str(e)}", "error", "💥")
+        return jsonify({
+            'success': False,
+            'error': 'Erreur serveur'
+        }), 500
+
+if __name__ == '__main__':
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f"0.0.0.0:{int(os.getenv('PORT', 5000))}"]
+    config.certfile = os.getenv('TLS_CERTFILE', 'certs/cert.pem')
+    config.keyfile = os.getenv('TLS_KEYFILE', 'certs/key.pem')
+    config.keep_alive_timeout = float(os.getenv('ASGI_KEEPALIVE', 5))
+    # Contexte unique (reprise de session), certificat relu à chaud, ALPN h2/http1.1 d'Hypercorn
+    tls_context = ReloadingTLSContext(config.certfile, config.keyfile, alpn_protocols=config.alpn_protocols)
+    config.create_ssl_context = lambda: tls_context.listener
+
+    log("\n🚀 Démarrage de l'API TikTok Webhook (ASGI)")
+    asyncio.run(serve(asgi_app, config))
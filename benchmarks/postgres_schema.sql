@@ -0,0 +1,24 @@
+-- Schéma minimal de tiktok_tokens pour benchmarker TOKEN_STORE=postgres
+-- sur une base Postgres locale (les migrations/ sont appliquées ensuite).
+-- Ne pas utiliser sur la base Supabase de production.
+
+create table if not exists public.tiktok_tokens (
+    id bigserial primary key,
+    access_token text,
+    refresh_token text,
+    expires_in integer,
+    open_id text,
+    union_id text,
+    scope text,
+    created_at timestamptz default now(),
+    updated_at timestamptz default now(),
+    is_active boolean default true,
+    creator_avatar_url text,
+    creator_username text,
+    creator_nickname text,
+    privacy_level_options jsonb,
+    comment_disabled boolean,
+    duet_disabled boolean,
+    stitch_disabled boolean,
+    max_video_post_duration_sec integer
+);
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark hors-ligne de l'application avec TikTok et PostgREST simulés
+
+Démarre les serveurs simulés (stubs.py), lance l'application contre eux puis
+sollicite /, /webhook (codes neufs puis code rejoué), /health, /user/profile et /logout
+à concurrence fixe.
+Le résultat (RPS, p50/p95/p99) est écrit en JSON pour suivre les régressions
+d'une version à l'autre.
+
+Exemples:
+    python benchmarks/run.py --mode dev --concurrency 16 --duration 20
+    python benchmarks/run.py --mode prod --output bench_output.json
+    python benchmarks/run.py --app-url https://127.0.0.1:5000   # application déjà lancée
+    python benchmarks/run.py --store both --database-url postgresql://bench@127.0.0.1/bench
+
+Avec --store postgres ou both, la base indiquée par --database-url reçoit le
+schéma de postgres_schema.sql et les migrations/ avant le benchmark.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import platform
+import ssl
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stubs import StubConfig, start_postgrest_stub, start_tiktok_stub
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ('home', 'webhook', 'replay', 'health', 'profile', 'logout')
+STORES = ('supabase', 'postgres')
+DESKTOP_UA = 'Mozilla/5.0 (X11; Linux x86_64) benchmark'
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+class Client:
+    """Connexion keep-alive vers l'application (une par thread)"""
+
+    def __init__(self, base_url, timeout=30):
+        parts = urlsplit(base_url)
+        if parts.scheme == 'https':
+            context = ssl._create_unverified_context()
+            self.conn = http.client.HTTPSConnection(parts.hostname, parts.port, timeout=timeout, context=context)
+        else:
+            self.conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+
+    def request(self, method, path, headers=None):
+        try:
+            self.conn.request(method, path, headers=headers or {})
+            response = self.conn.getresponse()
+            response.read()
+            return response.status, response.getheader('Set-Cookie')
+        except (http.client.HTTPException, OSError):
+            self.conn.close()
+            raise
+
+    def close(self):
+        self.conn.close()
+
+def login(base_url):
+    """Obtenir un cookie de session via /webhook (pour /user/profile et /logout)"""
+    client = Client(base_url)
+    try:
+        _, set_cookie = client.request('GET', '/webhook?code=bench-session&state=bench',
+                                       {'User-Agent': DESKTOP_UA})
+    finally:
+        client.close()
+    return set_cookie.split(';', 1)[0] if set_cookie else ''
+
+def build_request(scenario, cookie, sequence):
+    if scenario == 'webhook':
+        return 'GET', f'/webhook?code=bench-{next(sequence)}&state=bench', {'User-Agent': DESKTOP_UA}
+    if scenario == 'replay':
+        # Même code à chaque requête (rechargements): servi depuis le résultat mémorisé
+        return 'GET', '/webhook?code=bench-session&state=bench', {'User-Agent': DESKTOP_UA}
+    if scenario == 'home':
+        return 'GET', '/', {'Accept-Encoding': 'br, gzip'}
+    if scenario == 'health':
+        return 'GET', '/health', {}
+    if scenario == 'profile':
+        return 'GET', '/user/profile', {'Cookie': cookie}
+    return 'POST', '/logout', {'Cookie': cookie, 'Content-Length': '0'}
+
+def run_scenario(base_url, scenario, concurrency, duration, cookie):
+    """Solliciter une route à concurrence fixe pendant duration secondes"""
+    latencies = []
+    statuses = {}
+    errors = [0]
+    lock = threading.Lock()
+    sequence = itertools.count()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        client = Client(base_url)
+        local_latencies, local_statuses, local_errors = [], {}, 0
+        while time.perf_counter() < deadline:
+            method, path, headers = build_request(scenario, cookie, sequence)
+            started = time.perf_counter()
+            try:
+                status, _ = client.request(method, path, headers)
+            except Exception:
+                local_errors += 1
+                client = Client(base_url)
+                continue
+            local_latencies.append((time.perf_counter() - started) * 1000)
+            local_statuses[status] = local_statuses.get(status, 0) + 1
+            if status >= 500:
+                local_errors += 1
+        client.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0,
+        'mean_ms': round(sum(latencies) / len(latencies), 2) if latencies else None,
+        'p50_ms': round(percentile(latencies, 0.50), 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95), 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99), 2) if latencies else None
+    }
+
+def app_command(mode):
+    if mode == 'prod':
+        return [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py']
+    if mode == 'asgi':
+        return [sys.executable, 'asgi_app.py']
+    return [sys.executable, 'app.py']
+
+def wait_until_ready(base_url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            client = Client(base_url, timeout=2)
+            status, _ = client.request('GET', '/health/live')
+            client.close()
+            if status == 200:
+                return True
+        except Exception:
+            time.sleep(0.2)
+    return False
+
+def start_app(mode, port, tiktok_port, postgrest_port, extra_env):
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(port),
+        'DEBUG': 'False',
+        'SUPABASE_URL': f'http://127.0.0.1:{postgrest_port}',
+        'SUPABASE_KEY': 'bench.bench.bench',
+        'TIKTOK_API_BASE_URL': f'http://127.0.0.1:{tiktok_port}',
+        'FLASK_SECRET_KEY': 'benchmark-secret',
+        'HEALTH_CACHE_TTL': os.getenv('HEALTH_CACHE_TTL', '5'),
+        # Tous les clients du benchmark partagent 127.0.0.1: limite par IP désactivée par défaut
+        'RATE_LIMIT_ENABLED': os.getenv('RATE_LIMIT_ENABLED', 'False')
+    })
+    env.update(extra_env)
+    return subprocess.Popen(app_command(mode), cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def prepare_postgres(database_url):
+    """Créer la table et appliquer les migrations sur la base de benchmark"""
+    import psycopg2
+    scripts = [os.path.join(ROOT, 'benchmarks', 'postgres_schema.sql')]
+    migrations = os.path.join(ROOT, 'migrations')
+    scripts += [os.path.join(migrations, name) for name in sorted(os.listdir(migrations)) if name.endswith('.sql')]
+    conn = psycopg2.connect(database_url)
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            for script in scripts:
+                with open(script, encoding='utf-8') as f:
+                    cursor.execute(f.read())
+    finally:
+        conn.close()
+
+def run_suite(args, store, tiktok, postgrest):
+    """Lancer l'application avec un stockage donné et exécuter les scénarios
+
+    Retourne (résultats par scénario, délai de démarrage en ms ou None si l'application est externe).
+    """
+    process = None
+    startup_ms = None
+    base_url = args.app_url
+    if not base_url:
+        base_url = f'https://127.0.0.1:{args.port}'
+        extra_env = {'TOKEN_STORE': store}
+        if store == 'postgres':
+            extra_env['DATABASE_URL'] = args.database_url
+        extra_env.update(parse_env(args.env))
+        launched = time.perf_counter()
+        process = start_app(args.mode, args.port, tiktok.server_port, postgrest.server_port, extra_env)
+    
+    try:
+        if not wait_until_ready(base_url):
+            print(f"❌ L'application ne répond pas sur {base_url}", file=sys.stderr)
+            sys.exit(1)
+        if process is not None:
+            # Du lancement du processus à la première réponse de /health/live
+            startup_ms = round((time.perf_counter() - launched) * 1000, 1)
+
+        cookie = login(base_url)
+        results = {}
+        for scenario in [s.strip() for s in args.scenarios.split(',') if s.strip()]:
+            print(f"🏁 [{store}] {scenario}: {args.concurrency} clients pendant {args.duration}s...", file=sys.stderr)
+            results[scenario] = run_scenario(base_url, scenario, args.concurrency, args.duration, cookie)
+        return results, startup_ms
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=20)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+def parse_env(pairs):
+    env = {}
+    for pair in pairs or []:
+        key, _, value = pair.partition('=')
+        env[key] = value
+    return env
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hors-ligne de l'API TikTok")
+    parser.add_argument('--mode', choices=['dev', 'prod', 'asgi'], default='dev')
+    parser.add_argument('--app-url', help="Viser une application déjà lancée au lieu d'en démarrer une")
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=15, help="Durée par scénario (s)")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--latency', type=float, default=0.05, help="Latence des serveurs simulés (s)")
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--no-rpc', action='store_true', help="Base sans fonctions RPC (chemin en deux étapes)")
+    parser.add_argument('--store', choices=STORES + ('both',), default='supabase',
+                        help="Stockage des tokens (TOKEN_STORE); both compare les deux")
+    parser.add_argument('--database-url', help="Base Postgres de benchmark (requis avec --store postgres/both)")
+    parser.add_argument('--env', action='append', metavar='CLE=VALEUR',
+                        help="Variable d'environnement supplémentaire pour l'application")
+    parser.add_argument('--output', help="Fichier JSON de sortie (sinon stdout)")
+    args = parser.parse_args()
+
+    stores = STORES if args.store == 'both' else (args.store,)
+    if 'postgres' in stores:
+        if not args.database_url:
+            parser.error("--database-url est requis avec --store postgres ou both")
+        if not args.app_url:
+            prepare_postgres(args.database_url)
+
+    config = StubConfig(args.latency, args.jitter, args.error_rate)
+    tiktok = start_tiktok_stub(0, config)
+    postgrest = start_postgrest_stub(0, config, rpc_enabled=not args.no_rpc)
+
+    by_store, startup = {}, {}
+    for store in stores:
+        by_store[store], startup[store] = run_suite(args, store, tiktok, postgrest)
+    # Un seul stockage: format historique {scénario: ...}; sinon {stockage: {scénario: ...}}
+    results = by_store[stores[0]] if len(stores) == 1 else by_store
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'mode': 'external' if args.app_url else args.mode,
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'stub_latency_s': args.latency,
+            'stub_jitter_s': args.jitter,
+            'stub_error_rate': args.error_rate,
+            'rpc': not args.no_rpc,
+            'stores': list(stores),
+            'time_to_ready_ms': startup,
+            'env': parse_env(args.env),
+            'python': platform.python_version(),
+            'platform': platform.platform()
+        },
+        'results': results
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        print(f"✅ Résultats écrits dans {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
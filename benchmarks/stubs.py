@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Serveurs locaux remplaçant open.tiktokapis.com et PostgREST (Supabase) pour les benchmarks
+
+Chaque serveur accepte une latence, une gigue et un taux d'erreur configurables.
+
+Lancement autonome:
+    python benchmarks/stubs.py --tiktok-port 9100 --postgrest-port 9200 --latency 0.05
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+class StubConfig:
+    """Latence (s), gigue (s) et taux d'erreur (0-1) d'un serveur simulé"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def delay(self):
+        pause = self.latency + random.uniform(-self.jitter, self.jitter)
+        if pause > 0:
+            time.sleep(pause)
+
+    def should_fail(self):
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Base commune: HTTP/1.1 keep-alive, réponses JSON, logs silencieux"""
+
+    protocol_version = 'HTTP/1.1'
+    config = StubConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def simulate(self):
+        """Appliquer latence et erreurs; retourne False si une erreur a été envoyée"""
+        self.config.delay()
+        if self.config.should_fail():
+            self.send_json(503, {'error': 'stub_unavailable', 'message': 'Erreur simulée'})
+            return False
+        return True
+
+class TikTokStubHandler(StubHandler):
+    """Émule oauth/token, creator_info/query et user/info"""
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        self.read_body()
+        if not self.simulate():
+            return
+        if urlsplit(self.path).path == '/v2/user/info/':
+            self.send_json(200, {
+                'data': {'user': {'open_id': 'stub', 'display_name': 'Stub User'}},
+                'error': {'code': 'ok', 'message': ''}
+            })
+        else:
+            self.send_json(404, {'error': 'not_found'})
+
+    def do_POST(self):
+        body = self.read_body()
+        if not self.simulate():
+            return
+        path = urlsplit(self.path).path
+        if path == '/v2/oauth/token/':
+            form = {k: v[0] for k, v in parse_qs(body.decode('utf-8')).items()}
+            seed = form.get('code') or form.get('refresh_token') or ''
+            # Les codes sont répartis sur un nombre borné d'utilisateurs
+            user = int(hashlib.sha1(seed.encode('utf-8')).hexdigest(), 16) % self.server.users
+            self.send_json(200, {
+                'access_token': f'act.{seed[:24]}',
+                'refresh_token': f'rft.{seed[:24]}',
+                'expires_in': 86400,
+                'refresh_expires_in': 31536000,
+                'open_id': f'stub-user-{user}',
+                'scope': 'user.info.basic',
+                'token_type': 'Bearer'
+            })
+        elif path == '/v2/post/publish/creator_info/query/':
+            self.send_json(200, {
+                'data': {
+                    'creator_avatar_url': 'https://example.invalid/avatar.jpg',
+                    'creator_username': 'stub_creator',
+                    'creator_nickname': 'Stub Creator',
+                    'privacy_level_options': ['PUBLIC_TO_EVERYONE', 'SELF_ONLY'],
+                    'comment_disabled': False,
+                    'duet_disabled': False,
+                    'stitch_disabled': False,
+                    'max_video_post_duration_sec': 600
+                },
+                'error': {'code': 'ok', 'message': ''}
+            })
+        else:
+            self.send_json(404, {'error': 'not_found'})
+
+class TokenTable:
+    """Table tiktok_tokens en mémoire avec les filtres PostgREST utilisés par l'application"""
+
+    def __init__(self):
+        self.rows = []
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _coerce(value):
+        # PostgreSQL accepte les booléens sans tenir compte de la casse (eq.True)
+        if value.lower() in ('true', 'false'):
+            return value.lower() == 'true'
+        if value == 'null':
+            return None
+        return value
+
+    def _equals(self, current, value):
+        expected = self._coerce(value)
+        if isinstance(current, (int, float)) and not isinstance(current, bool) and isinstance(expected, str):
+            return str(current) == expected
+        return current == expected
+
+    def _matches(self, row, filters):
+        # dict {colonne: (op, valeur)} ou liste de (colonne, (op, valeur)): plusieurs filtres par colonne
+        for column, (op, value) in (filters.items() if isinstance(filters, dict) else filters):
+            current = row.get(column)
+            if op == 'eq' and not self._equals(current, value):
+                return False
+            if op == 'neq' and self._equals(current, value):
+                return False
+            if op == 'in' and str(current) not in value.strip('()').split(','):
+                return False
+            if op in ('lt', 'gt'):
+                if current is None:
+                    return False
+                left, right = self._comparable(current), self._comparable(value, current)
+                if op == 'lt' and not left < right:
+                    return False
+                if op == 'gt' and not left > right:
+                    return False
+        return True
+
+    @staticmethod
+    def _comparable(value, like=None):
+        # Colonnes numériques (id) comparées comme des nombres, le reste comme du texte
+        if isinstance(like if like is not None else value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+        return str(value)
+
+    def select(self, filters, order=None, limit=None):
+        with self.lock:
+            rows = [dict(row) for row in self.rows if self._matches(row, filters)]
+        # order=a,b.desc: tri stable en partant de la dernière colonne
+        for term in reversed(order.split(',') if order else []):
+            column, _, direction = term.partition('.')
+            rows.sort(key=lambda r: self._comparable(r.get(column) or ''), reverse=direction.startswith('desc'))
+        total = len(rows)
+        if limit is not None:
+            rows = rows[:limit]
+        return rows, total
+
+    def insert(self, row):
+        now = datetime.now(timezone.utc)
+        row = dict(row)
+        row['id'] = next(self.ids)
+        row.setdefault('created_at', now.isoformat())
+        row['expires_at'] = (now + timedelta(seconds=int(row.get('expires_in') or 0))).isoformat()
+        with self.lock:
+            self.rows.append(row)
+        return row
+
+    def update(self, filters, values):
+        with self.lock:
+            updated = [row for row in self.rows if self._matches(row, filters)]
+            for row in updated:
+                row.update(values)
+        return [dict(row) for row in updated]
+
+class PostgRESTStubHandler(StubHandler):
+    """Émule /rest/v1/tiktok_tokens, /rest/v1/webhook_codes et les fonctions RPC des migrations"""
+
+    def _parse(self):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        params = {k: v[0] for k, v in query.items()}
+        filters = []
+        for column, expressions in query.items():
+            if column in ('select', 'order', 'limit', 'offset', 'on_conflict', 'columns'):
+                continue
+            for expression in expressions:
+                op, _, value = expression.partition('.')
+                filters.append((column, (op, value)))
+        return parts.path, params, filters
+
+    def _table(self, path):
+        if path.rstrip('/') == '/rest/v1/tiktok_tokens':
+            return self.server.table
+        if path.rstrip('/') == '/rest/v1/webhook_codes':
+            return self.server.webhook_codes
+        self.send_json(404, {'code': 'PGRST205', 'message': 'Table inconnue'})
+        return None
+
+    def _wants_representation(self):
+        return 'return=representation' in (self.headers.get('Prefer') or '')
+
+    def do_GET(self):
+        self.read_body()
+        if not self.simulate():
+            return
+        path, params, filters = self._parse()
+        table = self._table(path)
+        if table is None:
+            return
+        limit = int(params['limit']) if 'limit' in params else None
+        rows, total = table.select(filters, params.get('order'), limit)
+        headers = {}
+        if 'count=' in (self.headers.get('Prefer') or ''):
+            end = max(len(rows) - 1, 0)
+            headers['Content-Range'] = f'0-{end}/{total}'
+        self.send_json(200, rows, headers)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        body = json.loads(self.read_body() or b'{}')
+        if not self.simulate():
+            return
+        path, _, _ = self._parse()
+        if path.startswith('/rest/v1/rpc/'):
+            return self._rpc(path.rsplit('/', 1)[-1], body)
+        table = self._table(path)
+        if table is None:
+            return
+        rows = body if isinstance(body, list) else [body]
+        inserted = [table.insert(row) for row in rows]
+        self.send_json(201, inserted if self._wants_representation() else [])
+
+    def do_PATCH(self):
+        values = json.loads(self.read_body() or b'{}')
+        if not self.simulate():
+            return
+        path, _, filters = self._parse()
+        table = self._table(path)
+        if table is None:
+            return
+        updated = table.update(filters, values)
+        self.send_json(200, updated if self._wants_representation() else [])
+
+    def _rpc(self, name, params):
+        table = self.server.table
+        if not self.server.rpc_enabled:
+            self.send_json(404, {'code': 'PGRST202', 'message': f'Could not find the function public.{name}'})
+        elif name == 'save_tiktok_token':
+            token = params.get('token', {})
+            with table.lock:
+                for row in table.rows:
+                    if row.get('open_id') == token.get('open_id') and row.get('is_active'):
+                        row['is_active'] = False
+            self.send_json(200, [table.insert(token)])
+        elif name == 'refresh_tiktok_tokens':
+            updated = []
+            for token in params.get('tokens', []):
+                updated += table.update({'id': ('eq', str(token['id'])), 'is_active': ('eq', 'true')}, {
+                    'access_token': token['access_token'],
+                    'refresh_token': token['refresh_token'],
+                    'expires_in': token['expires_in']
+                })
+            self.send_json(200, [{'id': row['id']} for row in updated])
+        elif name == 'sync_creator_info':
+            updated = []
+            for creator in params.get('creators', []):
+                values = {k: v for k, v in creator.items() if k != 'id'}
+                updated += table.update({'id': ('eq', str(creator['id'])), 'is_active': ('eq', 'true')}, values)
+            self.send_json(200, [{'id': row['id']} for row in updated])
+        elif name in ('claim_webhook_code', 'finish_webhook_code'):
+            self.send_json(200, self._webhook_code(name, params))
+        else:
+            self.send_json(404, {'code': 'PGRST202', 'message': f'Could not find the function public.{name}'})
+
+    def _webhook_code(self, name, params):
+        codes = self.server.webhook_codes
+        code_hash = params['p_code_hash']
+        with codes.lock:
+            existing = next((row for row in codes.rows if row['code_hash'] == code_hash), None)
+            if name == 'finish_webhook_code':
+                if existing is not None:
+                    existing['outcome'] = params['p_outcome']
+                # Fonction void: le client PostgREST n'accepte qu'une liste (corps vide côté PostgREST réel)
+                return []
+            if existing is not None:
+                return [{'claimed': False, 'state_hash': existing['state_hash'], 'outcome': existing['outcome']}]
+            codes.rows.append({'code_hash': code_hash, 'state_hash': params['p_state_hash'], 'outcome': None})
+        return [{'claimed': True, 'state_hash': params['p_state_hash'], 'outcome': None}]
+
+def _serve(handler_class, port, config, **attributes):
+    handler = type(handler_class.__name__, (handler_class,), {'config': config})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    for name, value in attributes.items():
+        setattr(server, name, value)
+    thread = threading.Thread(target=server.serve_forever, name=handler_class.__name__, daemon=True)
+    thread.start()
+    return server
+
+def start_tiktok_stub(port=0, config=None, users=1000):
+    """Démarrer le faux open.tiktokapis.com; retourne le serveur (server.server_port)"""
+    return _serve(TikTokStubHandler, port, config or StubConfig(), users=users)
+
+def start_postgrest_stub(port=0, config=None, rpc_enabled=True):
+    """Démarrer le faux PostgREST; retourne le serveur (server.server_port)"""
+    return _serve(PostgRESTStubHandler, port, config or StubConfig(),
+                  table=TokenTable(), webhook_codes=TokenTable(), rpc_enabled=rpc_enabled)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveurs TikTok et PostgREST simulés")
+    parser.add_argument('--tiktok-port', type=int, default=9100)
+    parser.add_argument('--postgrest-port', type=int, default=9200)
+    parser.add_argument('--latency', type=float, default=0.05, help="Latence moyenne (s)")
+    parser.add_argument('--jitter', type=float, default=0.01, help="Gigue (s)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Taux d'erreur (0-1)")
+    parser.add_argument('--no-rpc', action='store_true', help="Simuler une base sans les fonctions RPC")
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency, args.jitter, args.error_rate)
+    tiktok = start_tiktok_stub(args.tiktok_port, config)
+    postgrest = start_postgrest_stub(args.postgrest_port, config, rpc_enabled=not args.no_rpc)
+    print(f"🎭 TikTok simulé:   http://127.0.0.1:{tiktok.server_port}")
+    print(f"🗄️  PostgREST simulé: http://127.0.0.1:{postgrest.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print("\n👋 Au revoir!")
+
+if __name__ == '__main__':
+    main()
@@ -1,32 +1,212 @@
-from OpenSSL import crypto
+# -*- coding: utf-8 -*-
+"""Génération d'un certificat auto-signé dans certs/ et benchmark des handshakes TLS
+
+Exemples:
+    python generate_cert.py                                   # ECDSA P-256, localhost + 127.0.0.1
+    python generate_cert.py --key-type ed25519 --days 90    # clients non navigateurs uniquement
+    python generate_cert.py --san api.example.com --san 10.0.0.5
+    python generate_cert.py --benchmark                       # handshakes/s par cœur et par type de clé
+
+Les fichiers sont remplacés atomiquement: un serveur lancé relit le nouveau
+certificat à chaud (tls.py), sans redémarrage.
+"""
+import argparse
+import ipaddress
+import json
 import os
+import ssl
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+from dotenv import load_dotenv
+
+KEY_TYPES = ('ecdsa', 'ed25519', 'rsa')
+
+def generate_key(key_type, rsa_bits=2048):
+    """Clé privée: ECDSA P-256 (défaut), Ed25519 ou RSA"""
+    if key_type == 'ecdsa':
+        return ec.generate_private_key(ec.SECP256R1())
+    if key_type == 'ed25519':
+        return ed25519.Ed25519PrivateKey.generate()
+    return rsa.generate_private_key(public_exponent=65537, key_size=rsa_bits)
+
+def default_sans():
+    """localhost, 127.0.0.1 et l'hôte de TIKTOK_REDIRECT_URI s'il est défini"""
+    load_dotenv()
+    sans = ['localhost', '127.0.0.1']
+    host = urlsplit(os.getenv('TIKTOK_REDIRECT_URI', '')).hostname
+    if host and host not in sans:
+        sans.append(host)
+    return sans
+
+def _general_name(value):
+    try:
+        return x509.IPAddress(ipaddress.ip_address(value))
+    except ValueError:
+        return x509.DNSName(value)
+
+def _write_atomically(path, data, mode=0o644):
+    directory = os.path.dirname(path) or '.'
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(temporary, mode)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
 
-def generate_self_signed_cert():
+def generate_self_signed_cert(key_type='ecdsa', sans=None, days=365, common_name='TIKTOK-API',
+                              out_dir='certs', rsa_bits=2048):
+    """Créer certs/cert.pem et certs/key.pem; retourne (chemin du certificat, chemin de la clé)"""
     # Créer le dossier certs s'il n'existe pas
-    if not os.path.exists('certs'):
-        os.makedirs('certs')
+    os.makedirs(out_dir, exist_ok=True)
+    sans = sans or default_sans()
 
     # Générer la clé
-    k = crypto.PKey()
-    k.generate_key(crypto.TYPE_RSA, 4096)
+    key = generate_key(key_type, rsa_bits)
 
     # Générer le certificat
-    cert = crypto.X509()
-    cert.get_subject().CN = "TIKTOK-API"
-    cert.set_serial_number(1000)
-    cert.gmtime_adj_notBefore(0)
-    cert.gmtime_adj_notAfter(365*24*60*60)  # Valide pour un an
-    cert.set_issuer(cert.get_subject())
-    cert.set_pubkey(k)
-    cert.sign(k, 'sha256')
-
-    # Sauvegarder le certificat et la clé
-    with open("certs/cert.pem", "wb") as f:
-        f.write(crypto.dump_certificate(crypto.FILETYPE_PEM, cert))
-    with open("certs/key.pem", "wb") as f:
-        f.write(crypto.dump_privatekey(crypto.FILETYPE_PEM, k))
-
-    print("Certificat SSL auto-signé généré avec succès dans le dossier 'certs'")
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    now = datetime.now(timezone.utc)
+    key_usage = x509.KeyUsage(
+        digital_signature=True, key_encipherment=key_type == 'rsa', content_commitment=False,
+        data_encipherment=False, key_agreement=False, key_cert_sign=False, crl_sign=False,
+        encipher_only=False, decipher_only=False
+    )
+    cert = x509.CertificateBuilder() \
+        .subject_name(subject) \
+        .issuer_name(subject) \
+        .public_key(key.public_key()) \
+        .serial_number(x509.random_serial_number()) \
+        .not_valid_before(now - timedelta(minutes=5)) \
+        .not_valid_after(now + timedelta(days=days)) \
+        .add_extension(x509.SubjectAlternativeName([_general_name(san) for san in sans]), critical=False) \
+        .add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=True) \
+        .add_extension(key_usage, critical=True) \
+        .add_extension(x509.ExtendedKeyUsage([ExtendedKeyUsageOID.SERVER_AUTH]), critical=False) \
+        .sign(key, None if key_type == 'ed25519' else hashes.SHA256())
+
+    # Sauvegarder la clé puis le certificat (un serveur qui lirait entre les deux
+    # voit une paire incohérente, la rejette et réessaie au passage suivant)
+    cert_path = os.path.join(out_dir, 'cert.pem')
+    key_path = os.path.join(out_dir, 'key.pem')
+    _write_atomically(key_path, key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ), mode=0o600)
+    _write_atomically(cert_path, cert.public_bytes(serialization.Encoding.PEM))
+    return cert_path, key_path
+
+def _handshake(server_context, client_context, session=None):
+    """Handshake complet en mémoire (MemoryBIO); retourne (session client, reprise, temps serveur)"""
+    server_in, server_out = ssl.MemoryBIO(), ssl.MemoryBIO()
+    client_in, client_out = ssl.MemoryBIO(), ssl.MemoryBIO()
+    server = server_context.wrap_bio(server_in, server_out, server_side=True)
+    client = client_context.wrap_bio(client_in, client_out, server_hostname='localhost', session=session)
+    server_time = 0.0
+    client_done = server_done = False
+    while not (client_done and server_done):
+        if not client_done:
+            try:
+                client.do_handshake()
+                client_done = True
+            except ssl.SSLWantReadError:
+                pass
+        server_in.write(client_out.read())
+        if not server_done:
+            started = time.perf_counter()
+            try:
+                server.do_handshake()
+                server_done = True
+            except ssl.SSLWantReadError:
+                pass
+            server_time += time.perf_counter() - started
+        client_in.write(server_out.read())
+    # TLS 1.3: le ticket de session arrive avec les premières données du serveur
+    started = time.perf_counter()
+    server.write(b'.')
+    server_time += time.perf_counter() - started
+    client_in.write(server_out.read())
+    client.read(1)
+    return client.session, server.session_reused, server_time
+
+def benchmark_handshakes(duration=2.0, rsa_bits=(2048, 4096)):
+    """Handshakes serveur par seconde CPU (un cœur), complets et repris, par type de clé"""
+    # Import local: tls.py lit sa configuration depuis l'environnement
+    from tls import ReloadingTLSContext
+
+    variants = [('ecdsa', None), ('ed25519', None)] + [('rsa', bits) for bits in rsa_bits]
+    client_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    client_context.check_hostname = False
+    client_context.verify_mode = ssl.CERT_NONE
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for key_type, bits in variants:
+            cert_path, key_path = generate_self_signed_cert(key_type, ['localhost'], 1, out_dir=directory,
+                                                            rsa_bits=bits or 2048)
+            # Contexte de production (tickets, rappel SNI de rechargement)
+            server_context = ReloadingTLSContext(cert_path, key_path).listener
+            row = {'key': f'{key_type}-{bits}' if bits else key_type}
+            for mode in ('full', 'resumed'):
+                session, _, _ = _handshake(server_context, client_context)
+                count, server_time, reused = 0, 0.0, 0
+                deadline = time.perf_counter() + duration
+                while time.perf_counter() < deadline:
+                    new_session, was_reused, spent = _handshake(
+                        server_context, client_context, session if mode == 'resumed' else None)
+                    if mode == 'resumed':
+                        session = new_session
+                    count += 1
+                    reused += was_reused
+                    server_time += spent
+                row[f'{mode}_per_core_s'] = round(count / server_time, 1) if server_time else None
+                if mode == 'resumed':
+                    row['resumed_ratio'] = round(reused / count, 3) if count else None
+            results.append(row)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Certificat TLS auto-signé pour certs/")
+    parser.add_argument('--key-type', choices=KEY_TYPES, default='ecdsa',
+                        help="ecdsa (P-256, défaut), ed25519 ou rsa. Attention: Chrome, Firefox et Safari "
+                             "refusent les certificats serveur Ed25519; réserver ed25519 aux clients non navigateurs "
+                             "(curl, scripts, services)")
+    parser.add_argument('--rsa-bits', type=int, default=2048, help="Taille de la clé RSA")
+    parser.add_argument('--san', action='append', metavar='NOM_OU_IP',
+                        help="Nom DNS ou adresse IP du certificat (répétable); "
+                             "défaut: localhost, 127.0.0.1 et l'hôte de TIKTOK_REDIRECT_URI")
+    parser.add_argument('--days', type=int, default=365, help="Durée de validité (jours)")
+    parser.add_argument('--cn', default='TIKTOK-API', help="Common Name du certificat")
+    parser.add_argument('--out-dir', default='certs')
+    parser.add_argument('--benchmark', action='store_true',
+                        help="Mesurer les handshakes/s par cœur pour chaque type de clé (n'écrit rien dans certs/)")
+    parser.add_argument('--duration', type=float, default=2.0, help="Durée de chaque mesure du benchmark (s)")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print(json.dumps({
+            'openssl': ssl.OPENSSL_VERSION,
+            'duration_s': args.duration,
+            'results': benchmark_handshakes(args.duration)
+        }, indent=2))
+        return
+
+    if args.key_type == 'ed25519':
+        print("⚠️ Ed25519: les navigateurs courants (Chrome, Firefox, Safari) refusent ce certificat serveur; "
+              "utiliser ecdsa pour le callback OAuth ouvert dans un navigateur")
+    cert_path, _ = generate_self_signed_cert(args.key_type, args.san, args.days, args.cn,
+                                             args.out_dir, args.rsa_bits)
+    print(f"Certificat SSL auto-signé ({args.key_type}) généré avec succès dans {cert_path}")
 
 if __name__ == '__main__':
-    generate_self_signed_cert() 
\ No newline at end of file
+    main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Configuration Gunicorn pour le mode production (python start.py --mode prod)
+
+Rechargement gracieux: kill -HUP $(cat logs/gunicorn.pid)
+"""
+import fcntl
+import multiprocessing
+import os
+import shutil
+
+# Workers préforkés, chacun avec un pool de threads
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+# Fabrique appelée dans chaque worker; les clients sont créés au premier usage.
+# Avec plusieurs workers, create_app refuse de démarrer sans FLASK_SECRET_KEY partagé
+wsgi_app = f'app:create_app(workers={workers})'
+# Import unique dans le maître puis fork: sans risque, clients et logs étant recréés par processus
+preload_app = os.getenv('GUNICORN_PRELOAD', 'False').lower() == 'true'
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+
+# Threads par worker
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# Chaque connexion SSE (/auth/events) occupe un thread pendant AUTH_STREAM_POLL secondes:
+# en garder pour les autres requêtes. Un worker sync (un seul thread) accepte un flux,
+# coupé plus tôt pour que le callback /webhook mis en file passe entre deux fenêtres
+os.environ.setdefault('AUTH_STREAM_MAX', str(max(1, threads // 2)))
+if worker_class == 'sync':
+    os.environ.setdefault('AUTH_STREAM_POLL', '2')
+# Échanges de code simultanés: un de moins que les threads, pour que /health et / répondent encore
+os.environ.setdefault('UPSTREAM_MAX_INFLIGHT', str(max(1, threads - 1)))
+
+# Keep-alive et timeouts
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# Recyclage des workers pour borner la dérive mémoire
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 0))
+
+pidfile = os.getenv('GUNICORN_PIDFILE', 'logs/gunicorn.pid')
+accesslog = os.getenv('GUNICORN_ACCESSLOG') or None
+errorlog = '-'
+
+# Terminaison TLS optionnelle avec les fichiers de certs/
+if os.getenv('GUNICORN_TLS', 'True').lower() == 'true':
+    from tls import ReloadingTLSContext
+    certfile = os.getenv('TLS_CERTFILE', 'certs/cert.pem')
+    keyfile = os.getenv('TLS_KEYFILE', 'certs/key.pem')
+    # Créé dans le maître: les workers forkés partagent les clés de tickets de session
+    _tls_context = ReloadingTLSContext(certfile, keyfile)
+
+    def ssl_context(conf, default_ssl_context_factory):
+        # Appelé à chaque connexion par les workers gthread: le contexte par défaut
+        # relirait le certificat et tirerait de nouvelles clés de tickets à chaque fois
+        return _tls_context.listener
+
+# Métriques Prometheus agrégées entre workers (lu par prometheus_client dans chaque worker)
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', 'logs/prometheus')
+
+_scheduler_locks = []
+
+def _acquire_scheduler_lock(path):
+    """Verrou exclusif non bloquant: True pour le seul worker qui l'obtient"""
+    lock = open(path, 'w')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return False
+    _scheduler_locks.append(lock)
+    return True
+
+def on_starting(server):
+    os.makedirs('logs', exist_ok=True)
+    # Repartir d'un répertoire de métriques vide à chaque démarrage du maître
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+def child_exit(server, worker):
+    """Retirer les jauges du worker terminé des métriques agrégées"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+def post_worker_init(worker):
+    """Démarrer les services d'arrière-plan après le fork, une fois par worker"""
+    import app
+
+    # Un seul worker détient chaque verrou et exécute le planificateur correspondant
+    run_scheduler = app.TOKEN_REFRESH_ENABLED and _acquire_scheduler_lock('logs/token_refresh.lock')
+    run_creator_sync = app.CREATOR_SYNC_ENABLED and _acquire_scheduler_lock('logs/creator_sync.lock')
+
+    app.start_background_services(run_scheduler=run_scheduler, run_creator_sync=run_creator_sync)
+
+def worker_exit(server, worker):
+    """Vider le pipeline post-login avant la sortie du worker"""
+    import app
+    app.post_login_pipeline.shutdown()
@@ -0,0 +1,37 @@
+-- Upsert atomique d'un token TikTok en un seul aller-retour PostgREST.
+-- Désactive les tokens actifs de l'utilisateur et insère le nouveau token
+-- dans la même transaction : aucun lecteur ne voit zéro token actif.
+--
+-- Appel depuis app.py : supabase.rpc('save_tiktok_token', {'token': {...}})
+
+create or replace function public.save_tiktok_token(token jsonb)
+returns setof public.tiktok_tokens
+language plpgsql
+as $$
+begin
+    -- Sérialiser les logins concurrents d'un même utilisateur
+    perform pg_advisory_xact_lock(hashtext(token->>'open_id'));
+
+    update public.tiktok_tokens
+       set is_active = false
+     where open_id = token->>'open_id'
+       and is_active;
+
+    return query
+    insert into public.tiktok_tokens (
+        access_token, refresh_token, expires_in, open_id, union_id, scope,
+        created_at, updated_at, is_active,
+        creator_avatar_url, creator_username, creator_nickname,
+        privacy_level_options, comment_disabled, duet_disabled,
+        stitch_disabled, max_video_post_duration_sec
+    )
+    select
+        r.access_token, r.refresh_token, r.expires_in, r.open_id, r.union_id, r.scope,
+        coalesce(r.created_at, now()), coalesce(r.updated_at, now()), true,
+        r.creator_avatar_url, r.creator_username, r.creator_nickname,
+        r.privacy_level_options, r.comment_disabled, r.duet_disabled,
+        r.stitch_disabled, r.max_video_post_duration_sec
+    from jsonb_populate_record(null::public.tiktok_tokens, token) as r
+    returning *;
+end;
+$$;
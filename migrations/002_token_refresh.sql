@@ -0,0 +1,54 @@
+-- Rafraîchissement des access tokens (planificateur de app.py).
+-- Ajoute une colonne expires_at indexée pour trouver les tokens actifs
+-- proches de l'expiration sans calcul par ligne, et une fonction de mise
+-- à jour en masse appelée en un seul aller-retour RPC.
+
+alter table public.tiktok_tokens
+    add column if not exists expires_at timestamptz;
+
+-- expires_at est dérivé côté serveur: l'application n'a pas à l'envoyer
+create or replace function public.tiktok_tokens_set_expires_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.expires_at := coalesce(new.updated_at, new.created_at, now())
+        + make_interval(secs => coalesce(new.expires_in, 0));
+    return new;
+end;
+$$;
+
+drop trigger if exists tiktok_tokens_set_expires_at on public.tiktok_tokens;
+create trigger tiktok_tokens_set_expires_at
+    before insert or update of expires_in, created_at, updated_at
+    on public.tiktok_tokens
+    for each row
+    execute function public.tiktok_tokens_set_expires_at();
+
+update public.tiktok_tokens
+   set expires_at = coalesce(updated_at, created_at)
+       + make_interval(secs => coalesce(expires_in, 0))
+ where expires_at is null;
+
+-- Index partiel: seule la petite fraction de tokens actifs est indexée
+create index if not exists tiktok_tokens_active_expires_at_idx
+    on public.tiktok_tokens (expires_at)
+    where is_active;
+
+-- Écriture en masse des tokens rafraîchis
+-- Appel depuis app.py : supabase.rpc('refresh_tiktok_tokens', {'tokens': [...]})
+-- Retourne les id mis à jour (liste de lignes, seul format lu par le client PostgREST)
+create or replace function public.refresh_tiktok_tokens(tokens jsonb)
+returns table (id bigint)
+language sql
+as $$
+    update public.tiktok_tokens as t
+       set access_token = r.access_token,
+           refresh_token = r.refresh_token,
+           expires_in = r.expires_in,
+           updated_at = now()
+      from jsonb_populate_recordset(null::public.tiktok_tokens, tokens) as r
+     where t.id = r.id
+       and t.is_active
+    returning t.id;
+$$;
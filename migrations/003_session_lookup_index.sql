@@ -0,0 +1,9 @@
+-- Lookups par utilisateur (session signée liée à open_id).
+-- /user/profile : where open_id = $1 and is_active order by created_at desc limit 1
+-- /logout et désactivation : update ... where open_id = $1 and is_active
+-- Index partiel sur (open_id, created_at) restreint aux lignes actives :
+-- chaque lecture ou mise à jour ne touche que les lignes de l'utilisateur.
+
+create index if not exists tiktok_tokens_open_id_active_idx
+    on public.tiktok_tokens (open_id, created_at desc)
+    where is_active;
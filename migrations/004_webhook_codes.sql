@@ -0,0 +1,61 @@
+-- Idempotence de /webhook entre plusieurs workers (WEBHOOK_DEDUP_SHARED=true).
+-- Chaque code d'autorisation (empreinte SHA-256) est réservé par le premier
+-- worker qui le reçoit; les doublons lisent le résultat de cet échange au lieu
+-- de rappeler TikTok. Les lignes expirent après WEBHOOK_DEDUP_TTL secondes.
+--
+-- Appel depuis app.py : supabase.rpc('claim_webhook_code', {...}) puis
+-- supabase.rpc('finish_webhook_code', {...}) une fois l'échange terminé.
+
+create table if not exists public.webhook_codes (
+    code_hash text primary key,
+    state_hash text not null,
+    outcome jsonb,
+    created_at timestamptz not null default now(),
+    expires_at timestamptz not null
+);
+
+create index if not exists webhook_codes_expires_at_idx
+    on public.webhook_codes (expires_at);
+
+-- claimed = true : l'appelant doit faire l'échange puis appeler finish_webhook_code.
+-- claimed = false : outcome est le résultat du premier échange (null s'il est encore en cours).
+create or replace function public.claim_webhook_code(p_code_hash text, p_state_hash text, p_ttl integer)
+returns table (claimed boolean, state_hash text, outcome jsonb)
+language plpgsql
+as $$
+#variable_conflict use_column
+begin
+    -- Une réservation expirée ne bloque plus le code
+    delete from public.webhook_codes w
+     where w.code_hash = p_code_hash
+       and w.expires_at < now();
+
+    insert into public.webhook_codes (code_hash, state_hash, expires_at)
+    values (p_code_hash, p_state_hash, now() + make_interval(secs => p_ttl))
+    on conflict (code_hash) do nothing;
+
+    if found then
+        return query select true, p_state_hash, null::jsonb;
+    else
+        return query
+        select false, w.state_hash, w.outcome
+          from public.webhook_codes w
+         where w.code_hash = p_code_hash;
+    end if;
+end;
+$$;
+
+create or replace function public.finish_webhook_code(p_code_hash text, p_outcome jsonb)
+returns void
+language plpgsql
+as $$
+begin
+    update public.webhook_codes
+       set outcome = p_outcome
+     where code_hash = p_code_hash;
+
+    -- Purge des réservations expirées (index sur expires_at)
+    delete from public.webhook_codes
+     where expires_at < now();
+end;
+$$;
@@ -0,0 +1,38 @@
+-- Re-synchronisation des champs créateur (CreatorSyncJob de app.py).
+-- Les tokens actifs sont parcourus par pages en keyset sur id :
+-- where is_active and id > $1 order by id limit N
+-- L'index partiel ne contient que les lignes actives.
+--
+-- updated_at n'est pas modifié: le trigger de 002 en dérive expires_at, et le
+-- repousser retarderait le rafraîchissement de tokens réellement proches de
+-- l'expiration. La date de synchronisation a sa propre colonne.
+
+alter table public.tiktok_tokens
+    add column if not exists creator_synced_at timestamptz;
+
+create index if not exists tiktok_tokens_active_id_idx
+    on public.tiktok_tokens (id)
+    where is_active;
+
+-- Écriture groupée des seules lignes dont les champs créateur ont changé
+-- Retourne les id mis à jour: le client PostgREST attend une liste de lignes
+-- Appel depuis app.py : supabase.rpc('sync_creator_info', {'creators': [...]})
+create or replace function public.sync_creator_info(creators jsonb)
+returns table (id bigint)
+language sql
+as $$
+    update public.tiktok_tokens as t
+       set creator_avatar_url = r.creator_avatar_url,
+           creator_username = r.creator_username,
+           creator_nickname = r.creator_nickname,
+           privacy_level_options = r.privacy_level_options,
+           comment_disabled = r.comment_disabled,
+           duet_disabled = r.duet_disabled,
+           stitch_disabled = r.stitch_disabled,
+           max_video_post_duration_sec = r.max_video_post_duration_sec,
+           creator_synced_at = now()
+      from jsonb_populate_recordset(null::public.tiktok_tokens, creators) as r
+     where t.id = r.id
+       and t.is_active
+    returning t.id;
+$$;
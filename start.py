@@ -7,6 +7,8 @@ import platform
 from pathlib import Path
 import time
 import json
+import argparse
+import hashlib
 
 def is_running_in_virtualenv():
     """Vérifie si nous sommes dans un environnement virtuel"""
@@ -30,7 +32,7 @@ def run_command(command, shell=False):
     """Exécute une commande et retourne son statut"""
     try:
         subprocess.run(
-            command if shell else command.split(),
+            command if shell or isinstance(command, list) else command.split(),
             check=True,
             shell=shell,
             stdout=subprocess.PIPE,
@@ -52,59 +54,80 @@ def check_python_version():
         sys.exit(1)
     print_success(f"Python {version.major}.{version.minor}.{version.micro} détecté")
 
-def setup_virtual_env():
-    """Configure l'environnement virtuel"""
-    print_step("Configuration de l'environnement virtuel")
-    
-    # Supprimer l'ancien venv s'il existe
-    if os.path.exists("venv"):
-        print("Suppression de l'ancien environnement virtuel...")
-        try:
-            # Désactiver l'environnement virtuel s'il est actif
-            if platform.system() == "Windows":
-                # Forcer la fermeture de tous les processus Python dans le venv
-                try:
-                    subprocess.run("taskkill /F /IM python.exe", shell=True, stderr=subprocess.DEVNULL)
-                except:
-                    pass
-                # Utiliser rd au lieu de rmdir pour une suppression forcée
-                run_command("rd /s /q venv", shell=True)
-            else:
-                shutil.rmtree("venv")
-            
-            # Attendre un peu pour s'assurer que la suppression est terminée
-            time.sleep(1)
-            
-        except Exception as e:
-            print_error(f"Erreur lors de la suppression du venv: {e}")
-            return False
+VENV_DIR = "venv"
+VENV_STAMP = os.path.join(VENV_DIR, ".setup_stamp.json")
+
+def venv_paths():
+    """Chemins python/pip/activate du venv selon la plateforme"""
+    if platform.system() == "Windows":
+        return "venv\\Scripts\\python.exe", "venv\\Scripts\\pip", "venv\\Scripts\\activate"
+    return "venv/bin/python", "venv/bin/pip", "venv/bin/activate"
 
+def environment_fingerprint():
+    """Empreinte du venv attendu: hash de requirements.txt et version de Python"""
+    with open("requirements.txt", "rb") as f:
+        requirements_hash = hashlib.sha256(f.read()).hexdigest()
+    return {
+        "requirements": requirements_hash,
+        "python": f"{platform.python_implementation()}-{platform.python_version()}"
+    }
+
+def read_stamp():
+    """Empreinte enregistrée lors de la dernière installation réussie"""
+    try:
+        with open(VENV_STAMP, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_stamp(fingerprint):
+    with open(VENV_STAMP, "w", encoding="utf-8") as f:
+        json.dump(fingerprint, f)
+
+def remove_virtual_env():
+    """Supprimer le venv existant"""
+    print("Suppression de l'ancien environnement virtuel...")
+    try:
+        if platform.system() == "Windows":
+            # Forcer la fermeture de tous les processus Python dans le venv
+            try:
+                subprocess.run("taskkill /F /IM python.exe", shell=True, stderr=subprocess.DEVNULL)
+            except:
+                pass
+            # Utiliser rd au lieu de rmdir pour une suppression forcée
+            run_command("rd /s /q venv", shell=True)
+        else:
+            shutil.rmtree(VENV_DIR)
+    except Exception as e:
+        print_error(f"Erreur lors de la suppression du venv: {e}")
+        return False
+    
     # S'assurer que le dossier venv n'existe plus
-    if os.path.exists("venv"):
-        try:
-            shutil.rmtree("venv", ignore_errors=True)
-            time.sleep(1)
-        except:
-            pass
+    if os.path.exists(VENV_DIR):
+        shutil.rmtree(VENV_DIR, ignore_errors=True)
+    return not os.path.exists(VENV_DIR)
+
+def setup_virtual_env(clean=False):
+    """Configure l'environnement virtuel (réutilisé tant que la version de Python ne change pas)"""
+    print_step("Configuration de l'environnement virtuel")
+    python_path, pip_path, activate_path = venv_paths()
+    
+    stamp = read_stamp()
+    reusable = os.path.exists(python_path) and stamp is not None \
+        and stamp.get("python") == environment_fingerprint()["python"]
+    
+    if reusable and not clean:
+        print_success("Environnement virtuel existant réutilisé")
+        return True, activate_path
+    
+    if os.path.exists(VENV_DIR) and not remove_virtual_env():
+        return False
 
     # Créer un nouveau venv
     print("Création d'un nouvel environnement virtuel...")
     if not run_command(f"{sys.executable} -m venv venv"):
         return False
 
-    # Déterminer les chemins Python
-    if platform.system() == "Windows":
-        python_path = "venv\\Scripts\\python.exe"
-        pip_path = "venv\\Scripts\\pip"
-        activate_path = "venv\\Scripts\\activate"
-    else:
-        python_path = "venv/bin/python"
-        pip_path = "venv/bin/pip"
-        activate_path = "venv/bin/activate"
-
-    # Attendre que le venv soit prêt
-    time.sleep(2)
-
     # Mettre à jour pip en utilisant la syntaxe recommandée
     print("Mise à jour de pip...")
     if not run_command(f"{python_path} -m pip install --upgrade pip"):
@@ -118,20 +141,29 @@ def setup_virtual_env():
     return True, activate_path
 
 def install_requirements():
-    """Installe les dépendances"""
+    """Installe les dépendances si requirements.txt ou Python ont changé depuis la dernière installation"""
     print_step("Installation des dépendances")
+    python_path, pip_path, _ = venv_paths()
     
-    if platform.system() == "Windows":
-        pip_path = "venv\\Scripts\\pip"
-    else:
-        pip_path = "venv/bin/pip"
+    fingerprint = environment_fingerprint()
+    if read_stamp() == fingerprint:
+        print_success("Dépendances à jour (requirements.txt inchangé)")
+        return True
 
     if not run_command(f"{pip_path} install -r requirements.txt"):
         return False
-        
+    
+    # Empreinte écrite seulement après une installation complète
+    write_stamp(fingerprint)
     print_success("Dépendances installées")
     return True
 
+def compile_sources():
+    """Précompiler le code de l'application (seuls les fichiers modifiés sont recompilés)"""
+    python_path, _, _ = venv_paths()
+    sources = [name for name in ("app.py", "asgi_app.py", "tls.py", "gunicorn.conf.py") if os.path.exists(name)]
+    run_command([python_path, "-m", "compileall", "-q", *sources])
+
 def setup_env_file():
     """Configure le fichier .env"""
     print_step("Configuration du fichier .env")
@@ -175,31 +207,59 @@ def clean_logs():
     if os.path.exists("logs"):
         files = os.listdir("logs")
         for file in files:
-            if file.endswith(".log"):
+            if file.endswith((".log", ".jsonl", ".gz")):
                 path = os.path.join("logs", file)
                 print(f"Suppression de {file}")
                 os.remove(path)
     
     print_success("Logs nettoyés")
 
-def start_app():
-    """Démarre l'application"""
-    print_step("Démarrage de l'application")
+def start_app(mode="dev"):
+    """Démarre l'application (serveur Flask de développement ou Gunicorn en production)"""
+    print_step(f"Démarrage de l'application (mode {mode})")
     
     if platform.system() == "Windows":
         python_path = "venv\\Scripts\\python"
     else:
         python_path = "venv/bin/python"
 
+    if mode == "prod":
+        if platform.system() == "Windows":
+            print_error("Le mode production (Gunicorn) n'est pas disponible sous Windows")
+            return
+        command = ["venv/bin/gunicorn", "-c", "gunicorn.conf.py"]
+    elif mode == "asgi":
+        command = [python_path, "asgi_app.py"]
+    else:
+        command = [python_path, "app.py"]
+
     try:
-        subprocess.run([python_path, "app.py"])
+        subprocess.run(command)
     except KeyboardInterrupt:
         print("\n\n👋 Au revoir!")
     except Exception as e:
         print_error(f"Erreur lors du démarrage: {e}")
 
+def parse_args():
+    """Analyse les arguments de la ligne de commande"""
+    parser = argparse.ArgumentParser(description="Démarrage du projet TikTok API")
+    parser.add_argument(
+        "--mode",
+        choices=["dev", "prod", "asgi"],
+        default=os.getenv("APP_MODE", "dev"),
+        help="dev: serveur Flask de développement, prod: Gunicorn multi-workers, asgi: variante Quart/Hypercorn"
+    )
+    parser.add_argument(
+        "--clean",
+        action="store_true",
+        help="Recréer le venv, réinstaller les dépendances et supprimer les caches Python"
+    )
+    return parser.parse_args()
+
 def main():
     """Fonction principale"""
+    args = parse_args()
+    
     # Vérifier qu'on n'est pas dans un venv
     if is_running_in_virtualenv():
         print_error("Ce script doit être exécuté avec Python système, pas depuis un environnement virtuel!")
@@ -219,18 +279,20 @@ def main():
     # Vérifier Python
     check_python_version()
 
-    # Nettoyer
-    clean_pycache()
+    # Nettoyer (le bytecode n'est supprimé qu'avec --clean)
+    if args.clean:
+        clean_pycache()
     clean_logs()
 
     # Configurer l'environnement
-    venv_result = setup_virtual_env()
+    venv_result = setup_virtual_env(clean=args.clean)
     if not venv_result:
         sys.exit(1)
 
     # Installer les dépendances
     if not install_requirements():
         sys.exit(1)
+    compile_sources()
 
     # Configurer .env
     if not setup_env_file():
@@ -245,7 +307,7 @@ def main():
     print("🚀 LANCEMENT DE L'APPLICATION")
     print("="*50 + "\n")
     
-    start_app()
+    start_app(args.mode)
 
 if __name__ == "__main__":
     try:
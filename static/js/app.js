@@ -0,0 +1,148 @@
+function isMobileDevice() {
+    return (typeof window.orientation !== "undefined") 
+        || (navigator.userAgent.indexOf('IEMobile') !== -1)
+        || /iPhone|iPad|iPod|Android|webOS|BlackBerry|Windows Phone/i.test(navigator.userAgent);
+}
+
+function openTikTokAuth() {
+    // Récupérer d'abord l'URL de redirection
+    fetch('/oauth')
+        .then(response => response.json())
+        .then(data => {
+            if (data.redirect_url) {
+                if (isMobileDevice()) {
+                    // Sur mobile, faire une redirection directe
+                    window.location.href = data.redirect_url;
+                } else {
+                    // Sur desktop, utiliser une popup
+                    const width = 500;
+                    const height = 700;
+                    const left = (window.innerWidth - width) / 2;
+                    const top = (window.innerHeight - height) / 2;
+
+                    // Écouter le résultat avant d'ouvrir la popup pour ne rien manquer
+                    const source = waitForAuth(data.state);
+
+                    const popup = window.open(
+                        data.redirect_url,
+                        'TikTok Auth',
+                        `width=${width},height=${height},left=${left},top=${top},popup=yes`
+                    );
+
+                    if (!source) {
+                        // Navigateur sans EventSource: surveiller la fermeture de la popup
+                        const checkPopup = setInterval(() => {
+                            if (popup.closed) {
+                                clearInterval(checkPopup);
+                                checkAuthStatus();
+                            }
+                        }, 500);
+                    }
+                }
+            } else {
+                console.error('URL de redirection non trouvée');
+            }
+        })
+        .catch(error => {
+            console.error('Erreur:', error);
+        });
+}
+
+function showProfile(data) {
+    // Mettre à jour l'interface avec les informations du profil
+    document.querySelector('.profile-container').classList.add('active');
+    document.querySelector('.profile-avatar').src = data.avatar_url;
+    document.querySelector('.profile-nickname').textContent = data.nickname;
+    document.querySelector('.tiktok-button').style.display = 'none';
+}
+
+function checkAuthStatus() {
+    fetch('/user/profile')
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                showProfile(data);
+            }
+        })
+        .catch(error => console.error('Error:', error));
+}
+
+function pollAuthStatus(delay, deadline) {
+    // Repli sans SSE (503, serveur saturé): relire le profil, à intervalles doublés jusqu'à 30 s
+    fetch('/user/profile')
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                showProfile(data);
+            } else if (Date.now() + delay < deadline) {
+                setTimeout(() => pollAuthStatus(Math.min(delay * 2, 30000), deadline), delay);
+            }
+        })
+        .catch(error => console.error('Error:', error));
+}
+
+function waitForAuth(state) {
+    // Le serveur pousse le profil dès que le token est sauvegardé (Server-Sent Events)
+    if (!state || !window.EventSource) {
+        return null;
+    }
+    const source = new EventSource(`/auth/events/${encodeURIComponent(state)}`);
+    source.addEventListener('auth', event => {
+        source.close();
+        const data = JSON.parse(event.data);
+        if (data.success) {
+            showProfile(data);
+        } else {
+            console.error('Erreur:', data.error);
+        }
+    });
+    source.addEventListener('timeout', () => source.close());
+    source.onerror = () => {
+        // Fin d'une fenêtre long-poll: EventSource se reconnecte seul (CONNECTING).
+        // Connexion refusée (503): se rabattre sur quelques lectures du profil pendant 2 minutes
+        if (source.readyState === EventSource.CLOSED) {
+            pollAuthStatus(2000, Date.now() + 120000);
+        }
+    };
+    return source;
+}
+
+// Vérifier le statut d'authentification au chargement et après redirection mobile
+document.addEventListener('DOMContentLoaded', () => {
+    const urlParams = new URLSearchParams(window.location.search);
+
+    // Retour de redirection mobile: attendre le résultat de ce login plutôt que relire le profil
+    if (!waitForAuth(urlParams.get('state'))) {
+        checkAuthStatus();
+    }
+
+    // Si on revient d'une redirection mobile (présence du paramètre code)
+    if (urlParams.has('code')) {
+        // Nettoyer l'URL
+        window.history.replaceState({}, document.title, '/');
+    }
+});
+
+// Remplacer l'ancien onclick par la nouvelle fonction
+document.querySelector('.tiktok-button').onclick = openTikTokAuth;
+
+async function logout() {
+    try {
+        const response = await fetch('https://141.253.120.227:3000/logout', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            }
+        });
+
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        // Recharger la page après la déconnexion
+        window.location.reload();
+    } catch (error) {
+        console.error('Erreur:', error);
+        alert('Erreur lors de la déconnexion');
+    }
+}
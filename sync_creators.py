@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Re-synchronisation des champs créateur de tous les tokens actifs
+
+Appelle creator_info/query pour chaque token actif et réécrit, par lots, les
+lignes dont l'avatar, le pseudo ou les limites de publication ont changé.
+Un passage interrompu (Ctrl+C, erreur, disjoncteur TikTok ouvert) reprend à la
+page suivante au prochain lancement.
+
+Exemples:
+    python sync_creators.py
+    python sync_creators.py --rate 10 --concurrency 8
+    python sync_creators.py --dry-run --limit 1000
+    python sync_creators.py --restart --output sync_report.json
+"""
+import argparse
+import fcntl
+import json
+import os
+import sys
+
+import app
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-synchroniser les informations créateur des tokens actifs")
+    parser.add_argument('--batch-size', type=int, default=app.CREATOR_SYNC_BATCH_SIZE, help="Tokens par page")
+    parser.add_argument('--concurrency', type=int, default=app.CREATOR_SYNC_CONCURRENCY,
+                        help="Appels simultanés max vers TikTok")
+    parser.add_argument('--rate', type=float, default=app.CREATOR_SYNC_RATE,
+                        help="Appels par seconde max vers TikTok (0: illimité)")
+    parser.add_argument('--limit', type=int, help="Arrêter après N tokens (le passage reprendra ensuite)")
+    parser.add_argument('--restart', action='store_true', help="Ignorer le point de reprise et repartir du début")
+    parser.add_argument('--dry-run', action='store_true', help="Compter les changements sans rien écrire")
+    parser.add_argument('--output', help="Fichier JSON du rapport (sinon stdout)")
+    args = parser.parse_args()
+
+    app.ensure_logging()
+    missing_vars = app.missing_config()
+    if missing_vars:
+        app.log(f"❌ Erreur: Variables d'environnement manquantes: {', '.join(missing_vars)}", "error", "💥")
+        sys.exit(1)
+
+    # Même verrou que le passage planifié d'un worker Gunicorn (CREATOR_SYNC_ENABLED)
+    os.makedirs('logs', exist_ok=True)
+    lock = open('logs/creator_sync.lock', 'w')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        app.log("❌ Une synchronisation créateurs est déjà en cours", "error", "💥")
+        sys.exit(1)
+
+    job = app.CreatorSyncJob(args.batch_size, args.concurrency, args.rate, dry_run=args.dry_run)
+    try:
+        report = job.run_once(resume=not args.restart, limit=args.limit)
+    except KeyboardInterrupt:
+        # Le point de reprise de la dernière page terminée est déjà enregistré
+        job.stop()
+        app.log("\n⏹️ Synchronisation interrompue, elle reprendra au prochain lancement")
+        sys.exit(130)
+    finally:
+        lock.close()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        app.log(f"✅ Rapport écrit dans {args.output}")
+    else:
+        print(output)
+    sys.exit(0 if report['status'] in ('completed', 'partial') else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Environnement de test: faux TikTok et faux PostgREST (benchmarks/stubs.py) sur des ports locaux
+
+Les constantes d'app.py sont lues à l'import: les serveurs simulés démarrent et les
+variables d'environnement sont posées avant le premier `import app`.
+"""
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'benchmarks')]
+
+from stubs import StubConfig, start_postgrest_stub, start_tiktok_stub
+
+tiktok_stub = start_tiktok_stub(0, StubConfig())
+postgrest_stub = start_postgrest_stub(0, StubConfig())
+
+os.environ.update({
+    'TIKTOK_CLIENT_KEY': 'test-client-key',
+    'TIKTOK_CLIENT_SECRET': 'test-client-secret',
+    'TIKTOK_REDIRECT_URI': 'https://localhost/webhook',
+    'TIKTOK_API_BASE_URL': f'http://127.0.0.1:{tiktok_stub.server_port}',
+    'SUPABASE_URL': f'http://127.0.0.1:{postgrest_stub.server_port}',
+    'SUPABASE_KEY': 'test.test.test',
+    'FLASK_SECRET_KEY': 'test-secret-key',
+    'RATE_LIMIT_ENABLED': 'False',
+    'DEBUG': 'False'
+})
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """503 au premier appel de chaque chemin, 200 ensuite"""
+
+    protocol_version = 'HTTP/1.1'
+    calls = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        count = self.calls[self.path] = self.calls.get(self.path, 0) + 1
+        status = 503 if count == 1 else 200
+        body = json.dumps({'attempt': count}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = respond
+
+@pytest.fixture
+def flaky_url():
+    FlakyHandler.calls = {}
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""Variante ASGI: mêmes métriques, disjoncteurs et retries que app.py"""
+import asyncio
+import time
+
+import app
+import asgi_app
+from conftest import FlakyHandler
+
+def run_served(scenario):
+    """Exécuter scenario(client) avec les clients ouverts (before_serving)"""
+    async def main():
+        async with asgi_app.asgi_app.test_app() as test_app:
+            return await scenario(test_app.test_client())
+    return asyncio.run(main())
+
+def test_metrics_route_is_exposed():
+    async def scenario(client):
+        await client.get('/health/live')
+        return await client.get('/metrics')
+    response = run_served(scenario)
+    assert response.status_code == 200
+    assert b'tiktok_api_http_requests_total{method="GET",route="/health/live",status="200"}' in (
+        asyncio.run(response.get_data()))
+
+def test_idempotent_post_retries_503_within_budget(monkeypatch, flaky_url):
+    url = f'{flaky_url}/creator_info/'
+    monkeypatch.setattr(asgi_app, 'IDEMPOTENT_POST_URLS', (url,))
+
+    async def scenario(client):
+        token = app.request_deadline.set(time.monotonic() + 5)
+        try:
+            return await asgi_app.tiktok_request('creator_info', 'POST', url)
+        finally:
+            app.request_deadline.reset(token)
+    assert run_served(scenario).status_code == 200
+    assert FlakyHandler.calls['/creator_info/'] == 2
+
+def test_token_post_is_not_replayed(flaky_url):
+    async def scenario(client):
+        return await asgi_app.tiktok_request('oauth_token', 'POST', f'{flaky_url}/oauth/token/')
+    assert run_served(scenario).status_code == 503
+    assert FlakyHandler.calls['/oauth/token/'] == 1
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Disjoncteur et budget de requête autour des appels amont"""
+import time
+
+import pytest
+
+from app import CircuitBreaker, CircuitOpenError, DeadlineExceeded, circuit_breakers, guarded_call
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.05)
+    monkeypatch.setitem(circuit_breakers, 'test', breaker)
+    return breaker
+
+def fail():
+    raise ConnectionError("amont indisponible")
+
+def expire():
+    raise DeadlineExceeded("Budget de la requête épuisé")
+
+def test_probe_interrupted_by_deadline_lets_next_call_probe(breaker):
+    with pytest.raises(ConnectionError):
+        guarded_call('test', 'op', fail)
+    assert breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.06)
+
+    with pytest.raises(DeadlineExceeded):
+        guarded_call('test', 'op', expire)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    assert guarded_call('test', 'op', lambda: 'ok') == 'ok'
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_half_open_allows_a_single_probe(breaker):
+    with pytest.raises(ConnectionError):
+        guarded_call('test', 'op', fail)
+    time.sleep(0.06)
+    assert breaker.before_call() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Retries bornés des appels TikTok pendant une requête"""
+import time
+
+import pytest
+
+import app
+from conftest import FlakyHandler
+
+@pytest.fixture
+def session(monkeypatch, flaky_url):
+    monkeypatch.setattr(app, 'IDEMPOTENT_POST_URLS', (f'{flaky_url}/creator_info/',))
+    return app.create_http_session()
+
+def within_budget(seconds):
+    return app.request_deadline.set(time.monotonic() + seconds)
+
+def test_get_retries_503_within_request_budget(session, flaky_url):
+    token = within_budget(5)
+    try:
+        response = session.get(f'{flaky_url}/user_info/', timeout=app.budget_timeout())
+    finally:
+        app.request_deadline.reset(token)
+    assert response.status_code == 200
+    assert response.json() == {'attempt': 2}
+
+def test_idempotent_post_retries_503(session, flaky_url):
+    token = within_budget(5)
+    try:
+        response = session.post(f'{flaky_url}/creator_info/', timeout=app.budget_timeout())
+    finally:
+        app.request_deadline.reset(token)
+    assert response.status_code == 200
+
+def test_token_post_is_not_replayed(session, flaky_url):
+    response = session.post(f'{flaky_url}/oauth/token/', timeout=app.HTTP_TIMEOUT)
+    assert response.status_code == 503
+    assert FlakyHandler.calls['/oauth/token/'] == 1
+
+def test_no_retry_when_budget_is_below_backoff(session, flaky_url):
+    token = within_budget(0.001)
+    try:
+        time.sleep(0.002)
+        response = session.get(f'{flaky_url}/user_info/', timeout=app.HTTP_TIMEOUT)
+    finally:
+        app.request_deadline.reset(token)
+    assert response.status_code == 503
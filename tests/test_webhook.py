@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""Pages de fin d'authentification de /webhook"""
+from markupsafe import escape
+
+from app import app, frontend, WebhookDeduplicator
+
+def start_login(client):
+    return client.get('/oauth').get_json()['state']
+
+def test_first_exchange_renders_success_page():
+    client = app.test_client()
+    state = start_login(client)
+    response = client.get(f'/webhook?code=code-success&state={state}')
+    assert response.status_code == 200
+    assert 'no-store' in response.headers['Cache-Control']
+
+def test_replayed_code_with_other_state_renders_rejection_page():
+    first, second = app.test_client(), app.test_client()
+    first.get(f'/webhook?code=code-replay&state={start_login(first)}')
+
+    response = second.get(f'/webhook?code=code-replay&state={start_login(second)}')
+    body = response.get_data(as_text=True)
+    assert response.status_code != 500
+    assert escape(WebhookDeduplicator.REJECTED['error']) in body
+    assert "Une erreur est survenue" not in body
+
+def test_unknown_failure_message_falls_back_to_generic_page():
+    with app.app_context():
+        page = frontend.close_page(False, "Message sans page pré-rendue")
+        assert page is frontend.close_page(False, "Une erreur est survenue")
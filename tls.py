@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""Contexte TLS serveur: reprise de session et rechargement à chaud du certificat
+
+Un seul SSLContext (`listener`) sert toutes les connexions du processus. Ses clés
+de tickets de session sont tirées à sa création: créé avant le fork (maître
+Gunicorn), il est partagé par tous les workers et un client reprend sa session
+quel que soit le worker qui l'accepte.
+
+Pendant chaque handshake, le rappel SNI vérifie au plus toutes les
+TLS_RELOAD_INTERVAL secondes si cert.pem / key.pem ont changé, puis bascule les
+nouvelles connexions sur un contexte chargé avec les nouveaux fichiers. Les
+connexions déjà ouvertes gardent l'ancien certificat jusqu'à leur fermeture:
+aucune requête en cours n'est coupée et aucun redémarrage n'est nécessaire.
+"""
+import logging
+import os
+import ssl
+import threading
+import time
+from datetime import datetime
+
+TLS_CERTFILE = os.getenv('TLS_CERTFILE', 'certs/cert.pem')
+TLS_KEYFILE = os.getenv('TLS_KEYFILE', 'certs/key.pem')
+TLS_RELOAD_INTERVAL = float(os.getenv('TLS_RELOAD_INTERVAL', 30))
+TLS_SESSION_TICKETS = int(os.getenv('TLS_SESSION_TICKETS', 2))
+
+logger = logging.getLogger(__name__)
+
+_active = None
+
+class ReloadingTLSContext:
+    """SSLContext serveur dont le certificat est relu à chaud depuis le disque"""
+
+    def __init__(self, certfile=TLS_CERTFILE, keyfile=TLS_KEYFILE,
+                 reload_interval=TLS_RELOAD_INTERVAL, alpn_protocols=None):
+        global _active
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.reload_interval = reload_interval
+        self.alpn_protocols = alpn_protocols
+        self._lock = threading.Lock()
+        self._stats = {'reloads': 0, 'reload_errors': 0, 'last_error': None,
+                       'loaded_at': datetime.now().isoformat()}
+        self._signature = self._file_signature()
+        self.listener = self._build()
+        # Les clés de tickets restent celles du listener, même après bascule de contexte
+        self.listener.sni_callback = self._select_context
+        self.current = self.listener
+        self._checked_at = time.monotonic()
+        _active = self
+
+    def _file_signature(self):
+        signature = []
+        for path in (self.certfile, self.keyfile):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _build(self):
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.minimum_version = ssl.TLSVersion.TLSv1_2
+        context.options |= ssl.OP_NO_COMPRESSION
+        if TLS_SESSION_TICKETS > 0:
+            # TLS 1.3: tickets envoyés après chaque handshake complet (reprise sans état serveur)
+            context.num_tickets = TLS_SESSION_TICKETS
+        else:
+            context.options |= ssl.OP_NO_TICKET
+            context.num_tickets = 0
+        if self.alpn_protocols:
+            context.set_alpn_protocols(self.alpn_protocols)
+        context.load_cert_chain(self.certfile, self.keyfile)
+        return context
+
+    def _select_context(self, ssl_object, server_name, listener):
+        if time.monotonic() - self._checked_at >= self.reload_interval:
+            self.reload_if_changed()
+        current = self.current
+        if current is not listener:
+            ssl_object.context = current
+        return None
+
+    def reload_if_changed(self):
+        """Recharger le certificat si les fichiers ont changé; retourne True si rechargé"""
+        # Un seul handshake vérifie les fichiers, les autres continuent avec le contexte courant
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            self._checked_at = time.monotonic()
+            signature = self._file_signature()
+            if signature == self._signature:
+                return False
+            try:
+                context = self._build()
+            except (OSError, ssl.SSLError) as e:
+                # Fichiers en cours d'écriture ou clé et certificat incohérents: nouvel essai plus tard
+                self._stats['reload_errors'] += 1
+                self._stats['last_error'] = f"{type(e).__name__}: {str(e)}"
+                logger.warning(f"⚠️ Rechargement du certificat TLS impossible: {str(e)}", extra={'emoji': '⚠️'})
+                return False
+            self._signature = signature
+            self.current = context
+            self._stats['reloads'] += 1
+            self._stats['last_error'] = None
+            self._stats['loaded_at'] = datetime.now().isoformat()
+            logger.info(f"🔐 Certificat TLS rechargé depuis {self.certfile}", extra={'emoji': '🔐'})
+            return True
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        return {
+            'certfile': os.path.basename(self.certfile),
+            'reload_interval': self.reload_interval,
+            **self._stats,
+            # hits: handshakes abrégés (reprise de session); misses: ticket ou session inconnus
+            'sessions': self.listener.session_stats()
+        }
+
+def tls_stats():
+    """Statistiques du contexte TLS de ce processus, ou None si TLS est terminé ailleurs"""
+    return _active.stats() if _active is not None else None